@@ -0,0 +1,85 @@
+"""
+Compare the snapshot strategies: snapshots at transcript cues (single-pass
+engine, dropping similar ones) vs snapshots at scene changes. Reports wall
+time and snapshots kept; for a synthetic slide talk also how many of the
+slides got a snapshot, and how long after a slide appeared it was taken.
+
+    python -m benchmarks.bench_scene --duration 600
+    python -m benchmarks.bench_scene --duration 600 --content speaker
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+import click
+
+from summarizer.snapshots import (
+    SIMILARITY_BACKENDS,
+    SINGLE_PASS_ENGINE,
+    SSIM_SIMILARITY,
+    SCENE_THRESHOLD,
+    create_scene_snapshots,
+    create_snapshots_at_time_increments,
+)
+from summarizer.vtt import time_string_to_seconds
+
+from .media import make_slides_video, make_transcript, make_video
+
+
+def slide_coverage(snapshot_files, duration: int, slide_secs: int):
+    """How many slides have a snapshot, and the mean delay from a slide appearing to its first snapshot."""
+    times = sorted(time_string_to_seconds(os.path.splitext(f)[0].replace("_", ":")) for f in snapshot_files)
+    delays = []
+    for start in range(0, duration, slide_secs):
+        shown = [t for t in times if start <= t < start + slide_secs]
+        if shown:
+            delays.append(shown[0] - start)
+    return len(delays), sum(delays) / len(delays) if delays else 0.0
+
+
+@click.command()
+@click.option("--duration", default=600, help="Length of the synthetic video in seconds")
+@click.option(
+    "--content",
+    default="slides",
+    type=click.Choice(["slides", "speaker"]),
+    help="A slide talk, or a video that keeps moving without ever cutting",
+)
+@click.option("--slide-secs", default=17, help="Seconds each slide is shown")
+@click.option("--cue-secs", default=3.0, help="Seconds between transcript cues")
+@click.option("--min-secs", default=5, help="Minimum interval between snapshots")
+@click.option("--similarity", default=SSIM_SIMILARITY, type=click.Choice(SIMILARITY_BACKENDS))
+@click.option("--threshold", default=SCENE_THRESHOLD, help="Scene change threshold")
+def main(content, duration, slide_secs, cue_secs, min_secs, similarity, threshold):
+    with tempfile.TemporaryDirectory() as tmp:
+        if content == "slides":
+            video = make_slides_video(os.path.join(tmp, "video.mp4"), duration, slide_secs)
+        else:
+            video = make_video(os.path.join(tmp, "video.mp4"), duration)
+        transcript = make_transcript(duration, cue_secs)
+        slides = len(range(0, duration, slide_secs))
+        click.echo(f"{len(transcript)} cues in a {duration}s video of {content}")
+
+        def run(name, create):
+            out = os.path.join(tmp, name)
+            start = time.perf_counter()
+            create(out)
+            elapsed = time.perf_counter() - start
+            kept = os.listdir(os.path.join(out, "snapshots"))
+            shutil.rmtree(out)
+            line = f"{name:>10}: {elapsed:8.2f}s {len(kept):5} snapshots"
+            if content == "slides":
+                covered, delay = slide_coverage(kept, duration, slide_secs)
+                line += f", {covered}/{slides} slides, {delay:5.2f}s mean delay"
+            click.echo(line)
+
+        run("transcript", lambda out: asyncio.run(create_snapshots_at_time_increments(
+            video, out, min_secs, transcript, SINGLE_PASS_ENGINE, similarity
+        )))
+        run("scene", lambda out: create_scene_snapshots(video, out, min_secs, threshold))
+
+
+if __name__ == "__main__":
+    main()
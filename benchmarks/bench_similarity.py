@@ -0,0 +1,59 @@
+"""
+Compare the ImageMagick `compare` similarity check with the in-process SSIM
+check: time per comparison, and how often they agree at the 90% threshold.
+
+    python -m benchmarks.bench_similarity --duration 300
+"""
+import os
+import shutil
+import tempfile
+import time
+
+import click
+
+from summarizer.ffmpeg import take_snapshots
+from summarizer.snapshots import candidate_start_times, similar_snapshots, snapshot_path_for, snapshot_start_times
+from summarizer.similarity import SnapshotComparer
+
+from .media import make_transcript, make_video
+
+THRESHOLD = 90
+
+
+def run_checks(check, pairs):
+    start = time.perf_counter()
+    results = [check(a, b, THRESHOLD) for a, b in pairs]
+    return results, time.perf_counter() - start
+
+
+@click.command()
+@click.option("--duration", default=300, help="Length of the synthetic video in seconds")
+@click.option("--min-secs", default=5, help="Seconds between snapshots")
+def main(duration, min_secs):
+    with tempfile.TemporaryDirectory() as tmp:
+        video = make_video(os.path.join(tmp, "video.mp4"), duration)
+        os.makedirs(os.path.join(tmp, "snapshots"))
+        start_times = candidate_start_times(snapshot_start_times(make_transcript(duration, min_secs)), min_secs)
+        paths = [snapshot_path_for(tmp, t) for t in start_times]
+        take_snapshots(video, start_times, paths)
+
+        # Compare every snapshot against the one before it, like the snapshot loop does.
+        pairs = list(zip(paths, paths[1:]))
+        click.echo(f"{len(pairs)} comparisons")
+
+        ssim_results, ssim_elapsed = run_checks(SnapshotComparer(), pairs)
+        click.echo(f"   ssim: {ssim_elapsed / len(pairs) * 1000:8.2f}ms per comparison, {sum(ssim_results)} similar")
+
+        if not shutil.which("compare"):
+            click.echo("compare: ImageMagick not installed, skipping")
+            return
+
+        compare_results, compare_elapsed = run_checks(similar_snapshots, pairs)
+        click.echo(f"compare: {compare_elapsed / len(pairs) * 1000:8.2f}ms per comparison, {sum(compare_results)} similar")
+
+        agreement = sum(a == b for a, b in zip(ssim_results, compare_results)) / len(pairs)
+        click.echo(f"agreement at {THRESHOLD}%: {agreement * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Compare wall time of the snapshot engines (per-timestamp, single-pass, parallel).
+
+    python -m benchmarks.bench_snapshots --duration 600
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+import click
+
+from summarizer.snapshots import (
+    SIMILARITY_BACKENDS,
+    SNAPSHOT_ENGINES,
+    SSIM_SIMILARITY,
+    create_snapshots_at_time_increments,
+)
+
+from .media import make_transcript, make_video
+
+
+@click.command()
+@click.option("--duration", default=600, help="Length of the synthetic video in seconds")
+@click.option("--cue-secs", default=3.0, help="Seconds between transcript cues")
+@click.option("--min-secs", default=5, help="Minimum interval between snapshots")
+@click.option("--similarity", default=SSIM_SIMILARITY, type=click.Choice(SIMILARITY_BACKENDS))
+@click.option("--workers", default=None, type=int, help="Workers for the parallel engine")
+def main(duration, cue_secs, min_secs, similarity, workers):
+    with tempfile.TemporaryDirectory() as tmp:
+        video = make_video(os.path.join(tmp, "video.mp4"), duration)
+        transcript = make_transcript(duration, cue_secs)
+        click.echo(f"{len(transcript)} cues in a {duration}s video")
+
+        results = {}
+        for engine in SNAPSHOT_ENGINES:
+            out = os.path.join(tmp, engine)
+            start = time.perf_counter()
+            asyncio.run(create_snapshots_at_time_increments(
+                video, out, min_secs, transcript, engine, similarity, workers
+            ))
+            elapsed = time.perf_counter() - start
+            results[engine] = sorted(os.listdir(os.path.join(out, "snapshots")))
+            shutil.rmtree(out)
+            click.echo(f"{engine:>14}: {elapsed:8.2f}s ({len(results[engine])} snapshots)")
+
+        if len({tuple(r) for r in results.values()}) > 1:
+            click.echo("warning: engines kept different snapshots")
+
+
+if __name__ == "__main__":
+    main()
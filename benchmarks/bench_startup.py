@@ -0,0 +1,78 @@
+"""
+Startup time of `tldl --help` and of a run where every artifact is already
+made, from `python -X importtime`: the total import time, the wall time and
+the slowest imports of each.
+
+    python -m benchmarks.bench_startup --top 5
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+CACHED_RUN = """
+import asyncio, sys
+from summarizer import summarizer
+
+dirname, cache_path = sys.argv[1:]
+cache = summarizer.setup_llm_cache(True, cache_path, 1)
+engine = summarizer.setup_llm_engine(0, 0)
+asyncio.run(summarizer.update_all("talk.mp3", dirname, "time", None, None, 5, False, True))
+summarizer.print_llm_stats(cache, engine, True)
+"""
+
+
+def make_cached_output(dir: str, cues: int = 1000) -> str:
+    """An output directory with every artifact of an audio only summary."""
+    dirname = os.path.join(dir, "talk")
+    os.makedirs(dirname)
+    open(os.path.join(dirname, "audio.mp3"), "wb").close()
+    with open(os.path.join(dirname, "transcript.json"), "w") as f:
+        f.write(json.dumps([
+            {"id": i, "start": time.strftime("%H:%M:%S", time.gmtime(i * 3)), "end": time.strftime("%H:%M:%S", time.gmtime(i * 3 + 3)), "text": f"Cue {i}."}
+            for i in range(cues)
+        ], indent=2))
+    with open(os.path.join(dirname, "chapters-time.json"), "w") as f:
+        f.write(json.dumps([{"title": "Talk", "summary": "A talk.", "insights": []}]))
+    with open(os.path.join(dirname, "title.json"), "w") as f:
+        f.write(json.dumps({"title": "Talk", "description": "A talk."}))
+    return dirname
+
+
+def profile(*args):
+    """Wall time of a python run, and the cumulative import time of its top level imports."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args], capture_output=True, text=True, check=True
+    )
+    wall = time.perf_counter() - start
+    imports = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S+)", line)
+        if match:
+            imports.append((int(match.group(1)) / 1e6, match.group(2)))
+    return wall, sorted(imports, reverse=True)
+
+
+@click.command()
+@click.option("--top", default=5, help="Number of slowest imports to show")
+def main(top):
+    with tempfile.TemporaryDirectory() as dir:
+        runs = {
+            "--help": ("-m", "summarizer.summarizer", "--help"),
+            "cached": ("-c", CACHED_RUN, make_cached_output(dir), os.path.join(dir, "llm.sqlite")),
+        }
+        for name, args in runs.items():
+            wall, imports = profile(*args)
+            click.echo(f"{name}: {wall:.2f}s wall, {sum(s for s, _ in imports):.2f}s importing")
+            for secs, module in imports[:top]:
+                click.echo(f"  {secs:>6.3f}s {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Train the topic model on synthetic transcripts of increasing size: a fixed
+1000 iterations vs stopping once the log likelihood converges, and a rerun
+that reuses the cached topics.
+
+    python -m benchmarks.bench_topics --sizes 500,2000,10000
+"""
+import random
+import tempfile
+import time
+
+import click
+
+from summarizer import topics
+from summarizer.vtt import seconds_to_hms
+
+# Words of a few distinct subjects, a transcript drifts from one to the next.
+VOCABULARIES = [
+    "matrix vector eigenvalue determinant linear basis span kernel rank transpose",
+    "protein enzyme cell membrane receptor molecule gene mutation cytoplasm nucleus",
+    "market price demand supply inflation interest currency trade deficit budget",
+    "orbit planet gravity telescope galaxy comet nebula asteroid satellite eclipse",
+    "guitar melody chord rhythm tempo harmony lyric chorus drummer album",
+]
+
+
+def make_topic_transcript(cues: int, cue_secs: float = 3, seed: int = 1):
+    """A synthetic transcript that moves through the vocabularies in order."""
+    rng = random.Random(seed)
+    vocabularies = [v.split() for v in VOCABULARIES]
+    transcript = []
+    for i in range(cues):
+        words = vocabularies[i * len(vocabularies) // cues]
+        transcript.append({
+            "id": i,
+            "start": seconds_to_hms(i * cue_secs),
+            "end": seconds_to_hms((i + 1) * cue_secs),
+            "text": " ".join(rng.choice(words) for _ in range(12)),
+        })
+    return transcript
+
+
+def timed_identify_topics(transcript, **kwargs):
+    """Run identify_topics, returning how many iterations it trained and how long it took."""
+    iterations = []
+    train = topics.train_until_converged
+
+    def counting_train(*args, **train_kwargs):
+        iterations.append(train(*args, **train_kwargs))
+        return iterations[-1]
+
+    topics.train_until_converged = counting_train
+    try:
+        start = time.perf_counter()
+        topics.identify_topics(transcript, **kwargs)
+        return sum(iterations), time.perf_counter() - start
+    finally:
+        topics.train_until_converged = train
+
+
+@click.command()
+@click.option("--sizes", default="500,2000,10000", help="Comma separated numbers of cues")
+@click.option("--workers", default=0, help="Threads to train with (0: one per CPU)")
+def main(sizes, workers):
+    click.echo(f"{'cues':>7} {'fixed':>16} {'converged':>16} {'cached':>9}")
+    for size in [int(s) for s in sizes.split(",")]:
+        transcript = make_topic_transcript(size)
+
+        fixed_iterations, fixed = timed_identify_topics(
+            transcript, workers=workers, tolerance=0, cache_dir=None
+        )
+        with tempfile.TemporaryDirectory() as cache_dir:
+            converged_iterations, converged = timed_identify_topics(
+                transcript, workers=workers, cache_dir=cache_dir
+            )
+            _, cached = timed_identify_topics(transcript, workers=workers, cache_dir=cache_dir)
+
+        click.echo(
+            f"{size:>7} {fixed_iterations:>5} it {fixed:>7.2f}s {converged_iterations:>5} it {converged:>7.2f}s {cached:>8.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Memory and CPU of a transcript as a list of dicts vs a columnar Transcript:
+the memory each holds, splitting it into time slices (for the topic model),
+and rendering the source text of every cue (for the summary prompts).
+
+    python -m benchmarks.bench_transcript --sizes 100000,500000
+"""
+import time
+import tracemalloc
+
+import click
+
+from summarizer.templates import source_lines
+from summarizer.topics import assign_time_slices, assign_time_slices_array
+from summarizer.transcript import Transcript
+
+from .media import make_transcript
+
+
+def measure(build):
+    """Build something, returning it, the memory it holds and how long it took."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, held, elapsed
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option("--sizes", default="100000,500000", help="Comma separated numbers of cues")
+def main(sizes):
+    click.echo(f"{'cues':>7} {'':>10} {'memory':>10} {'slices':>9} {'source':>9}")
+    for size in [int(s) for s in sizes.split(",")]:
+        entries, entries_bytes, _ = measure(lambda: make_transcript(size * 3, 3))
+        transcript, transcript_bytes, _ = measure(lambda: Transcript.from_entries(entries))
+
+        entries_slices = timed(lambda: assign_time_slices(entries, 5))
+        transcript_slices = timed(
+            lambda: assign_time_slices_array(transcript.starts, transcript.ends[-1], 5)
+        )
+        entries_source = timed(lambda: source_lines(entries, 0, len(entries)))
+        transcript_source = timed(lambda: source_lines(transcript, 0, len(transcript)))
+
+        click.echo(
+            f"{size:>7} {'dicts':>10} {entries_bytes / 2**20:>8.1f}MB {entries_slices:>8.3f}s {entries_source:>8.3f}s"
+        )
+        click.echo(
+            f"{'':>7} {'Transcript':>10} {transcript_bytes / 2**20:>8.1f}MB {transcript_slices:>8.3f}s {transcript_source:>8.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Convert a large synthetic VTT file to transcript.json: reading it whole with
+webvtt and dumping a list of dicts vs streaming the cues in and the entries
+out. Each runs in a fresh process, so its peak memory can be compared.
+
+    python -m benchmarks.bench_vtt --cues 200000,1000000
+"""
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import click
+
+from summarizer.vtt import seconds_to_hms, seconds_to_vtt_time
+
+
+def make_vtt(path: str, cues: int, cue_secs: float = 3):
+    """A synthetic VTT file with `cues` two line cues."""
+    with open(path, "w") as f:
+        f.write("WEBVTT\n")
+        for i in range(cues):
+            f.write(
+                f"\n{seconds_to_vtt_time(i * cue_secs)} --> {seconds_to_vtt_time((i + 1) * cue_secs)}\n"
+                f"Caption {i}, the speaker goes on about one thing\nand then another for a while.\n"
+            )
+
+
+def convert_whole(vtt_path: str):
+    from webvtt import WebVTT
+
+    entries = [
+        {
+            "id": i,
+            "start": seconds_to_hms(caption.start_in_seconds),
+            "end": seconds_to_hms(caption.end_in_seconds),
+            "text": caption.text.strip(),
+        }
+        for i, caption in enumerate(WebVTT.read(vtt_path).captions)
+    ]
+    with open(f"{os.path.dirname(vtt_path)}/transcript.json", "w") as f:
+        f.write(json.dumps(entries, indent=2))
+
+
+def convert_streaming(vtt_path: str):
+    from summarizer.llm import convert_transcript_to_json
+
+    convert_transcript_to_json(vtt_path)
+
+
+def measure(convert, vtt_path: str):
+    """Run in a fresh process: how long the conversion took and the peak RSS it reached."""
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    convert(vtt_path)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return elapsed, (peak - baseline) * 1024
+
+
+@click.command()
+@click.option("--cues", default="200000,1000000", help="Comma separated numbers of cues")
+def main(cues):
+    context = multiprocessing.get_context("spawn")
+    click.echo(f"{'cues':>8} {'file':>8} {'whole':>19} {'streaming':>19}")
+    for count in [int(c) for c in cues.split(",")]:
+        with tempfile.TemporaryDirectory() as dir:
+            vtt_path = os.path.join(dir, "transcript.vtt")
+            make_vtt(vtt_path, count)
+            results = []
+            for convert in (convert_whole, convert_streaming):
+                with context.Pool(1) as pool:
+                    results.append(pool.apply(measure, (convert, vtt_path)))
+            size = os.path.getsize(vtt_path)
+
+        (whole, whole_rss), (streaming, streaming_rss) = results
+        click.echo(
+            f"{count:>8} {size / 2**20:>6.0f}MB "
+            f"{whole:>7.2f}s {whole_rss / 2**20:>8.0f}MB {streaming:>7.2f}s {streaming_rss / 2**20:>8.0f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import logging
+import os
+import subprocess
+from typing import Dict, List
+
+from summarizer.vtt import seconds_to_hms
+
+logger = logging.getLogger(__name__)
+
+
+def make_video(path: str, duration: int, size: str = "640x360", rate: int = 25):
+    """
+    Generate a synthetic video (with audio) using ffmpeg's lavfi sources.
+
+    :param path: Where to write the video.
+    :param duration: Length of the video in seconds.
+    """
+    if os.path.exists(path):
+        return path
+
+    command = [
+        "ffmpeg",
+        "-y",
+        "-f", "lavfi", "-i", f"testsrc2=duration={duration}:size={size}:rate={rate}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-shortest",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", str(rate * 10),
+        "-c:a", "aac",
+        path,
+    ]
+    logger.debug(f"Running command: {' '.join(command)}")
+    subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return path
+
+
+def make_slides_video(path: str, duration: int, slide_secs: int = 17, size: str = "640x360", rate: int = 25):
+    """
+    Generate a synthetic slide talk: a white slide whose blocks of 'text' move
+    every `slide_secs` seconds, with a small moving 'speaker' in the corner.
+    """
+    if os.path.exists(path):
+        return path
+
+    width, height = (int(d) for d in size.split("x"))
+    inputs = [
+        "-f", "lavfi", "-i", f"color=c=white:s={size}:r={rate}:d={duration}",
+        "-f", "lavfi", "-i", f"testsrc2=s={width // 4}x{height // 4}:r={rate}:d={duration}",
+        "-f", "lavfi", "-i", f"color=c=black:s={width // 3}x{height // 12}:r={rate}:d={duration}",
+    ]
+    lines = []
+    slide = "[0]"
+    for i in range(1, 5):
+        x = f"{width // 32}+mod(floor(t/{slide_secs})*{53 * i + 31}\\,{width - width // 3 - width // 16})"
+        lines.append(f"{slide}[line{i}]overlay=x={x}:y={i * height // 6}[slide{i}]")
+        slide = f"[slide{i}]"
+    graph = ";".join([
+        "[2]split=4[line1][line2][line3][line4]",
+        *lines,
+        f"{slide}[1]overlay=x={width - width // 4 - width // 32}:y={height - height // 4 - height // 32}",
+    ])
+
+    command = [
+        "ffmpeg",
+        "-y",
+        *inputs,
+        "-filter_complex", graph,
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", str(rate * 10),
+        path,
+    ]
+    logger.debug(f"Running command: {' '.join(command)}")
+    subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return path
+
+
+def make_transcript(duration: int, cue_secs: float = 3) -> List[Dict]:
+    """A synthetic transcript with a cue every `cue_secs` seconds."""
+    count = int(duration / cue_secs)
+    return [
+        {
+            "id": i,
+            "start": seconds_to_hms(i * cue_secs),
+            "end": seconds_to_hms((i + 1) * cue_secs),
+            "text": f"Synthetic cue number {i}.",
+        }
+        for i in range(count)
+    ]
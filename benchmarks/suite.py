@@ -0,0 +1,272 @@
+"""
+Time every pipeline stage, and the memory it takes, on synthetic media and
+transcripts, against a fake LLM, and compare the results with stored
+baselines. A stage slower or bigger than its baseline by more than
+--tolerance is a regression, and the exit status is 1 -- so CI can run:
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --sizes 1000,10000,100000,500000 --video-secs 600
+    python -m benchmarks.suite --update-baselines
+
+Transcript stages run at each of --sizes cues (up to their own limit: the
+topic model takes minutes past 100k cues), media stages on a --video-secs
+long video. Each run is a fresh process, so its peak RSS is its own; the
+memory reported is how far the peak grew while the stage ran, on top of
+its inputs. ffmpeg's own memory isn't included.
+"""
+import asyncio
+import gc
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple, TypedDict
+
+import click
+
+from .bench_topics import make_topic_transcript
+from .bench_vtt import make_vtt
+from .media import make_slides_video, make_transcript, make_video
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+# Differences smaller than these are noise, whatever the tolerance.
+MIN_SLOWDOWN_SECS = 0.05
+MIN_GROWTH_MB = 8
+
+# A chapter the fake LLM answers every summary request with.
+CANNED_ARTICLE = json.dumps({
+    "articles": [{
+        "title": "A synthetic chapter",
+        "summary": "What the cues of this request were about.",
+        "insights": [
+            {"sourceIds": [0, 1], "markdown": "The first point, with $x = 3$."},
+            {"sourceIds": [2], "markdown": "The second point."},
+        ],
+    }]
+})
+
+
+class Result(TypedDict):
+    secs: float
+    rss_mb: float
+
+
+def fake_llm():
+    from langchain_community.llms.fake import FakeListLLM
+
+    return FakeListLLM(responses=[CANNED_ARTICLE])
+
+
+# Stages: set up the inputs of a run in a directory, and return what to time.
+
+def vtt_stage(dir: str, cues: int) -> Callable:
+    from summarizer.llm import convert_transcript_to_json
+
+    path = os.path.join(dir, "transcript.vtt")
+    make_vtt(path, cues)
+    return lambda: convert_transcript_to_json(path)
+
+
+def transcript_load_stage(dir: str, cues: int) -> Callable:
+    from summarizer.transcript import Transcript
+
+    path = os.path.join(dir, "transcript.json")
+    Transcript.from_entries(make_topic_transcript(cues)).save_json(path)
+    return lambda: Transcript.load_json(path)
+
+
+def topics_stage(dir: str, cues: int) -> Callable:
+    from summarizer.topics import identify_topics
+
+    transcript = make_topic_transcript(cues)
+    return lambda: identify_topics(transcript, cache_dir=None)
+
+
+def split_stage(dir: str, cues: int) -> Callable:
+    import numpy as np
+
+    from summarizer.topics import split_by_dominant_topics_array
+
+    # Runs of 40 cues about one of five topics.
+    topics = np.repeat(np.random.default_rng(1).integers(0, 5, cues // 40 + 1), 40)[:cues]
+    return lambda: split_by_dominant_topics_array(topics, 0.2)
+
+
+def summary_stage(dir: str, cues: int) -> Callable:
+    from summarizer.engine import LLMEngine
+    from summarizer.templates import make_time_chain
+
+    chain = make_time_chain(make_topic_transcript(cues), engine=LLMEngine(rpm=0, tpm=0))
+    model = fake_llm()
+    return lambda: asyncio.run(chain(model))
+
+
+def html_stage(dir: str, cues: int) -> Callable:
+    from summarizer.summarizer import update_html
+    from summarizer.transcript import Transcript
+
+    transcript = Transcript.from_entries(make_topic_transcript(cues))
+    chapters = json.loads(CANNED_ARTICLE)["articles"] * max(1, cues // 200)
+    title = {"title": "Synthetic", "description": "A synthetic transcript."}
+    return lambda: asyncio.run(update_html(dir, "page", "Synthetic", title, chapters, [], transcript))
+
+
+def audio_stage(dir: str, secs: int) -> Callable:
+    from summarizer.ffmpeg import create_lower_quality_mp3
+
+    video = make_video(os.path.join(dir, "video.mp4"), secs)
+    return lambda: create_lower_quality_mp3(video, os.path.join(dir, "out"))
+
+
+def speech_stage(dir: str, secs: int) -> Callable:
+    from summarizer.compaction import create_compact_speech
+
+    video = make_video(os.path.join(dir, "video.mp4"), secs)
+    return lambda: create_compact_speech(video, os.path.join(dir, "out"))
+
+
+def snapshots_stage(dir: str, secs: int) -> Callable:
+    from summarizer.snapshots import SINGLE_PASS_ENGINE, SSIM_SIMILARITY, create_snapshots_at_time_increments
+
+    video = make_slides_video(os.path.join(dir, "video.mp4"), secs)
+    transcript = make_transcript(secs)
+    return lambda: asyncio.run(create_snapshots_at_time_increments(
+        video, os.path.join(dir, "out"), 5, transcript, SINGLE_PASS_ENGINE, SSIM_SIMILARITY
+    ))
+
+
+def scene_stage(dir: str, secs: int) -> Callable:
+    from summarizer.snapshots import create_scene_snapshots
+
+    video = make_slides_video(os.path.join(dir, "video.mp4"), secs)
+    return lambda: create_scene_snapshots(video, os.path.join(dir, "out"), 5)
+
+
+def sprites_stage(dir: str, secs: int) -> Callable:
+    from summarizer.snapshots import SPRITES_OUTPUT, create_scene_snapshots, create_snapshots_file
+
+    video = make_slides_video(os.path.join(dir, "video.mp4"), secs, slide_secs=5)
+    create_scene_snapshots(video, dir, 5)
+    return lambda: create_snapshots_file(dir, SPRITES_OUTPUT, secs)
+
+
+# name -> (stage, the most cues it runs at)
+TRANSCRIPT_STAGES: Dict[str, Tuple[Callable, int]] = {
+    "vtt": (vtt_stage, 500000),
+    "transcript-load": (transcript_load_stage, 500000),
+    "topics": (topics_stage, 100000),
+    "split": (split_stage, 500000),
+    "summary": (summary_stage, 100000),
+    "html": (html_stage, 500000),
+}
+MEDIA_STAGES: Dict[str, Callable] = {
+    "audio": audio_stage,
+    "speech": speech_stage,
+    "snapshots": snapshots_stage,
+    "scene": scene_stage,
+    "sprites": sprites_stage,
+}
+
+
+def measure(name: str, size: int) -> Result:
+    """Run in a fresh process: set up the stage, then time it and see how far the peak RSS grows."""
+    stage = TRANSCRIPT_STAGES[name][0] if name in TRANSCRIPT_STAGES else MEDIA_STAGES[name]
+    with tempfile.TemporaryDirectory() as dir:
+        run = stage(dir, size)
+        gc.collect()
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return Result(secs=elapsed, rss_mb=(peak - baseline) / 1024)
+
+
+def regression(result: Result, baseline: Optional[Result], tolerance: float) -> Optional[str]:
+    """What got worse than the baseline, if anything did."""
+    if not baseline:
+        return None
+    problems = []
+    if result["secs"] > baseline["secs"] * (1 + tolerance) and result["secs"] - baseline["secs"] > MIN_SLOWDOWN_SECS:
+        problems.append(f"{result['secs'] / baseline['secs']:.1f}x slower")
+    if result["rss_mb"] > baseline["rss_mb"] * (1 + tolerance) and result["rss_mb"] - baseline["rss_mb"] > MIN_GROWTH_MB:
+        problems.append(f"{result['rss_mb'] - baseline['rss_mb']:.0f}MB more memory")
+    return ", ".join(problems) or None
+
+
+def load_baselines(path: str) -> Dict[str, Result]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+@click.command()
+@click.option("--sizes", default="1000,10000,100000", help="Comma separated numbers of transcript cues")
+@click.option("--video-secs", default=300, help="Length of the synthetic video for media stages")
+@click.option("--stages", default=None, help="Comma separated stages to run (default: all)")
+@click.option("--baselines", "baselines_path", default=BASELINES_PATH, help="Baselines to compare with")
+@click.option("--tolerance", default=0.5, help="How much slower or bigger than its baseline a stage may get (0.5: 50%)")
+@click.option("--update-baselines", is_flag=True, help="Save these results as the new baselines")
+@click.option("--output", default=None, help="Also save the results to this JSON file")
+def main(sizes, video_secs, stages, baselines_path, tolerance, update_baselines, output):
+    selected = stages.split(",") if stages else [*TRANSCRIPT_STAGES, *MEDIA_STAGES]
+    unknown = [s for s in selected if s not in TRANSCRIPT_STAGES and s not in MEDIA_STAGES]
+    if unknown:
+        raise click.BadParameter(f"Unknown stages: {', '.join(unknown)}", param_hint="--stages")
+
+    runs: List[Tuple[str, int]] = []
+    for name in selected:
+        if name in TRANSCRIPT_STAGES:
+            runs += [(name, size) for size in map(int, sizes.split(",")) if size <= TRANSCRIPT_STAGES[name][1]]
+        else:
+            runs.append((name, video_secs))
+
+    # Runs mustn't reuse the cached topics of earlier runs (or of real use).
+    cache_dir = tempfile.TemporaryDirectory()
+    os.environ["XDG_CACHE_HOME"] = cache_dir.name
+
+    baselines = load_baselines(baselines_path)
+    results: Dict[str, Result] = {}
+    regressions = []
+    context = multiprocessing.get_context("spawn")
+    click.echo(f"{'stage':<16} {'size':>8} {'time':>9} {'memory':>8} {'baseline':>19}")
+    for name, size in runs:
+        key = f"{name}@{size}"
+        with context.Pool(1) as pool:
+            try:
+                result = pool.apply(measure, (name, size))
+            except Exception as e:
+                click.echo(f"{name:<16} {size:>8} failed: {type(e).__name__}: {e}")
+                continue
+        results[key] = result
+
+        baseline = baselines.get(key)
+        line = f"{name:<16} {size:>8} {result['secs']:>8.2f}s {result['rss_mb']:>6.0f}MB"
+        if baseline:
+            line += f" {baseline['secs']:>8.2f}s {baseline['rss_mb']:>6.0f}MB"
+        problem = regression(result, baseline, tolerance)
+        if problem:
+            regressions.append(f"{key}: {problem}")
+            line += f"  REGRESSION ({problem})"
+        click.echo(line)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+    if update_baselines:
+        with open(baselines_path, "w") as f:
+            json.dump({**baselines, **results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        click.echo(f"Saved {len(results)} baselines to {baselines_path}")
+    elif regressions:
+        click.echo(f"{len(regressions)} regressions:\n" + "\n".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from typing import Any, Dict, List, Optional, TypedDict
+
+from .compress import remove_compressed
+
+logger = logging.getLogger(__name__)
+
+# Name of the file in an output directory recording what each artifact was made from.
+ARTIFACTS_FILE = "artifacts.json"
+
+# Bump when what is recorded changes, so older records aren't compared with.
+ARTIFACTS_VERSION = 1
+
+
+class StageInputs(TypedDict):
+    """
+    What the artifacts of a stage are made from.
+
+    :param outputs: Paths of its artifacts in the output directory. The
+        first is the one the stage checks to skip; the rest are removed
+        with it.
+    :param params: Options, models and prompt versions it is made with.
+    :param upstream: Stages whose artifacts it is made from.
+    """
+    outputs: List[str]
+    params: Dict[str, Any]
+    upstream: List[str]
+
+
+class OutputStamp(TypedDict):
+    size: int
+    mtime_ns: int
+    digest: str
+
+
+class StageRecord(TypedDict):
+    params: Dict[str, Any]
+    upstream: Dict[str, str]
+    outputs: Dict[str, OutputStamp]
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _remove(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+    # Or a static file server would go on serving the compressed copies.
+    remove_compressed(path)
+
+
+class ArtifactManifest:
+    """
+    What each stage's artifacts in an output directory were made from: the
+    stage's params, and digests of the upstream artifacts it read.
+
+    A stage whose params or upstream artifacts have changed since is stale,
+    and so is everything downstream of it. Stale artifacts are removed, so
+    the stages make them again; everything else is kept. Artifacts edited by
+    hand are kept too, but the stages downstream of them are remade.
+
+    Artifacts made before there was a record of them are taken to be up to
+    date. Artifacts linked from the artifact store come with their record.
+    """
+
+    def __init__(self, dir: str):
+        self.dir = dir
+        self.path = os.path.join(dir, ARTIFACTS_FILE)
+        self.stages: Dict[str, StageRecord] = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                saved = json.load(f)
+            if saved.get("version") == ARTIFACTS_VERSION:
+                self.stages = saved["stages"]
+
+    def _stamp(self, name: str, previous: Optional[OutputStamp]) -> OutputStamp:
+        stat = os.stat(os.path.join(self.dir, name))
+        if previous and (previous["size"], previous["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            return previous
+        return OutputStamp(size=stat.st_size, mtime_ns=stat.st_mtime_ns, digest=file_digest(os.path.join(self.dir, name)))
+
+    def _stamps(self, stage: str, inputs: StageInputs) -> Dict[str, OutputStamp]:
+        """Stamps of a stage's artifacts as they are now, rehashing only the ones that changed."""
+        previous = self.stages.get(stage, {}).get("outputs", {})
+        return {
+            name: self._stamp(name, previous.get(name))
+            for name in inputs["outputs"]
+            if os.path.isfile(os.path.join(self.dir, name))
+        }
+
+    def digest(self, stage: str, inputs: StageInputs) -> str:
+        """A digest of a stage's artifacts as they are now."""
+        stamps = self._stamps(stage, inputs)
+        return hashlib.sha256(json.dumps({n: s["digest"] for n, s in stamps.items()}, sort_keys=True).encode()).hexdigest()
+
+    def _upstream(self, inputs: StageInputs, stages: Dict[str, StageInputs]) -> Dict[str, str]:
+        return {name: self.digest(name, stages[name]) for name in inputs["upstream"]}
+
+    def _stale_reason(self, stage: str, stages: Dict[str, StageInputs], stale: List[str]) -> Optional[str]:
+        inputs = stages[stage]
+        record = self.stages.get(stage)
+        changed_upstream = [name for name in inputs["upstream"] if name in stale]
+        if changed_upstream:
+            return f"{', '.join(changed_upstream)} changed"
+        if record is None:
+            return None
+        changed_params = sorted(
+            name for name in {*record["params"], *inputs["params"]}
+            if record["params"].get(name) != inputs["params"].get(name)
+        )
+        if changed_params:
+            return f"{', '.join(changed_params)} changed"
+        upstream = self._upstream(inputs, stages)
+        changed_upstream = [name for name in upstream if record["upstream"].get(name) != upstream[name]]
+        if changed_upstream:
+            return f"{', '.join(changed_upstream)} changed"
+        return None
+
+    def invalidate(self, stages: Dict[str, StageInputs]) -> Dict[str, str]:
+        """
+        Remove the artifacts of stale stages.
+
+        :param stages: The inputs of each stage, upstream stages first.
+        :return: Why each stage with artifacts to remove was stale.
+        """
+        stale: List[str] = []
+        reasons: Dict[str, str] = {}
+        for stage, inputs in stages.items():
+            if not os.path.exists(os.path.join(self.dir, inputs["outputs"][0])):
+                # To be made anyway, and so is everything downstream of it.
+                stale.append(stage)
+                self.stages.pop(stage, None)
+                continue
+
+            reason = self._stale_reason(stage, stages, stale)
+            if reason:
+                logger.info(f"{stage} is out of date ({reason}), removing {', '.join(inputs['outputs'])}")
+                for name in inputs["outputs"]:
+                    _remove(os.path.join(self.dir, name))
+                stale.append(stage)
+                reasons[stage] = reason
+                self.stages.pop(stage, None)
+        if reasons:
+            self.save()
+        return reasons
+
+    def adopt(self, stage: str, record: StageRecord):
+        """Take the record of a stage's artifacts linked from elsewhere (the artifact store)."""
+        self.stages[stage] = record
+        self.save()
+
+    def record(self, stage: str, stages: Dict[str, StageInputs]):
+        """Record what a stage that has just run made its artifacts from."""
+        inputs = stages[stage]
+        self.stages[stage] = StageRecord(
+            params=inputs["params"],
+            upstream=self._upstream(inputs, stages),
+            outputs=self._stamps(stage, inputs),
+        )
+        self.save()
+
+    def save(self):
+        os.makedirs(self.dir, exist_ok=True)
+        partial = f"{self.path}.partial"
+        with open(partial, "w") as f:
+            f.write(json.dumps({"version": ARTIFACTS_VERSION, "stages": self.stages}, indent=2, sort_keys=True))
+        os.replace(partial, self.path)
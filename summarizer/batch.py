@@ -0,0 +1,154 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+import traceback
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, TypedDict
+
+logger = logging.getLogger(__name__)
+
+MEDIA_EXTENSIONS = {
+    ".aac", ".avi", ".flac", ".m4a", ".m4v", ".mkv", ".mov", ".mp3", ".mp4",
+    ".mpeg", ".mpg", ".ogg", ".opus", ".wav", ".webm", ".wma", ".wmv",
+}
+
+# Name of the manifest kept in a batch's output directory.
+MANIFEST_FILE = "tldl-batch.json"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+
+class FileStatus(TypedDict):
+    status: str
+    output: Optional[str]
+    stages: Dict[str, str]
+    error: Optional[str]
+    duration: Optional[float]
+
+
+def find_media_files(patterns: Iterable[str]) -> List[str]:
+    """
+    Expand files, directories (searched recursively) and glob patterns into
+    a sorted list of media files.
+    """
+    found = set()
+    for pattern in patterns:
+        paths = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        for path in paths:
+            if os.path.isdir(path):
+                for root, _, files in os.walk(path):
+                    found.update(
+                        os.path.join(root, f) for f in files
+                        if os.path.splitext(f)[1].lower() in MEDIA_EXTENSIONS
+                    )
+            elif os.path.isfile(path):
+                found.add(path)
+            else:
+                logger.warning(f"No such file or directory: {path}")
+    return sorted(os.path.abspath(f) for f in found)
+
+
+class BatchManifest:
+    """
+    Per-file status of a batch, saved after every change so an interrupted
+    batch can pick up where it stopped.
+
+    Files that finished (or had no audio) are skipped when the batch is run
+    again; everything else is run again, and its stages skip any artifacts
+    that were already made.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, FileStatus] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.files = json.load(f)["files"]
+
+    def status(self, file_path: str) -> str:
+        return self.files.get(file_path, {}).get("status", PENDING)
+
+    def is_finished(self, file_path: str) -> bool:
+        return self.status(file_path) in (DONE, SKIPPED)
+
+    def start(self, file_path: str):
+        previous = self.files.get(file_path)
+        self.files[file_path] = FileStatus(
+            status=RUNNING,
+            output=previous["output"] if previous else None,
+            stages=previous["stages"] if previous else {},
+            error=None,
+            duration=None,
+        )
+        self.save()
+
+    def stage_done(self, file_path: str, stage: str):
+        self.files[file_path]["stages"][stage] = DONE
+        self.save()
+
+    def finish(self, file_path: str, status: str, output: Optional[str], duration: float, error: Optional[str] = None):
+        self.files[file_path].update(status=status, output=output, duration=duration, error=error)
+        self.save()
+
+    def counts(self, file_paths: List[str]) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for file_path in file_paths:
+            status = self.status(file_path)
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        partial = f"{self.path}.partial"
+        with open(partial, "w") as f:
+            f.write(json.dumps({"files": self.files}, indent=2))
+        os.replace(partial, self.path)
+
+
+async def run_batch(
+    file_paths: List[str],
+    process: Callable[[str, Callable[[str], None]], Awaitable[Optional[str]]],
+    manifest: BatchManifest,
+    jobs: int,
+    quiet: bool = False,
+) -> Dict[str, int]:
+    """
+    Process files concurrently, `jobs` at a time, recording their progress in the manifest.
+
+    :param process: Called with a file and a callback to report finished
+        stages; returns the output directory, or None if the file was skipped.
+        A failure is recorded and doesn't stop the other files.
+    :return: The number of files with each status.
+    """
+    todo = [f for f in file_paths if not manifest.is_finished(f)]
+    print(f"{len(file_paths) - len(todo)} of {len(file_paths)} files already done") if not quiet and len(todo) < len(file_paths) else None
+
+    semaphore = asyncio.Semaphore(jobs)
+    finished = 0
+
+    async def run_file(file_path: str):
+        nonlocal finished
+        async with semaphore:
+            manifest.start(file_path)
+            start = time.perf_counter()
+            try:
+                output = await process(file_path, lambda stage: manifest.stage_done(file_path, stage))
+            except Exception as e:
+                logger.debug(traceback.format_exc())
+                manifest.finish(file_path, FAILED, None, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+            else:
+                manifest.finish(file_path, DONE if output else SKIPPED, output, time.perf_counter() - start)
+
+            finished += 1
+            status = manifest.files[file_path]
+            detail = status["error"] or status["output"] or "no audio"
+            print(f"[{finished}/{len(todo)}] {status['status']} {file_path} ({detail}, {status['duration']:.1f}s)") if not quiet else None
+
+    await asyncio.gather(*[run_file(f) for f in todo])
+    return manifest.counts(file_paths)
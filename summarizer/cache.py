@@ -0,0 +1,160 @@
+import contextlib
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Iterator, List, Optional, Sequence, Tuple, TypedDict
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+from .config import CACHE_DIR, DEFAULT_CACHE_PATH, DEFAULT_MAX_AGE_SECS, DEFAULT_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+class CacheStats(TypedDict):
+    hits: int
+    misses: int
+    entries: int
+    bytes: int
+
+
+# Responses looked up in or added to an LLM cache in the current context, as
+# (cache, key) pairs, while `used_responses` collects them.
+_used_responses: ContextVar[Optional[List[Tuple["LLMCache", str]]]] = ContextVar("used_responses", default=None)
+
+
+@contextlib.contextmanager
+def used_responses() -> Iterator[List[Tuple["LLMCache", str]]]:
+    """Collect the cached responses a chain used within the block, so a bad one can be dropped."""
+    used = []
+    token = _used_responses.set(used)
+    try:
+        yield used
+    finally:
+        _used_responses.reset(token)
+
+
+class LLMCache(BaseCache):
+    """
+    Persistent cache of LLM responses, stored in SQLite.
+
+    Responses are keyed by a hash of the model settings (which include the
+    model name) and the rendered prompt, so any chain that renders the same
+    prompt for the same model reuses the response. Entries older than
+    `max_age_secs` are dropped, and the least recently used entries are
+    evicted once the cache grows past `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_age_secs: float = DEFAULT_MAX_AGE_SECS,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_secs = max_age_secs
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Chains call the model from worker threads.
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._db.commit()
+
+    @staticmethod
+    def key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode()).hexdigest()
+
+    def _use(self, key: str):
+        used = _used_responses.get()
+        if used is not None:
+            used.append((self, key))
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        key = self.key(prompt, llm_string)
+        self._use(key)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM responses WHERE key = ? AND created >= ?",
+                (key, now - self.max_age_secs),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                logger.debug(f"LLM cache miss {key}")
+                return None
+
+            self.hits += 1
+            logger.debug(f"LLM cache hit {key}")
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        return loads(row[0])
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]):
+        key = self.key(prompt, llm_string)
+        self._use(key)
+        value = dumps(list(return_val))
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def drop(self, key: str):
+        """Forget a response, so the next request for it reaches the API."""
+        with self._lock:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+        logger.debug(f"Dropped LLM cache entry {key}")
+
+    def _evict(self, now: float):
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.max_age_secs,))
+
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total <= self.max_bytes:
+            return
+
+        # Drop the least recently used entries until the cache fits again.
+        evicted = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        logger.debug(f"Evicted {len(evicted)} LLM cache entries")
+
+    def clear(self, **kwargs: Any):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            entries, total = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return CacheStats(hits=self.hits, misses=self.misses, entries=entries, bytes=total)
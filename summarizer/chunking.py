@@ -0,0 +1,72 @@
+import math
+import re
+from itertools import accumulate
+from typing import List
+
+# Runs of letters, up to three digits, and single punctuation marks: roughly
+# where BPE tokenizers (cl100k) split English text.
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+|\d{1,3}|\S")
+
+# Letters in a word piece: common words are a single token, longer words a
+# few.
+LETTERS_PER_TOKEN = 5
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate how many tokens a text is, without a tokenizer (or a download).
+
+    Words count as a token per five letters, numbers as a token per three
+    digits and punctuation as a token per mark, which errs on the high side
+    for English text.
+    """
+    tokens = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        piece = match.group()
+        tokens += math.ceil(len(piece) / LETTERS_PER_TOKEN) if piece[0].isalpha() else 1
+    return tokens
+
+
+def pack_ranges(ranges: List[List[int]], cue_tokens: List[int], budget: int) -> List[List[int]]:
+    """
+    Repack ranges of cues so each comes close to `budget` tokens.
+
+    Ranges over the budget are split at cue boundaries into roughly equal
+    pieces, then neighbouring ranges are merged while they fit in the budget.
+    A single cue over the budget gets a range of its own.
+
+    :param ranges: Consecutive [start, end) cue ranges.
+    :param cue_tokens: Number of tokens of each cue.
+    :return: Consecutive [start, end) cue ranges covering the same cues.
+    """
+    totals = [0] + list(accumulate(cue_tokens))
+
+    def tokens(start: int, end: int) -> int:
+        return totals[end] - totals[start]
+
+    pieces = []
+    for start, end in ranges:
+        total = tokens(start, end)
+        if total <= budget:
+            pieces.append([start, end])
+            continue
+
+        target = total / math.ceil(total / budget)
+        piece_start, cuts = start, 0
+        for i in range(start, end):
+            size = tokens(piece_start, i)
+            # Cut where the running total is closest to the next multiple of
+            # the target, so the pieces don't drift from it.
+            past_target = tokens(start, i) + cue_tokens[i] / 2 > target * (cuts + 1)
+            if size and (past_target or size + cue_tokens[i] > budget):
+                pieces.append([piece_start, i])
+                piece_start, cuts = i, cuts + 1
+        pieces.append([piece_start, end])
+
+    packed = []
+    for start, end in pieces:
+        if packed and tokens(packed[-1][0], end) <= budget:
+            packed[-1][1] = end
+        else:
+            packed.append([start, end])
+    return packed
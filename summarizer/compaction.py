@@ -0,0 +1,151 @@
+"""
+Speech compaction: audio for transcription with the long silences cut out
+(and optionally sped up), and the time map back to the source media.
+"""
+import bisect
+import json
+import logging
+import os
+from typing import Iterable, Iterator, List, Optional, Tuple, TypedDict
+
+from .ffmpeg import SPEECH_FRAME_SECS, create_speech_audio, detect_silences, media_duration
+from .vtt import Caption
+
+logger = logging.getLogger(__name__)
+
+SPEECH_AUDIO = "speech.mp3"
+SPEECH_MAP = "speech.json"
+
+# Silences at least this long are cut, leaving this much of them on either side.
+COMPACT_MIN_SILENCE_SECS = 1.5
+COMPACT_PADDING_SECS = 0.25
+# Speed ups of --speech-tempo: past 2x speech transcribes noticeably worse.
+MIN_TEMPO = 1.0
+MAX_TEMPO = 2.0
+
+
+class SpeechMap(TypedDict):
+    tempo: float
+    min_silence: float
+    padding: float
+    # (start, end) in the source media of each stretch kept, in order.
+    segments: List[Tuple[float, float]]
+
+
+def _to_frame(seconds: float) -> float:
+    return round(round(seconds / SPEECH_FRAME_SECS) * SPEECH_FRAME_SECS, 3)
+
+
+def plan_kept_segments(
+    duration: float,
+    silences: List[Tuple[float, float]],
+    padding: float = COMPACT_PADDING_SECS,
+) -> List[Tuple[float, float]]:
+    """
+    The stretches of the media to keep when the given silences are cut,
+    `padding` seconds short of each side of every silence. Cuts are rounded
+    to the frames speech audio is cut in.
+    """
+    segments = []
+    start = 0.0
+    for silence_start, silence_end in silences:
+        cut_start = _to_frame(silence_start + padding) if silence_start > 0 else 0.0
+        cut_end = _to_frame(silence_end - padding) if silence_end < duration else duration
+        if cut_end <= cut_start:
+            continue
+        if cut_start > start:
+            segments.append((start, cut_start))
+        start = max(start, cut_end)
+    if start < duration:
+        segments.append((start, duration))
+    return segments
+
+
+class TimeMap:
+    """
+    Maps times in compacted audio back to the source media: piecewise linear,
+    one piece per kept segment, each `tempo` times faster than the source.
+    """
+
+    def __init__(self, segments: List[Tuple[float, float]], tempo: float = 1.0):
+        self.segments = segments
+        self.tempo = tempo
+        self.compact_starts = []
+        position = 0.0
+        for start, end in segments:
+            self.compact_starts.append(position)
+            position += (end - start) / tempo
+        self.compact_duration = position
+
+    @classmethod
+    def from_speech_map(cls, speech_map: SpeechMap) -> "TimeMap":
+        return cls([tuple(segment) for segment in speech_map["segments"]], speech_map["tempo"])
+
+    def to_source(self, seconds: float) -> float:
+        """The time in the source media of a time in the compacted audio."""
+        if not self.segments:
+            return seconds
+        i = max(0, bisect.bisect_right(self.compact_starts, seconds) - 1)
+        start, end = self.segments[i]
+        return min(end, start + max(0.0, seconds - self.compact_starts[i]) * self.tempo)
+
+
+def remap_captions(captions: Iterable[Caption], time_map: TimeMap) -> Iterator[Caption]:
+    """Captions of compacted audio, with their times in the source media."""
+    for caption in captions:
+        yield Caption(
+            time_map.to_source(caption.start_in_seconds),
+            time_map.to_source(caption.end_in_seconds),
+            caption.text,
+        )
+
+
+def read_speech_map(dir: str) -> Optional[SpeechMap]:
+    path = os.path.join(dir, SPEECH_MAP)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def create_compact_speech(
+    source_file: str,
+    dir: str,
+    tempo: float = MIN_TEMPO,
+    min_silence: float = COMPACT_MIN_SILENCE_SECS,
+    padding: float = COMPACT_PADDING_SECS,
+) -> TimeMap:
+    """
+    Save mono 16kHz audio of the source, with silences of `min_silence` seconds
+    or more cut and sped up `tempo` times, to 'dir/speech.mp3', and its time
+    map to 'dir/speech.json'.
+    """
+    speech_map = read_speech_map(dir)
+    if (
+        speech_map
+        and os.path.exists(os.path.join(dir, SPEECH_AUDIO))
+        and (speech_map["tempo"], speech_map["min_silence"], speech_map["padding"]) == (tempo, min_silence, padding)
+    ):
+        logger.info("Compacted speech already exists, skipping...")
+        return TimeMap.from_speech_map(speech_map)
+
+    logger.info("Compacting speech...")
+    os.makedirs(dir, exist_ok=True)
+    # Speech made with other settings may be linked from the artifact store:
+    # unlink it rather than have ffmpeg write into the stored copy.
+    for name in (SPEECH_MAP, SPEECH_AUDIO):
+        if os.path.exists(os.path.join(dir, name)):
+            os.remove(os.path.join(dir, name))
+    duration = media_duration(source_file)
+    segments = plan_kept_segments(duration, detect_silences(source_file, min_duration=min_silence), padding)
+    create_speech_audio(source_file, segments, tempo, os.path.join(dir, SPEECH_AUDIO))
+
+    speech_map = SpeechMap(tempo=tempo, min_silence=min_silence, padding=padding, segments=segments)
+    # Written last: the audio is only reused when its map is there.
+    with open(os.path.join(dir, f"{SPEECH_MAP}.partial"), "w") as f:
+        f.write(json.dumps(speech_map, indent=2))
+    os.replace(os.path.join(dir, f"{SPEECH_MAP}.partial"), os.path.join(dir, SPEECH_MAP))
+
+    time_map = TimeMap.from_speech_map(speech_map)
+    logger.info(f"Compacted {duration:.0f}s of audio to {time_map.compact_duration:.0f}s")
+    return time_map
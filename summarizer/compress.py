@@ -0,0 +1,93 @@
+import fnmatch
+import gzip
+import logging
+import os
+from typing import List
+
+from .trace import traced
+
+logger = logging.getLogger(__name__)
+
+# Artifacts a static file server serves as text: the pages, and the JSON
+# they are made from. Bookkeeping (artifacts.json, source.json, a batch
+# manifest) isn't served.
+SERVED_ARTIFACTS = ("*.html", "chapters-*.json", "title.json", "transcript.json", "snapshots/snapshots.json")
+
+# Extensions of the compressed copies.
+COMPRESSED_SUFFIXES = (".gz", ".br")
+
+
+def _write(path: str, data: bytes):
+    partial_path = f"{path}.partial"
+    with open(partial_path, "wb") as f:
+        f.write(data)
+    os.replace(partial_path, path)
+
+
+def _is_fresh(path: str, source: str) -> bool:
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source)
+
+
+def compress_file(path: str) -> List[str]:
+    """
+    Write gzip (and, with the brotli package installed, brotli) compressed
+    copies of a file next to it, for a static file server to send as is.
+    Copies newer than the file are kept.
+
+    :return: Paths of the copies written.
+    """
+    compressors = {".gz": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+
+        compressors[".br"] = lambda data: brotli.compress(data, quality=11)
+    except ImportError:
+        logger.debug("brotli isn't installed, only writing .gz copies")
+
+    written = []
+    data = None
+    for extension, compress in compressors.items():
+        if _is_fresh(path + extension, path):
+            continue
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        _write(path + extension, compress(data))
+        written.append(path + extension)
+    return written
+
+
+def is_served(name: str) -> bool:
+    """Whether an artifact (by its path in the output directory) is served."""
+    name = name.replace(os.sep, "/")
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in SERVED_ARTIFACTS)
+
+
+def remove_compressed(path: str):
+    """Remove the compressed copies of a file."""
+    for suffix in COMPRESSED_SUFFIXES:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+@traced("compress")
+def compress_artifacts(dir: str) -> List[str]:
+    """
+    Compress the served artifacts of an output directory (see `compress_file`),
+    and remove compressed copies of anything that is gone or isn't served.
+
+    :return: Paths of the copies written.
+    """
+    written = []
+    for root, _, names in os.walk(dir):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            source, suffix = os.path.splitext(path)
+            if suffix in COMPRESSED_SUFFIXES:
+                if not os.path.exists(source) or not is_served(os.path.relpath(source, dir)):
+                    logger.debug(f"Removing {path}")
+                    os.remove(path)
+            elif is_served(os.path.relpath(path, dir)):
+                written += compress_file(path)
+    logger.debug(f"Wrote {len(written)} compressed artifacts")
+    return written
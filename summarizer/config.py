@@ -0,0 +1,39 @@
+"""
+Defaults of the modules that need langchain or openai, kept here so the CLI
+can show them in --help without importing those modules.
+"""
+import os
+
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "tldl")
+
+# LLM response cache
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, "llm.sqlite")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_AGE_SECS = 90 * 24 * 60 * 60
+
+# Models the transcripts and summaries are made with.
+LLM_MODEL = "gpt-3.5-turbo-16k"
+TRANSCRIPTION_MODEL = "whisper-1"
+
+# Bump when the summary or title prompts (in templates.py) change, so
+# summaries made with the old ones are remade.
+SUMMARY_PROMPT_VERSION = 1
+TITLE_PROMPT_VERSION = 1
+
+# Rate limits of the OpenAI API (gpt-3.5-turbo, usage tier 1). 0 means unlimited.
+DEFAULT_RPM = 3500
+DEFAULT_TPM = 60000
+
+# Tokens of transcript to send in each chapter summary request, and of
+# chapters in each title request. The 16k context of the model leaves room
+# for the prompt and the response.
+CHUNK_TOKENS = 6000
+
+# The fake OpenAI server of `tldl fake-openai`.
+FAKE_OPENAI_PORT = 8089
+# Median time to answer a request, and the sigma of the log-normal
+# distribution latencies are drawn from (0: always the median).
+LATENCY_MS = 500
+LATENCY_SIGMA = 0.5
+# Transcribing also takes the length of the audio over this.
+TRANSCRIPTION_SPEED = 50
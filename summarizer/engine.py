@@ -0,0 +1,250 @@
+import asyncio
+import functools
+import logging
+import random
+import statistics
+import time
+from typing import Any, Dict, List, Optional, TypedDict
+
+from .chunking import estimate_tokens
+from .config import DEFAULT_RPM, DEFAULT_TPM
+from .trace import span
+
+logger = logging.getLogger(__name__)
+
+# Tokens reserved for the prompt template and the response on top of the input.
+RESERVED_TOKENS = 1500
+
+MAX_RETRIES = 6
+BACKOFF_SECS = 1.0
+MAX_BACKOFF_SECS = 60.0
+
+
+class TokenBucket:
+    """
+    Allows `per_minute` units a minute, refilled continuously.
+
+    Taking more than is available leaves the bucket in debt, which later
+    requests wait out -- so the real token usage of a response, known only
+    once it arrives, can be accounted for after the fact.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.available = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount: float):
+        """Take `amount` (or, negative, give it back) without waiting."""
+        self._refill()
+        self.available = min(self.capacity, self.available - amount)
+
+    async def acquire(self, amount: float):
+        if not self.capacity:
+            return
+        # Requests larger than the bucket wait for a full bucket, rather than forever.
+        needed = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.available >= needed:
+                self.available -= amount
+                return
+            await asyncio.sleep((needed - self.available) / self.rate)
+
+
+class RequestMetrics(TypedDict):
+    latency: float
+    attempts: int
+    prompt_tokens: int
+    completion_tokens: int
+
+
+# openai and langchain are imported once a request is made (by then the chain
+# has imported them), so setting up an engine that ends up unused is quick.
+@functools.lru_cache(maxsize=None)
+def _token_usage_handler():
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class _TokenUsage(BaseCallbackHandler):
+        """Collects the token usage reported by the model."""
+
+        def __init__(self):
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+
+        def on_llm_end(self, response, **kwargs: Any):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.completion_tokens += usage.get("completion_tokens", 0)
+
+    return _TokenUsage
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors and dropped connections are worth retrying."""
+    import openai
+
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, openai.APIConnectionError)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """How long the API asked us to wait, if it did."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMEngine:
+    """
+    Runs LLM chains on the event loop within the API's rate limits.
+
+    Requests wait for room in a requests-per-minute and a tokens-per-minute
+    bucket before they are sent. Rate limited (429) and failed (5xx) requests
+    are retried with exponential backoff; a rate limit pauses every request,
+    not just the one that hit it, until the backoff has passed.
+
+    :param rpm: Requests per minute (0 for no limit).
+    :param tpm: Tokens per minute (0 for no limit).
+    """
+
+    def __init__(
+        self,
+        rpm: int = DEFAULT_RPM,
+        tpm: int = DEFAULT_TPM,
+        max_retries: int = MAX_RETRIES,
+        backoff_secs: float = BACKOFF_SECS,
+    ):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.backoff_secs = backoff_secs
+        self.paused_until = 0.0
+        self.metrics: List[RequestMetrics] = []
+
+    @staticmethod
+    def estimate_tokens(input: Any) -> int:
+        return estimate_tokens(str(input)) + RESERVED_TOKENS
+
+    def backoff(self, error: Exception, attempt: int) -> float:
+        delay = retry_after(error)
+        if delay is None:
+            delay = min(MAX_BACKOFF_SECS, self.backoff_secs * 2 ** attempt) * random.uniform(0.5, 1)
+        return delay
+
+    async def run(self, chain, input: Any):
+        """
+        Invoke a chain, retrying when the API is rate limiting or failing, or
+        when its answer can't be parsed.
+        """
+        import openai
+        from langchain_core.exceptions import OutputParserException
+
+        from .cache import used_responses
+
+        estimate = self.estimate_tokens(input)
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            while (pause := self.paused_until - time.monotonic()) > 0:
+                await asyncio.sleep(pause)
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimate)
+
+            usage = _token_usage_handler()()
+            try:
+                with span("request", "llm", attempt=attempt) as request, used_responses() as cached:
+                    result = await chain.ainvoke(input, config={"callbacks": [usage]})
+                    request["args"].update(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+            except OutputParserException:
+                # A malformed answer: forget it, so the retry asks the API again.
+                for cache, key in cached:
+                    cache.drop(key)
+                self.settle(estimate, usage)
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning("LLM answer could not be parsed, retrying...")
+                attempt += 1
+                continue
+            except Exception as e:
+                # A failed request doesn't count against the token limit.
+                self.tokens.take(-estimate)
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.backoff(e, attempt)
+                logger.warning(f"LLM request failed ({type(e).__name__}), retrying in {delay:.1f}s...")
+                if isinstance(e, openai.RateLimitError):
+                    self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                else:
+                    await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            self.settle(estimate, usage)
+            self.metrics.append(RequestMetrics(
+                latency=time.perf_counter() - start,
+                attempts=attempt + 1,
+                prompt_tokens=usage.prompt_tokens,
+                completion_tokens=usage.completion_tokens,
+            ))
+            return result
+
+    def settle(self, estimate: int, usage):
+        """
+        Settle up the estimate with what was really used. No usage means the
+        response came from the LLM cache, without reaching the API.
+        """
+        used = usage.prompt_tokens + usage.completion_tokens
+        self.tokens.take(used - estimate)
+        if not used:
+            self.requests.take(-1)
+
+    async def map(self, chain, inputs: List[Any]) -> List[Any]:
+        """Invoke a chain on every input concurrently, returning the results in order."""
+        return await asyncio.gather(*[self.run(chain, i) for i in inputs])
+
+    def stats(self) -> Dict[str, float]:
+        latencies = sorted(m["latency"] for m in self.metrics)
+        return {
+            "requests": len(self.metrics),
+            "retries": sum(m["attempts"] - 1 for m in self.metrics),
+            "prompt_tokens": sum(m["prompt_tokens"] for m in self.metrics),
+            "completion_tokens": sum(m["completion_tokens"] for m in self.metrics),
+            "median_latency": statistics.median(latencies) if latencies else 0.0,
+            "max_latency": latencies[-1] if latencies else 0.0,
+        }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (
+            f"LLM requests: {stats['requests']} ({stats['retries']} retries), "
+            f"{stats['prompt_tokens']} prompt + {stats['completion_tokens']} completion tokens, "
+            f"latency median {stats['median_latency']:.2f}s max {stats['max_latency']:.2f}s"
+        )
+
+
+_engine: Optional[LLMEngine] = None
+
+
+def set_llm_engine(engine: LLMEngine):
+    """Set the engine LLM chains are run with."""
+    global _engine
+    _engine = engine
+
+
+def get_llm_engine() -> LLMEngine:
+    global _engine
+    if _engine is None:
+        _engine = LLMEngine()
+    return _engine
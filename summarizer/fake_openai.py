@@ -0,0 +1,380 @@
+"""
+A stand-in for the OpenAI API, to load test transcription and summaries
+offline and repeatably:
+
+    tldl fake-openai --latency-ms 800 --rpm 500 --error-rate 0.05
+    tldl summarize --openai-base-url http://127.0.0.1:8089/v1 talk.mp4
+
+Chat completions are answered with schema-valid chapters (citing the cue ids
+of the prompt) or titles, and transcriptions with a cue every few seconds of
+the uploaded audio. Responses take a log-normally distributed time; requests
+over the rate limits get 429s, and a share of the rest 500s.
+"""
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, Optional, Tuple, TypedDict
+
+from .chunking import estimate_tokens
+from .config import FAKE_OPENAI_PORT, LATENCY_MS, LATENCY_SIGMA, TRANSCRIPTION_SPEED
+from .vtt import seconds_to_vtt_time
+
+logger = logging.getLogger(__name__)
+
+# Chapters cite this many cues each, and transcripts have a cue this often.
+CUES_PER_CHAPTER = 20
+CUE_SECS = 4
+# MP3s without a readable header are taken to be this many bits a second.
+FALLBACK_BITRATE = 64000
+
+TITLE_PROMPT = "Create a title for the transcript above"
+SOURCE_ID = re.compile(r"\bid\((\d+)\)\|")
+
+# Words the cues of each stretch of a transcript are made of, so the topic
+# model finds topics to split it by.
+TOPIC_WORDS = [
+    ["orbit", "planet", "gravity", "telescope", "comet", "galaxy", "star", "moon"],
+    ["enzyme", "protein", "cell", "membrane", "genome", "mutation", "tissue", "virus"],
+    ["market", "price", "inflation", "interest", "supply", "demand", "wage", "trade"],
+    ["melody", "rhythm", "chord", "harmony", "tempo", "guitar", "piano", "chorus"],
+    ["compiler", "memory", "thread", "cache", "kernel", "socket", "parser", "queue"],
+]
+TOPIC_SECS = 120
+
+# kbit/s by whether the frame is MPEG-1, and sample rates by MPEG version, of layer III frames.
+MP3_BITRATES = {
+    True: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    False: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+class FakeOpenAIStats(TypedDict):
+    completions: int
+    transcriptions: int
+    rate_limited: int
+    errors: int
+    max_concurrency: int
+
+
+def mp3_duration(data: bytes) -> Optional[float]:
+    """
+    Duration of MP3 audio, from the frame count of its Xing/Info header or,
+    without one, the bitrate of its first frame.
+
+    :return: None when there are no MP3 frames.
+    """
+    start = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        start = 10 + ((data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F))
+
+    i = data.find(b"\xff", start)
+    while 0 <= i < len(data) - 3:
+        version, layer = (data[i + 1] >> 3) & 3, (data[i + 1] >> 1) & 3
+        bitrate_index, rate_index = data[i + 2] >> 4, (data[i + 2] >> 2) & 3
+        if data[i + 1] & 0xE0 == 0xE0 and version != 1 and layer == 1 and 0 < bitrate_index < 15 and rate_index < 3:
+            break
+        i = data.find(b"\xff", i + 1)
+    else:
+        return None
+
+    mpeg1 = version == 3
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    header = data[i:i + 200]
+    for tag in (b"Xing", b"Info"):
+        at = header.find(tag)
+        if at >= 0 and len(header) >= at + 12 and header[at + 7] & 1:
+            frames = int.from_bytes(header[at + 8:at + 12], "big")
+            return frames * (1152 if mpeg1 else 576) / sample_rate
+    return (len(data) - i) * 8 / (MP3_BITRATES[mpeg1][bitrate_index] * 1000)
+
+
+def canned_completion(prompt: str) -> str:
+    """A title for title prompts, otherwise chapters citing the cue ids of the prompt."""
+    if TITLE_PROMPT in prompt:
+        return json.dumps({"title": "A fake title", "description": "A fake description of the sections."})
+
+    ids = [int(i) for i in SOURCE_ID.findall(prompt)] or [0]
+    articles = []
+    for start in range(0, len(ids), CUES_PER_CHAPTER):
+        chapter = ids[start:start + CUES_PER_CHAPTER]
+        half = max(1, len(chapter) // 2)
+        articles.append({
+            "title": f"Cues {chapter[0]} to {chapter[-1]}",
+            "summary": f"What cues {chapter[0]} to {chapter[-1]} were about.",
+            "insights": [
+                {"sourceIds": chapter[:half], "markdown": "The first point, with $x = 3$."},
+                {"sourceIds": chapter[half:] or chapter, "markdown": "The second point."},
+            ],
+        })
+    return json.dumps({"articles": articles})
+
+
+def cue_text(index: int, start: float) -> str:
+    words = TOPIC_WORDS[int(start // TOPIC_SECS) % len(TOPIC_WORDS)]
+    return " ".join(random.Random(index).choices(words, k=6)).capitalize() + "."
+
+
+def canned_transcript(duration: float, response_format: str) -> Tuple[str, str]:
+    """A transcript of `duration` seconds of audio, and its content type."""
+    cues = [
+        (start, min(start + CUE_SECS, duration), cue_text(i, start))
+        for i, start in enumerate(range(0, math.ceil(duration), CUE_SECS))
+    ]
+    if response_format == "vtt":
+        lines = ["WEBVTT", ""]
+        for start, end, text in cues:
+            lines += [f"{seconds_to_vtt_time(start)} --> {seconds_to_vtt_time(end)}", text, ""]
+        return "\n".join(lines), "text/vtt"
+    if response_format == "srt":
+        lines = []
+        for i, (start, end, text) in enumerate(cues, 1):
+            times = [seconds_to_vtt_time(t).replace(".", ",") for t in (start, end)]
+            lines += [str(i), f"{times[0]} --> {times[1]}", text, ""]
+        return "\n".join(lines), "text/plain"
+    text = " ".join(text for _, _, text in cues)
+    if response_format == "text":
+        return text, "text/plain"
+    return json.dumps({"text": text}), "application/json"
+
+
+class FakeOpenAI:
+    """
+    What the fake API answers with, and how: its latencies, rate limits and
+    error rate, and the requests it has seen.
+
+    :param rpm: Requests per minute to allow (0 for no limit).
+    :param tpm: Tokens per minute to allow (0 for no limit).
+    :param error_rate: Share of requests (0-1) to fail with a 500.
+    :param seed: Seed for latencies and errors, for repeatable runs.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = LATENCY_MS,
+        latency_sigma: float = LATENCY_SIGMA,
+        transcription_speed: float = TRANSCRIPTION_SPEED,
+        rpm: int = 0,
+        tpm: int = 0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.transcription_speed = transcription_speed
+        self.rpm = rpm
+        self.tpm = tpm
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # (time, tokens) of the requests let through in the last minute
+        self.window: Deque[Tuple[float, int]] = deque()
+        self.window_tokens = 0
+        self.in_flight = 0
+        self.stats = FakeOpenAIStats(completions=0, transcriptions=0, rate_limited=0, errors=0, max_concurrency=0)
+
+    def latency(self) -> float:
+        """Seconds to take over a response."""
+        with self.lock:
+            return self.latency_ms / 1000 * self.random.lognormvariate(0, self.latency_sigma)
+
+    def fails(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def admit(self, tokens: int) -> Optional[float]:
+        """
+        Let a request through if it is within the rate limits.
+
+        :return: Seconds to wait before retrying when it isn't.
+        """
+        with self.lock:
+            now = time.monotonic()
+            while self.window and self.window[0][0] <= now - 60:
+                self.window_tokens -= self.window.popleft()[1]
+
+            wait = 0.0
+            if self.rpm and len(self.window) >= self.rpm:
+                wait = self.window[len(self.window) - self.rpm][0] + 60 - now
+            if self.tpm and self.window_tokens + tokens > self.tpm:
+                # Until enough of the window's tokens have left it
+                excess = self.window_tokens + min(tokens, self.tpm) - self.tpm
+                for sent, sent_tokens in self.window:
+                    excess -= sent_tokens
+                    if excess <= 0:
+                        wait = max(wait, sent + 60 - now)
+                        break
+            if wait > 0:
+                self.stats["rate_limited"] += 1
+                return wait
+
+            self.window.append((now, tokens))
+            self.window_tokens += tokens
+            return None
+
+    def started(self):
+        with self.lock:
+            self.in_flight += 1
+            self.stats["max_concurrency"] = max(self.stats["max_concurrency"], self.in_flight)
+
+    def finished(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def count(self, stat: str):
+        with self.lock:
+            self.stats[stat] += 1
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """Serves a `FakeOpenAI` under /v1, each request in its own thread."""
+
+    daemon_threads = True
+    # Room for the connections a load test opens at once
+    request_queue_size = 1024
+
+    def __init__(self, address: Tuple[str, int], fake: FakeOpenAI):
+        super().__init__(address, FakeOpenAIHandler)
+        self.fake = fake
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    server: FakeOpenAIServer
+    # Keep connections open, like the API: clients reuse them.
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self.send_json(200, self.server.fake.stats)
+        elif self.path.rstrip("/").endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [{"id": "gpt-3.5-turbo-16k", "object": "model"}, {"id": "whisper-1", "object": "model"}]})
+        else:
+            self.send_error_json(404, f"Unknown URL {self.path}", "invalid_request_error")
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/chat/completions"):
+            answer = self.chat_completions
+        elif path.endswith("/audio/transcriptions"):
+            answer = self.transcriptions
+        else:
+            return self.send_error_json(404, f"Unknown URL {self.path}", "invalid_request_error")
+
+        fake = self.server.fake
+        fake.started()
+        try:
+            answer(body)
+        finally:
+            fake.finished()
+
+    def chat_completions(self, body: bytes):
+        request = json.loads(body)
+        if request.get("stream"):
+            return self.send_error_json(400, "Streaming isn't supported", "invalid_request_error")
+        prompt = "\n".join(str(m.get("content") or "") for m in request.get("messages", []))
+        content = canned_completion(prompt)
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(content)
+
+        if not self.respond_within_limits(prompt_tokens + completion_tokens, self.server.fake.latency()):
+            return
+        self.server.fake.count("completions")
+        self.send_json(200, {
+            "id": f"chatcmpl-fake-{threading.get_ident()}-{time.monotonic_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-3.5-turbo-16k"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+                "logprobs": None,
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    def transcriptions(self, body: bytes):
+        fields = self.form_fields(body)
+        if "file" not in fields:
+            return self.send_error_json(400, "No file uploaded", "invalid_request_error")
+        audio = fields["file"]
+        duration = mp3_duration(audio) or len(audio) * 8 / FALLBACK_BITRATE
+        response_format = (fields.get("response_format") or b"json").decode()
+        if response_format not in ("vtt", "srt", "text", "json", "verbose_json"):
+            return self.send_error_json(400, f"Unknown response_format {response_format}", "invalid_request_error")
+
+        fake = self.server.fake
+        latency = fake.latency() + (duration / fake.transcription_speed if fake.transcription_speed else 0)
+        if not self.respond_within_limits(0, latency):
+            return
+        fake.count("transcriptions")
+        transcript, content_type = canned_transcript(duration, response_format)
+        self.send_body(200, transcript.encode(), content_type)
+
+    def respond_within_limits(self, tokens: int, latency: float) -> bool:
+        """Wait out the latency of a request, unless it is rate limited or chosen to fail."""
+        fake = self.server.fake
+        wait = fake.admit(tokens)
+        if wait is not None:
+            self.send_error_json(429, "Rate limit reached", "requests", "rate_limit_exceeded", {"retry-after": f"{wait:.3f}"})
+            return False
+        time.sleep(latency)
+        if fake.fails():
+            fake.count("errors")
+            self.send_error_json(500, "The server had an error while processing your request", "server_error")
+            return False
+        return True
+
+    def form_fields(self, body: bytes) -> Dict[str, bytes]:
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {self.headers.get('Content-Type', '')}\r\n\r\n".encode() + body
+        )
+        fields = {}
+        for part in message.iter_parts() if message.is_multipart() else []:
+            name = part.get_param("name", header="content-disposition")
+            if name:
+                fields[name] = part.get_payload(decode=True)
+        return fields
+
+    def send_json(self, status: int, data, headers: Optional[Dict[str, str]] = None):
+        self.send_body(status, json.dumps(data).encode(), "application/json", headers)
+
+    def send_error_json(self, status: int, message: str, type: str, code: Optional[str] = None, headers: Optional[Dict[str, str]] = None):
+        self.send_json(status, {"error": {"message": message, "type": type, "param": None, "code": code}}, headers)
+
+    def send_body(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args):
+        logger.debug(format % args)
+
+
+def format_stats(stats: FakeOpenAIStats) -> str:
+    return (
+        f"{stats['completions']} completions, {stats['transcriptions']} transcriptions, "
+        f"{stats['rate_limited']} rate limited, {stats['errors']} errors, "
+        f"at most {stats['max_concurrency']} at once"
+    )
@@ -2,12 +2,17 @@ import logging
 import os
 import subprocess
 import json
+import re
+import tempfile
+from typing import List, Tuple
 
-from .vtt import time_string_to_seconds
+from .trace import traced
+from .vtt import seconds_to_hms
 
 logger = logging.getLogger(__name__)
 
 
+@traced("ffprobe")
 def file_contains_video_or_audio(file_path):
     """
     Uses ffprobe to determine if the file contains video or audio.
@@ -39,6 +44,7 @@ def file_contains_video_or_audio(file_path):
         raise ValueError("Could not parse ffprobe output")
 
 
+@traced("ffmpeg")
 def create_lower_quality_mp3(source_file: str, dir: str):
     """
     Generates a lower quality MP3 file from the source file using FFmpeg.
@@ -77,12 +83,67 @@ def create_lower_quality_mp3(source_file: str, dir: str):
     )
 
 
-def take_snapshot(video_path, start_time, snapshot_path):
-    # Use FFmpeg to take a snapshot at the start time
+# Speech audio is cut in frames of this many seconds, so kept segments starting
+# and ending on multiples of it are kept exactly.
+SPEECH_FRAME_SECS = 0.01
+SPEECH_SAMPLE_RATE = 16000
+
+
+@traced("ffmpeg")
+def create_speech_audio(source_file: str, segments: List[Tuple[float, float]], tempo: float, output_file: str):
+    """
+    Encode the given (start, end) segments of the source's audio, back to back,
+    as mono 16kHz MP3 sped up `tempo` times: all a transcription needs.
+
+    :param segments: In seconds, on multiples of SPEECH_FRAME_SECS.
+    """
+    frame_samples = int(SPEECH_SAMPLE_RATE * SPEECH_FRAME_SECS)
+    # Frames start on multiples of SPEECH_FRAME_SECS, shifting the bounds by
+    # half a frame keeps rounding from picking an extra one.
+    selection = "+".join(
+        f"between(t,{start - SPEECH_FRAME_SECS / 2:.3f},{end - SPEECH_FRAME_SECS / 2:.3f})"
+        for start, end in segments
+    )
+    filters = [
+        f"aformat=channel_layouts=mono:sample_rates={SPEECH_SAMPLE_RATE}",
+        f"asetnsamples=n={frame_samples}:p=0",
+        f"aselect='{selection or 0}'",
+        "asetpts=N/SR/TB",
+    ]
+    if tempo != 1:
+        filters.append(f"atempo={tempo}")
+
+    # The selection can be far longer than a command line argument may be.
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", dir=os.path.dirname(output_file) or None) as script:
+        script.write(",".join(filters))
+        script.flush()
+        command = [
+            "ffmpeg",
+            "-y",
+            "-i", source_file,
+            "-vn",
+            "-filter_script:a", script.name,
+            "-codec:a", "libmp3lame",
+            "-b:a", "24k",
+            output_file,
+        ]
+        logger.debug(f"Running command: ffmpeg -i {source_file} ({len(segments)} segments, {tempo}x) {output_file}")
+        suppress_output = not logger.isEnabledFor(logging.DEBUG)
+        subprocess.run(
+            command,
+            stdout=subprocess.DEVNULL if suppress_output else None,
+            stderr=subprocess.DEVNULL if suppress_output else None,
+            check=True
+        )
+
+
+@traced("ffmpeg")
+def take_snapshot(video_path, start_time: float, snapshot_path):
+    # Use FFmpeg to take a snapshot at the start time (in seconds)
     command = [
         "ffmpeg",
         "-y",
-        "-ss", str(time_string_to_seconds(start_time)),
+        "-ss", str(start_time),
         "-i", video_path,
         "-q:v", "5",
         "-frames:v", "1",
@@ -96,3 +157,217 @@ def take_snapshot(video_path, start_time, snapshot_path):
         stderr=subprocess.DEVNULL if suppress_output else None,
         check=True
     )
+
+
+# Maximum number of timestamps selected by a single ffmpeg invocation. Keeps the
+# select expression well under the kernel's per-argument length limit.
+SNAPSHOT_BATCH_SIZE = 500
+
+
+def take_snapshots(video_path: str, start_times: List[int], snapshot_paths: List[str]):
+    """
+    Take a snapshot at each of the start times while decoding the video once.
+
+    Rather than seeking once per timestamp, the video is sampled at one frame
+    per second and a select filter keeps only the requested seconds. Very long
+    timestamp lists are split into batches, each of which seeks to its first
+    timestamp and decodes up to its last.
+
+    :param video_path: Path to the video file.
+    :param start_times: Sorted start times, in whole seconds.
+    :param snapshot_paths: Destination path for each start time.
+    """
+    for i in range(0, len(start_times), SNAPSHOT_BATCH_SIZE):
+        _take_snapshot_batch(
+            video_path,
+            start_times[i:i + SNAPSHOT_BATCH_SIZE],
+            snapshot_paths[i:i + SNAPSHOT_BATCH_SIZE],
+        )
+
+
+SHOWINFO_TIME = re.compile(r"\[Parsed_showinfo.*\bpts_time:\s*(?P<time>[\d.]+)")
+
+
+def showinfo_times(stderr: str) -> List[float]:
+    """The time of each frame the showinfo filter passed, in output order."""
+    return [float(match.group("time")) for match in map(SHOWINFO_TIME.search, stderr.splitlines()) if match]
+
+
+@traced("ffmpeg", "take_snapshots")
+def _take_snapshot_batch(video_path: str, seconds: List[int], snapshot_paths: List[str]):
+    if not seconds:
+        return
+
+    first, last = seconds[0], seconds[-1]
+    selection = "+".join(f"eq(t,{s - first})" for s in seconds)
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(snapshot_paths[0])) as tmp_dir:
+        command = [
+            "ffmpeg",
+            "-y",
+            "-nostats",
+            "-ss", str(first),
+            "-t", str(last - first + 1),
+            "-i", video_path,
+            "-an",
+            "-vf", f"fps=1:round=up,select='{selection}',showinfo",
+            "-vsync", "vfr",
+            "-q:v", "5",
+            os.path.join(tmp_dir, "%06d.jpg"),
+        ]
+        logger.debug(f"Running command: ffmpeg -ss {first} -i {video_path} ({len(seconds)} timestamps)")
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+
+        # Frames are matched to their timestamps by when they were taken, not
+        # by order: a second the video has no frame for leaves a gap anywhere.
+        paths = dict(zip(seconds, snapshot_paths))
+        taken = set()
+        for time, frame in zip(showinfo_times(result.stderr), sorted(os.listdir(tmp_dir))):
+            second = first + round(time)
+            if second in paths:
+                os.replace(os.path.join(tmp_dir, frame), paths[second])
+                taken.add(second)
+        missing = [s for s in seconds if s not in taken]
+        if missing:
+            logger.warning(
+                f"No snapshot could be extracted from {video_path} at {', '.join(seconds_to_hms(s) for s in missing)}"
+            )
+
+
+@traced("ffmpeg")
+def take_scene_snapshots(video_path: str, threshold: float, min_interval: float, output_dir: str) -> List[Tuple[float, str]]:
+    """
+    Take a snapshot at each visual change of the video, decoding it once.
+
+    A change is a frame whose scene score (how much it differs from the frame
+    before it, 0-1) is over `threshold`. Changes less than `min_interval`
+    seconds after the last snapshot aren't lost: the snapshot is taken once
+    the interval is up, showing the last change. The first snapshot is taken
+    at `min_interval`.
+
+    :return: (time in seconds, path in output_dir) of each snapshot.
+    """
+    # Variable 0 holds whether something changed since the last snapshot.
+    selection = (
+        f"st(0,ld(0)+gt(scene,{threshold})+isnan(prev_selected_t));"
+        f"if(ld(0)*gte(t-if(isnan(prev_selected_t),0,prev_selected_t),{min_interval}),st(0,0)+1,0)"
+    )
+    command = [
+        "ffmpeg",
+        "-y",
+        "-nostats",
+        "-i", video_path,
+        "-an",
+        "-vf", f"select='{selection}',showinfo",
+        "-vsync", "vfr",
+        "-q:v", "5",
+        os.path.join(output_dir, "%06d.jpg"),
+    ]
+    logger.debug(f"Running command: {' '.join(command)}")
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+
+    times = showinfo_times(result.stderr)
+    frames = sorted(os.listdir(output_dir))
+    return [(time, os.path.join(output_dir, frame)) for time, frame in zip(times, frames)]
+
+
+@traced("ffprobe")
+def media_duration(file_path: str) -> float:
+    """Duration of a media file in seconds, from ffprobe."""
+    command = [
+        "ffprobe",
+        "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "json",
+        file_path
+    ]
+
+    logger.debug(f"Running command: {' '.join(command)}")
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    try:
+        return float(json.loads(result.stdout)["format"]["duration"])
+    except (json.JSONDecodeError, KeyError, ValueError):
+        raise ValueError("Could not parse ffprobe output")
+
+
+SILENCE_START = re.compile(r"silence_start: (?P<time>-?[\d.]+)")
+SILENCE_END = re.compile(r"silence_end: (?P<time>[\d.]+)")
+
+
+@traced("ffmpeg")
+def detect_silences(file_path: str, noise: str = "-30dB", min_duration: float = 0.5) -> List[Tuple[float, float]]:
+    """
+    Find the silent stretches of a media file with ffmpeg's silencedetect filter.
+
+    :param noise: Volume below which audio counts as silence.
+    :param min_duration: Shortest silence to report, in seconds.
+    :return: (start, end) of each silence, in seconds.
+    """
+    command = [
+        "ffmpeg",
+        "-i", file_path,
+        "-vn",
+        "-af", f"silencedetect=noise={noise}:d={min_duration}",
+        "-f", "null",
+        "-",
+    ]
+    logger.debug(f"Running command: {' '.join(command)}")
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+
+    silences = []
+    start = None
+    for line in result.stderr.splitlines():
+        match = SILENCE_START.search(line)
+        if match:
+            start = max(0.0, float(match.group("time")))
+            continue
+        match = SILENCE_END.search(line)
+        if match and start is not None:
+            silences.append((start, float(match.group("time"))))
+            start = None
+    return silences
+
+
+@traced("ffmpeg")
+def extract_audio_segment(source_file: str, start: float, end: float, output_file: str):
+    """Copy the audio between start and end (in seconds) to output_file."""
+    command = [
+        "ffmpeg",
+        "-y",
+        "-ss", f"{start:.3f}",
+        "-t", f"{end - start:.3f}",
+        "-i", source_file,
+        "-vn",
+        "-codec:a", "copy",
+        output_file,
+    ]
+    logger.debug(f"Running command: {' '.join(command)}")
+    suppress_output = not logger.isEnabledFor(logging.DEBUG)
+    subprocess.run(
+        command,
+        stdout=subprocess.DEVNULL if suppress_output else None,
+        stderr=subprocess.DEVNULL if suppress_output else None,
+        check=True
+    )
+
+
+@traced("ffprobe")
+def media_info(file_path: str) -> dict:
+    """The format and stream details ffprobe reports for a media file."""
+    command = [
+        "ffprobe",
+        "-v", "error",
+        "-show_entries",
+        "format=duration,format_name:stream=index,codec_type,codec_name,duration,width,height,sample_rate,channels",
+        "-of", "json",
+        file_path
+    ]
+
+    logger.debug(f"Running command: {' '.join(command)}")
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    try:
+        return json.loads(result.stdout)
+    except json.JSONDecodeError:
+        raise ValueError("Could not parse ffprobe output")
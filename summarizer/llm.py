@@ -1,78 +1,308 @@
+import asyncio
+import inspect
+import io
 import logging
 from os.path import dirname
-import time
+import tempfile
 import os
-from typing import Dict, List
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional, Tuple, TypedDict
 import json
-from webvtt import WebVTT
 
-from langchain_openai import ChatOpenAI
-from openai import AsyncOpenAI
+from .compaction import TimeMap, remap_captions
+from .config import LLM_MODEL, TRANSCRIPTION_MODEL
+from .ffmpeg import detect_silences, extract_audio_segment, media_duration
+from .trace import in_thread, traced
+from .transcript import Transcript, write_json_entries
+from .vtt import read_captions, seconds_to_hms, stitch_vtt, write_vtt
 
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+    from openai import AsyncOpenAI
 
-# https://github.com/langchain-ai/langchain/issues/10415 -- you can set this as a parameter
-
-# Chunk size (number of characters times the estimated characters per token)
-CHUNK_SIZE = 12000 * 2
-# CHUNK_SIZE = 3000 * 2
-llm = ChatOpenAI(
-    model="gpt-3.5-turbo-16k"
-    # temperature=0.0,
-    # openai_api_base="http://localhost:8080/v1",
-)
 
 logger = logging.getLogger(__name__)
-openai_client = AsyncOpenAI()
 
+# Largest file the transcription API accepts.
+MAX_TRANSCRIPTION_BYTES = 25 * 1024 * 1024
+# When transcribing in chunks: length of each chunk, how far neighbouring
+# chunks overlap, and how many chunks are transcribed at once.
+TRANSCRIPT_CHUNK_SECS = 600
+TRANSCRIPT_OVERLAP_SECS = 5
+TRANSCRIPT_CONCURRENCY = 4
+
+# Made on first use: importing langchain_openai and openai takes a while, and
+# the clients need OPENAI_API_KEY, which --help or a cached run don't.
+_llm: Optional["ChatOpenAI"] = None
+_openai_client: Optional["AsyncOpenAI"] = None
+# Another OpenAI compatible server to send requests to (--openai-base-url).
+_base_url: Optional[str] = None
+
+
+def set_openai_base_url(base_url: Optional[str]):
+    """Send transcription and LLM requests to `base_url` (None: OpenAI's API)."""
+    global _base_url, _llm, _openai_client
+    _base_url = base_url
+    _llm = _openai_client = None
+
+
+def _client_options() -> Dict[str, str]:
+    if not _base_url:
+        return {}
+    # A local server may not need a key, but the clients insist on one.
+    return {"base_url": _base_url, "api_key": os.environ.get("OPENAI_API_KEY") or "unused"}
+
+
+def get_llm() -> "ChatOpenAI":
+    global _llm
+    if _llm is None:
+        from langchain_openai import ChatOpenAI
 
-def seconds_to_hms(seconds: float) -> str:
-    return time.strftime("%H:%M:%S", time.gmtime(seconds))
+        # https://github.com/langchain-ai/langchain/issues/10415 -- you can set this as a parameter
+        _llm = ChatOpenAI(
+            model=LLM_MODEL,
+            # Retries are left to the rate limit aware LLMEngine.
+            max_retries=0,
+            # temperature=0.0,
+            **_client_options(),
+        )
+    return _llm
 
 
-def convert_transcript_to_json(transcript_path: str) -> List[Dict]:
+def get_openai_client() -> "AsyncOpenAI":
+    global _openai_client
+    if _openai_client is None:
+        from openai import AsyncOpenAI
+
+        _openai_client = AsyncOpenAI(**_client_options())
+    return _openai_client
+
+
+@traced("transcript")
+def convert_transcript_to_json(transcript_path: str) -> Transcript:
     """
     Convert VTT transcript text to JSON format.
     """
-    vtt = WebVTT.read(transcript_path)
-    entries = [
+    transcript = Transcript.from_captions(read_captions(transcript_path))
+    transcript.save_json(f"{dirname(transcript_path)}/transcript.json")
+    return transcript
+
+
+def save_transcript_vtt(transcript: str, dir: str, time_map: Optional[TimeMap] = None):
+    """Save a VTT transcript, moving its cues to source media times when it is of compacted speech."""
+    if time_map:
+        write_vtt(remap_captions(read_captions(io.StringIO(transcript)), time_map), f"{dir}/transcript.vtt")
+    else:
+        with open(f"{dir}/transcript.vtt.partial", "w") as f:
+            f.write(transcript)
+        os.replace(f"{dir}/transcript.vtt.partial", f"{dir}/transcript.vtt")
+
+
+def captions_to_entries(captions, first_id: int = 0) -> List[Dict]:
+    return [
         {
             "id": i,
             "start": seconds_to_hms(caption.start_in_seconds),
             "end": seconds_to_hms(caption.end_in_seconds),
             "text": caption.text.strip(),
         }
-        for i, caption in enumerate(vtt.captions)
+        for i, caption in enumerate(captions, first_id)
     ]
-    with open(f"{dirname(transcript_path)}/transcript.json", "w") as f:
-        f.write(json.dumps(entries, indent=2))
-    return entries
 
 
-async def create_transcript(media_path: str, dir: str) -> List[Dict]:
-    """Use openai speech-to-text to extract audio, and save it to 'dir/transcript.json'"""
+def save_transcript_json(entries: List[Dict], dir: str):
+    write_json_entries(entries, f"{dir}/transcript.json")
+
+
+class TranscriptChunk(TypedDict):
+    start: float
+    end: float
+    owned_start: float
+    owned_end: float
+
+
+def needs_chunking(media_path: str) -> bool:
+    """Is the file too large to transcribe in one request?"""
+    return os.path.getsize(media_path) > MAX_TRANSCRIPTION_BYTES
+
+
+def plan_transcript_chunks(
+    duration: float,
+    silences: List[Tuple[float, float]],
+    chunk_secs: float,
+    overlap_secs: float,
+) -> List[TranscriptChunk]:
+    """
+    Split media into chunks of at most `chunk_secs` (plus overlap).
+
+    Chunks are cut in the middle of a silence when there is one in the second
+    half of the chunk, so that words aren't cut in two. Each chunk extends
+    `overlap_secs` past its cuts on both sides, and 'owns' the time between
+    its cuts: cues starting there are the ones kept from it.
+    """
+    cuts = [0.0]
+    while duration - cuts[-1] > chunk_secs:
+        target = cuts[-1] + chunk_secs
+        middles = [
+            (start + end) / 2 for start, end in silences
+            if target - chunk_secs / 2 <= (start + end) / 2 <= target
+        ]
+        cuts.append(max(middles) if middles else target)
+    cuts.append(duration)
+
+    return [
+        TranscriptChunk(
+            start=max(0.0, owned_start - overlap_secs),
+            end=min(duration, owned_end + overlap_secs),
+            owned_start=owned_start,
+            owned_end=owned_end if owned_end < duration else float("inf"),
+        )
+        for owned_start, owned_end in zip(cuts, cuts[1:])
+    ]
+
+
+@traced("openai", "transcription")
+async def transcribe_audio(client: "AsyncOpenAI", media_path: str) -> str:
+    with open(media_path, "rb") as f:
+        return await client.audio.transcriptions.create(
+            file=f, model=TRANSCRIPTION_MODEL, response_format="vtt"
+        )
+
+
+async def transcribe_chunks(
+    media_path: str,
+    chunk_secs: float = TRANSCRIPT_CHUNK_SECS,
+    overlap_secs: float = TRANSCRIPT_OVERLAP_SECS,
+    concurrency: int = TRANSCRIPT_CONCURRENCY,
+    client: Optional["AsyncOpenAI"] = None,
+) -> AsyncIterator[Tuple[str, TranscriptChunk]]:
+    """
+    Transcribe media in overlapping chunks, `concurrency` chunks at a time.
+
+    Yields the VTT transcript of each chunk in order, as soon as it and all
+    the chunks before it are transcribed.
+    """
+    client = client or get_openai_client()
+    duration = media_duration(media_path)
+    chunks = plan_transcript_chunks(
+        duration, detect_silences(media_path), chunk_secs, overlap_secs
+    )
+    logger.info(f"Transcribing {duration:.0f}s of audio in {len(chunks)} chunks...")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        async def transcribe_chunk(i: int, chunk: TranscriptChunk) -> str:
+            chunk_path = os.path.join(tmp_dir, f"chunk_{i:04}.mp3")
+            async with semaphore:
+                await asyncio.to_thread(
+                    extract_audio_segment, media_path, chunk["start"], chunk["end"], chunk_path
+                )
+                logger.debug(f"Transcribing chunk {i} ({chunk['start']:.1f}s - {chunk['end']:.1f}s)...")
+                return await transcribe_audio(client, chunk_path)
+
+        tasks = [asyncio.ensure_future(transcribe_chunk(i, chunk)) for i, chunk in enumerate(chunks)]
+        try:
+            for task, chunk in zip(tasks, chunks):
+                yield await task, chunk
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def _stitch_piece(transcript: str, chunk: TranscriptChunk) -> Tuple[str, float, float, float]:
+    return (transcript, chunk["start"], chunk["owned_start"], chunk["owned_end"])
+
+
+async def create_chunked_transcript(
+    media_path: str,
+    chunk_secs: float = TRANSCRIPT_CHUNK_SECS,
+    overlap_secs: float = TRANSCRIPT_OVERLAP_SECS,
+    concurrency: int = TRANSCRIPT_CONCURRENCY,
+    client: Optional["AsyncOpenAI"] = None,
+) -> str:
+    """
+    Transcribe media in overlapping chunks, `concurrency` chunks at a time,
+    and stitch the results together into one VTT transcript.
+    """
+    return stitch_vtt([
+        _stitch_piece(transcript, chunk)
+        async for transcript, chunk in transcribe_chunks(
+            media_path, chunk_secs, overlap_secs, concurrency, client
+        )
+    ])
+
+
+async def stream_transcript(
+    media_path: str,
+    dir: str,
+    chunk_secs: float = TRANSCRIPT_CHUNK_SECS,
+    concurrency: int = TRANSCRIPT_CONCURRENCY,
+    client: Optional["AsyncOpenAI"] = None,
+    time_map: Optional[TimeMap] = None,
+) -> AsyncIterator[List[Dict]]:
+    """
+    Transcribe media in chunks, yielding the transcript entries of each chunk
+    as soon as they are available. The complete transcript is saved to
+    'dir/transcript.vtt' and 'dir/transcript.json' once all chunks are done.
+
+    :param time_map: When the media is compacted speech, maps its times back to the source.
+    """
+    pieces = []
+    entries = []
+    async for transcript, chunk in transcribe_chunks(
+        media_path, chunk_secs, TRANSCRIPT_OVERLAP_SECS, concurrency, client
+    ):
+        pieces.append(_stitch_piece(transcript, chunk))
+        captions = read_captions(io.StringIO(stitch_vtt(pieces[-1:])))
+        if time_map:
+            captions = remap_captions(captions, time_map)
+        chunk_entries = captions_to_entries(captions, len(entries))
+        entries.extend(chunk_entries)
+        yield chunk_entries
+
+    logger.info("Saving transcript...")
+    os.makedirs(dir, exist_ok=True)
+    save_transcript_vtt(stitch_vtt(pieces), dir, time_map)
+    save_transcript_json(entries, dir)
+
+
+async def create_transcript(
+    media_path: str,
+    dir: str,
+    chunk_secs: float = 0,
+    concurrency: int = TRANSCRIPT_CONCURRENCY,
+    time_map: Optional[TimeMap] = None,
+) -> Transcript:
+    """
+    Use openai speech-to-text to extract audio, and save it to 'dir/transcript.json'
+
+    :param chunk_secs: When set, transcribe the audio in chunks of this many
+        seconds, `concurrency` at a time.
+    :param time_map: When the media is compacted speech, maps its times back
+        to the source, so the transcript has source media times.
+    """
     if not os.path.exists(f"{dir}/transcript.json"):
-        with open(media_path, "rb") as f:
-            logger.info("Transcribing audio...")
-            transcript = await openai_client.audio.transcriptions.create(
-                file=f, model="whisper-1", response_format="vtt"
+        logger.info("Transcribing audio...")
+        if chunk_secs:
+            transcript = await create_chunked_transcript(
+                media_path, chunk_secs, TRANSCRIPT_OVERLAP_SECS, concurrency
             )
-            logger.info("Transcription complete!")
+        else:
+            transcript = await transcribe_audio(get_openai_client(), media_path)
+        logger.info("Transcription complete!")
 
-            #  Save the transcription to 'dir/transcript.md'
-            logger.info("Saving transcript...")
-            os.makedirs(dir, exist_ok=True)
-
-            with open(f"{dir}/transcript.vtt", "w") as f:
-                f.write(transcript)
-            logger.info("Transcript saved!")
+        #  Save the transcription to 'dir/transcript.md'
+        logger.info("Saving transcript...")
+        os.makedirs(dir, exist_ok=True)
+        save_transcript_vtt(transcript, dir, time_map)
+        logger.info("Transcript saved!")
     else:
         logger.info("Transcript already exists, skipping...")
-        return json.loads(open(f"{dir}/transcript.json").read())
+        return Transcript.load_json(f"{dir}/transcript.json")
 
     return convert_transcript_to_json(f"{dir}/transcript.vtt")
 
 
-def generate_summary(
+async def generate_summary(
     chain,
     dest: str,
     quiet: bool,
@@ -84,12 +314,18 @@ def generate_summary(
 
     logger.info("Generating summary...")
 
-    summaries = chain(llm)
+    summaries = await asyncio.to_thread(in_thread(chain), get_llm())
+    if inspect.isawaitable(summaries):
+        summaries = await summaries
 
     logger.info("Joining summaries, and saving...")
+    save_summary(summaries, dest)
+
+    return summaries
+
+
+def save_summary(summaries: List[Dict], dest: str):
     logger.debug(summaries)
 
     with open(dest, "w") as file:
         file.write(json.dumps(summaries, indent=2))
-
-    return summaries
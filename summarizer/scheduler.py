@@ -0,0 +1,95 @@
+import asyncio
+import inspect
+import logging
+import time
+from typing import Any, Callable, Dict, Optional, Tuple, TypedDict
+
+from .trace import STAGE_CATEGORY, in_thread, span
+
+logger = logging.getLogger(__name__)
+
+
+class StageTiming(TypedDict):
+    start: float
+    duration: float
+
+
+class StageScheduler:
+    """
+    Runs pipeline stages concurrently: each stage starts as soon as the
+    stages it depends on are done.
+
+    A stage is a function called with the results of its dependencies. Plain
+    functions run in a thread so they don't hold up other stages; functions
+    returning an awaitable are awaited on the event loop.
+
+    :param limits: Semaphores bounding how many stages of a kind run at once,
+        by stage name. They can be shared between schedulers, so many files
+        can be processed without oversubscribing the CPU or the network.
+    :param on_done: Called with the name of each stage as it finishes.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, asyncio.Semaphore]] = None,
+        on_done: Optional[Callable[[str], None]] = None,
+    ):
+        self.stages: Dict[str, Tuple[Callable, Tuple[str, ...]]] = {}
+        self.timings: Dict[str, StageTiming] = {}
+        self.limits = limits or {}
+        self.on_done = on_done
+
+    def add(self, name: str, func: Callable, *depends_on: str):
+        """Add a stage. Dependencies must be added first, which keeps the graph acyclic."""
+        missing = [d for d in depends_on if d not in self.stages]
+        if missing:
+            raise ValueError(f"Stage {name} depends on unknown stages: {', '.join(missing)}")
+        self.stages[name] = (func, depends_on)
+
+    async def run(self) -> Dict[str, Any]:
+        """Run all stages, returning the result of each."""
+        started = time.perf_counter()
+        tasks: Dict[str, asyncio.Future] = {}
+
+        async def run_stage(name: str, func: Callable, depends_on: Tuple[str, ...]):
+            args = [await tasks[d] for d in depends_on]
+            limit = self.limits.get(name)
+            if limit:
+                await limit.acquire()
+            try:
+                start = time.perf_counter()
+                logger.debug(f"Starting stage {name}")
+                with span(name, STAGE_CATEGORY):
+                    result = await asyncio.to_thread(in_thread(func), *args)
+                    if inspect.isawaitable(result):
+                        result = await result
+            finally:
+                if limit:
+                    limit.release()
+            self.timings[name] = StageTiming(
+                start=start - started, duration=time.perf_counter() - start
+            )
+            logger.debug(f"Finished stage {name} in {self.timings[name]['duration']:.2f}s")
+            if self.on_done:
+                self.on_done(name)
+            return result
+
+        for name, (func, depends_on) in self.stages.items():
+            tasks[name] = asyncio.ensure_future(run_stage(name, func, depends_on))
+            # Names the stage's lane in traces.
+            tasks[name].set_name(name)
+
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+        return {name: task.result() for name, task in tasks.items()}
+
+    def report(self) -> str:
+        """A table of when each stage started and how long it took."""
+        lines = [f"{'stage':<12} {'start':>8} {'duration':>9}"]
+        for name, timing in sorted(self.timings.items(), key=lambda t: t[1]["start"]):
+            lines.append(f"{name:<12} {timing['start']:>7.2f}s {timing['duration']:>8.2f}s")
+        return "\n".join(lines)
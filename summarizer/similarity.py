@@ -0,0 +1,95 @@
+import logging
+from typing import Dict, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .trace import traced
+
+logger = logging.getLogger(__name__)
+
+# Size snapshots are reduced to before comparing them. Small enough to compare
+# in well under a millisecond, large enough to notice a slide change.
+SIMILARITY_SIZE = (256, 144)
+
+# SSIM window size and stabilizing constants (for 8 bit images).
+WINDOW = 7
+C1 = (0.01 * 255) ** 2
+C2 = (0.03 * 255) ** 2
+
+
+def load_grayscale(path: str, size: Tuple[int, int] = SIMILARITY_SIZE) -> np.ndarray:
+    """Decode an image as a downscaled grayscale float array."""
+    with Image.open(path) as image:
+        # Let the JPEG decoder downscale while decoding, it is much cheaper
+        # than decoding at full size and resizing afterwards.
+        image.draft("L", size)
+        return np.asarray(image.convert("L").resize(size), dtype=np.float64)
+
+
+def _box_mean(image: np.ndarray, window: int) -> np.ndarray:
+    """Mean of every `window` x `window` block (valid region only)."""
+    integral = np.pad(image, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    total = (
+        integral[window:, window:]
+        - integral[:-window, window:]
+        - integral[window:, :-window]
+        + integral[:-window, :-window]
+    )
+    return total / (window * window)
+
+
+def ssim(image1: np.ndarray, image2: np.ndarray, window: int = WINDOW) -> float:
+    """Mean structural similarity of two equally sized grayscale images."""
+    mu1 = _box_mean(image1, window)
+    mu2 = _box_mean(image2, window)
+
+    # Sample (rather than population) covariances, as the reference implementation does.
+    correction = window * window / (window * window - 1)
+    var1 = (_box_mean(image1 * image1, window) - mu1 * mu1) * correction
+    var2 = (_box_mean(image2 * image2, window) - mu2 * mu2) * correction
+    covar = (_box_mean(image1 * image2, window) - mu1 * mu2) * correction
+
+    ssim_map = ((2 * mu1 * mu2 + C1) * (2 * covar + C2)) / (
+        (mu1 * mu1 + mu2 * mu2 + C1) * (var1 + var2 + C2)
+    )
+    return float(ssim_map.mean())
+
+
+def dssim(image1: np.ndarray, image2: np.ndarray) -> float:
+    """Structural dissimilarity, on the same scale as ImageMagick's DSSIM metric."""
+    return (1 - ssim(image1, image2)) / 2
+
+
+class SnapshotComparer:
+    """
+    In-process replacement for `compare -metric DSSIM`.
+
+    Decoded snapshots are kept in memory, so the previous snapshot is decoded
+    only once no matter how many new snapshots it is compared against.
+    """
+
+    def __init__(self, size: Tuple[int, int] = SIMILARITY_SIZE, cache_size: int = 2):
+        self.size = size
+        self.cache_size = cache_size
+        self._cache: Dict[str, np.ndarray] = {}
+
+    def load(self, path: str) -> np.ndarray:
+        if path in self._cache:
+            # Move to the end, so the least recently used entry is evicted first.
+            self._cache[path] = self._cache.pop(path)
+        else:
+            if len(self._cache) >= self.cache_size:
+                # Dicts keep insertion order, the first entry is the oldest.
+                del self._cache[next(iter(self._cache))]
+            self._cache[path] = load_grayscale(path, self.size)
+        return self._cache[path]
+
+    @traced("snapshots", "ssim")
+    def __call__(self, snapshot1_path: str, snapshot2_path: str, percent: int) -> bool:
+        """Check if two snapshots are similar"""
+        normalized_mean_error = dssim(self.load(snapshot1_path), self.load(snapshot2_path))
+        logger.debug(f"DSSIM {snapshot1_path} {snapshot2_path}: {normalized_mean_error}")
+        percentage_diff = (1 - normalized_mean_error) * 100
+
+        return percentage_diff > percent
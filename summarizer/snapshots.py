@@ -1,15 +1,25 @@
+import asyncio
+import concurrent.futures
 import logging
 import json
 import os
 import subprocess
-from typing import Dict, List, TypedDict
+import tempfile
+from typing import Dict, List, Optional, Tuple, TypedDict, Union
 
-from .ffmpeg import take_snapshot
-from .vtt import extract_transcript_start_times, time_string_to_seconds
+import numpy as np
+
+from .ffmpeg import take_scene_snapshots, take_snapshot, take_snapshots
+from .similarity import SnapshotComparer
+from .trace import traced
+from .sprites import SPRITE_PREFIX, SpriteTile, pack_sprites, write_thumbnails_vtt
+from .transcript import Transcript, as_transcript
+from .vtt import extract_transcript_start_times, seconds_to_hms, time_string_to_seconds
 
 logger = logging.getLogger(__name__)
 
 
+@traced("snapshots", "compare")
 def similar_snapshots(snapshot1_path: str, snapshot2_path: str, percent: int):
     """Check if two snapshots are similar"""
     command = [
@@ -30,8 +40,198 @@ def similar_snapshots(snapshot1_path: str, snapshot2_path: str, percent: int):
     return percentage_diff > percent
 
 
+COMPARE_SIMILARITY = "compare"
+SSIM_SIMILARITY = "ssim"
+SIMILARITY_BACKENDS = [COMPARE_SIMILARITY, SSIM_SIMILARITY]
+
+
+def make_similarity_check(backend: str):
+    """
+    Return a `(snapshot1_path, snapshot2_path, percent) -> bool` similarity check.
+
+    'compare' shells out to ImageMagick, 'ssim' compares downscaled grayscale
+    frames in process.
+    """
+    if backend == SSIM_SIMILARITY:
+        return SnapshotComparer()
+    return similar_snapshots
+
+
+SINGLE_PASS_ENGINE = "single-pass"
+PER_TIMESTAMP_ENGINE = "per-timestamp"
+PARALLEL_ENGINE = "parallel"
+SNAPSHOT_ENGINES = [SINGLE_PASS_ENGINE, PER_TIMESTAMP_ENGINE, PARALLEL_ENGINE]
+
+# Where snapshots are taken: at transcript cues, or at visual changes.
+TRANSCRIPT_STRATEGY = "transcript"
+SCENE_STRATEGY = "scene"
+SNAPSHOT_STRATEGIES = [TRANSCRIPT_STRATEGY, SCENE_STRATEGY]
+# Scene score (0-1) over which a frame counts as a visual change. Slide
+# changes score around 0.1-0.4, a moving speaker well under 0.05.
+SCENE_THRESHOLD = 0.1
+
+FILES_OUTPUT = "files"
+SPRITES_OUTPUT = "sprites"
+SNAPSHOT_OUTPUTS = [FILES_OUTPUT, SPRITES_OUTPUT]
+
+
+def snapshot_path_for(dir: str, start_time: float) -> str:
+    return os.path.join(dir, "snapshots", seconds_to_hms(start_time).replace(":", "_") + ".jpg")
+
+
+def snapshot_start_times(transcript: Union[Transcript, List[Dict]]) -> List[int]:
+    """The start time of each cue, in whole seconds (snapshots are named to the second)."""
+    return np.floor(as_transcript(transcript).starts).astype(np.int64).tolist()
+
+
+def candidate_start_times(start_times: List[int], min_interval: float) -> List[int]:
+    """
+    All start times that could become a snapshot.
+
+    Which snapshots are kept depends on the similarity checks, so this is every
+    distinct start time past the first interval -- a superset of the snapshots
+    that will eventually be kept.
+    """
+    return list(dict.fromkeys(t for t in start_times if t >= min_interval))
+
+
+def select_snapshots(
+    start_times: List[int],
+    dir: str,
+    min_interval: float,
+    is_similar,
+    previous: Tuple[float, Optional[str]] = (0, None),
+    known: Optional[List[int]] = None,
+) -> List[int]:
+    """
+    Choose which of the (already extracted) snapshots to keep.
+
+    :param start_times: Start times in seconds.
+    :param previous: (time, path) of the last snapshot kept before these.
+    :param known: Snapshots kept when starting from a different `previous`.
+        Once a snapshot in `known` is kept here too both selections are in the
+        same state, so the rest of `known` is used as is.
+    :return: Start times of the kept snapshots.
+    """
+    previous_snapshot_time, previous_snapshot_path = previous
+    kept = []
+    for start_time in start_times:
+        if (start_time - previous_snapshot_time) < min_interval:
+            continue
+
+        snapshot_path = snapshot_path_for(dir, start_time)
+        if not os.path.exists(snapshot_path):
+            continue
+        if previous_snapshot_path and is_similar(previous_snapshot_path, snapshot_path, 90):
+            continue
+
+        kept.append(start_time)
+        previous_snapshot_time = start_time
+        previous_snapshot_path = snapshot_path
+
+        if known and start_time in known:
+            return kept + known[known.index(start_time) + 1:]
+
+    return kept
+
+
+def split_into_segments(start_times: List[int], count: int) -> List[List[int]]:
+    """Split sorted start times into (at most) `count` equally long stretches of time."""
+    if not start_times:
+        return []
+
+    first = start_times[0]
+    span = start_times[-1] - first + 1
+    segments = [[] for _ in range(count)]
+    for start_time in start_times:
+        index = int((start_time - first) / span * count)
+        segments[index].append(start_time)
+    return [s for s in segments if s]
+
+
+def _snapshot_segment(
+    source_file: str, dir: str, start_times: List[int], min_interval: float, similarity: str, first: bool
+) -> List[int]:
+    """Worker: extract and select the snapshots of one segment."""
+    take_snapshots(source_file, start_times, [snapshot_path_for(dir, t) for t in start_times])
+
+    # Only the first segment knows what came before it, the others are
+    # reconciled once the previous segment is done.
+    previous = (0, None) if first else (float("-inf"), None)
+    return select_snapshots(start_times, dir, min_interval, make_similarity_check(similarity), previous)
+
+
+def reconcile_segments(
+    segments: List[List[int]],
+    segments_kept: List[List[int]],
+    dir: str,
+    min_interval: float,
+    is_similar,
+) -> List[int]:
+    """
+    Join segments that were selected independently into the selection a
+    sequential pass would have made.
+
+    Each segment after the first is re-selected from the real previous
+    snapshot until it agrees with the worker's selection, which is usually
+    within the first snapshot or two.
+    """
+    kept = list(segments_kept[0]) if segments_kept else []
+    for start_times, segment_kept in zip(segments[1:], segments_kept[1:]):
+        previous = (0, None)
+        if kept:
+            previous = (kept[-1], snapshot_path_for(dir, kept[-1]))
+        kept += select_snapshots(start_times, dir, min_interval, is_similar, previous, segment_kept)
+    return kept
+
+
+async def create_snapshots_in_parallel(
+    source_file: str,
+    dir: str,
+    min_interval: float,
+    start_times: List[int],
+    similarity: str = COMPARE_SIMILARITY,
+    workers: Optional[int] = None,
+):
+    """
+    Split the video into segments and extract and select the snapshots of
+    each in a separate process.
+
+    :param start_times: Start times in seconds.
+    :param workers: Number of worker processes (default: number of CPUs).
+    """
+    workers = workers or os.cpu_count() or 1
+    candidates = sorted(candidate_start_times(start_times, min_interval))
+    segments = split_into_segments(candidates, workers)
+    logger.info(f"Extracting {len(candidates)} candidate snapshots in {len(segments)} segments...")
+
+    loop = asyncio.get_running_loop()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        segments_kept = await asyncio.gather(*[
+            loop.run_in_executor(
+                executor, _snapshot_segment, source_file, dir, segment, min_interval, similarity, i == 0
+            )
+            for i, segment in enumerate(segments)
+        ])
+
+    kept = set(await asyncio.to_thread(
+        reconcile_segments, segments, segments_kept, dir, min_interval, make_similarity_check(similarity)
+    ))
+    logger.debug(f"Keeping {len(kept)} of {len(candidates)} snapshots")
+    for start_time in candidates:
+        snapshot_path = snapshot_path_for(dir, start_time)
+        if start_time not in kept and os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+
+
 async def create_snapshots_at_time_increments(
-    source_file: str, dir: str, min_interval: float, transcript: List[Dict[str, str]]
+    source_file: str,
+    dir: str,
+    min_interval: float,
+    transcript: Union[Transcript, List[Dict[str, str]]],
+    engine: str = SINGLE_PASS_ENGINE,
+    similarity: str = COMPARE_SIMILARITY,
+    workers: Optional[int] = None,
 ):
     """
     If the file is a video, create snapshots at the start time of each summary,
@@ -40,58 +240,152 @@ async def create_snapshots_at_time_increments(
     :param source_file: Path to the video file.
     :param dir: Directory to save snapshots.
     :param min_interval: Minimum interval between snapshots in seconds.
+    :param engine: 'single-pass' decodes the video once for all candidate
+        snapshots, 'per-timestamp' runs ffmpeg for each snapshot, 'parallel'
+        decodes segments of the video in separate processes.
+    :param similarity: Similarity backend used to drop repeated snapshots.
+    :param workers: Number of worker processes for the 'parallel' engine.
     """
     if os.path.exists(f"{dir}/snapshots/snapshots.json"):
         logger.info("Snapshots already exists, skipping...")
         return
 
-    start_times = [t["start"] for t in transcript]
+    start_times = snapshot_start_times(transcript)
     logger.debug("Start times: %s", start_times)
 
+    os.makedirs(os.path.join(dir, "snapshots"), exist_ok=True)
+    if engine == PARALLEL_ENGINE:
+        return await create_snapshots_in_parallel(
+            source_file, dir, min_interval, start_times, similarity, workers
+        )
+
+    is_similar = make_similarity_check(similarity)
+
+    # Snapshots extracted up front, and those that haven't been checked yet.
+    extracted = set()
+    if engine == SINGLE_PASS_ENGINE:
+        extracted = {
+            t for t in candidate_start_times(start_times, min_interval)
+            if not os.path.exists(snapshot_path_for(dir, t))
+        }
+        ordered = sorted(extracted)
+        logger.info(f"Extracting {len(ordered)} candidate snapshots in a single pass...")
+        await asyncio.to_thread(
+            take_snapshots, source_file, ordered, [snapshot_path_for(dir, t) for t in ordered]
+        )
+    pending = set(extracted)
+
     previous_snapshot_time = 0
     previous_snapshot_path = None
 
     for start_time in start_times:
-        current_time = time_string_to_seconds(start_time)
-        if (current_time - previous_snapshot_time) < min_interval:
-            logger.debug(f"Skipping snapshot for {current_time}, {min_interval} min_interval not triggered...")
+        if (start_time - previous_snapshot_time) < min_interval:
+            logger.debug(f"Skipping snapshot for {start_time}s, {min_interval} min_interval not triggered...")
             continue  # Skip if the interval is less than the minimum
 
-        snapshot_filename = start_time.replace(":", "_") + ".jpg"
-        snapshot_path = os.path.join(dir, "snapshots", snapshot_filename)
-        if os.path.exists(snapshot_path):
-            logger.info(f"Snapshot for {start_time} already exists, skipping...")
+        snapshot_path = snapshot_path_for(dir, start_time)
+        if start_time in pending:
+            pending.remove(start_time)
+            if not os.path.exists(snapshot_path):
+                logger.debug(f"No frame could be extracted for {start_time}s, skipping...")
+                continue
+        elif start_time in extracted:
+            continue  # Already checked earlier in this run
+        elif os.path.exists(snapshot_path):
+            logger.info(f"Snapshot for {start_time}s already exists, skipping...")
             continue
+        else:
+            await asyncio.to_thread(take_snapshot, source_file, start_time, snapshot_path)
 
-        os.makedirs(os.path.join(dir, "snapshots"), exist_ok=True)
-        take_snapshot(source_file, start_time, snapshot_path)
-
-        if previous_snapshot_path and similar_snapshots(
-            previous_snapshot_path, snapshot_path, 90
+        if previous_snapshot_path and await asyncio.to_thread(
+            is_similar, previous_snapshot_path, snapshot_path, 90
         ):
             logger.debug(
-                f"Snapshot for {start_time} is similar to previous snapshot, removing..."
+                f"Snapshot for {start_time}s is similar to previous snapshot, removing..."
             )
             os.remove(snapshot_path)
             continue
 
-        previous_snapshot_time = current_time
+        previous_snapshot_time = start_time
         previous_snapshot_path = snapshot_path
 
+    # Candidates that were never reached because of the minimum interval.
+    for start_time in pending:
+        snapshot_path = snapshot_path_for(dir, start_time)
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+
+
+def create_scene_snapshots(
+    source_file: str,
+    dir: str,
+    min_interval: float,
+    threshold: float = SCENE_THRESHOLD,
+):
+    """
+    Create snapshots at the visual changes of a video (a new slide, a cut),
+    at least `min_interval` seconds apart, decoding the video once.
+
+    Every snapshot shows something new, so no similarity checks are needed.
+
+    :param threshold: Scene score (0-1) over which a frame counts as a change.
+    """
+    if os.path.exists(f"{dir}/snapshots/snapshots.json"):
+        logger.info("Snapshots already exists, skipping...")
+        return
+
+    os.makedirs(os.path.join(dir, "snapshots"), exist_ok=True)
+    logger.info("Extracting snapshots at scene changes in a single pass...")
+    with tempfile.TemporaryDirectory(dir=os.path.join(dir, "snapshots")) as tmp_dir:
+        snapshots = take_scene_snapshots(source_file, threshold, min_interval, tmp_dir)
+        for seconds, frame_path in snapshots:
+            os.replace(frame_path, snapshot_path_for(dir, seconds))
+    logger.debug(f"Took {len(snapshots)} snapshots at scene changes")
+
 
 class SnapshotDict(TypedDict):
     start: str
     source: str
 
-def create_snapshots_file(dir: str) -> List[SnapshotDict]:
+@traced("snapshots")
+def create_snapshots_file(
+    dir: str, output: str = FILES_OUTPUT, end: Optional[float] = None
+) -> List[Union[SnapshotDict, SpriteTile]]:
+    """
+    List the snapshots in 'dir/snapshots/snapshots.json', in time order, and
+    as a WebVTT thumbnails track in 'dir/snapshots/snapshots.vtt'.
+
+    :param output: 'files' keeps a JPEG per snapshot, 'sprites' packs them
+        into a few sprite sheets and lists where each one is.
+    :param end: When the last snapshot stops showing, in seconds.
+    """
     os.makedirs(os.path.join(dir, "snapshots"), exist_ok=True)
     snapshots_file = os.path.join(dir, "snapshots", "snapshots.json")
-    snapshot_files = [f for f in os.listdir(os.path.join(dir, "snapshots")) if f.endswith(".jpg")]
+    snapshot_files = [
+        f for f in os.listdir(os.path.join(dir, "snapshots"))
+        if f.endswith(".jpg") and not f.startswith(SPRITE_PREFIX)
+    ]
 
     # Generate HTML for each snapshot
-    snapshots_json = [SnapshotDict(start=os.path.splitext(s)[0].replace("_", ":"), source=f"snapshots/{s}") for s in snapshot_files]
+    snapshots_json = sorted(
+        [SnapshotDict(start=os.path.splitext(s)[0].replace("_", ":"), source=f"snapshots/{s}") for s in snapshot_files],
+        key=lambda s: time_string_to_seconds(s["start"]),
+    )
+    if not snapshots_json and os.path.exists(snapshots_file):
+        with open(snapshots_file) as file:
+            listed = json.load(file)
+        if listed and "x" in listed[0]:
+            # Already packed into sprite sheets.
+            return listed
+
+    if output == SPRITES_OUTPUT:
+        snapshots_json = pack_sprites(dir, snapshots_json)
+
     logger.info("Saving snapshots to file...")
-    with open(snapshots_file, "w") as file:
+    # Replaced, not written into: it may be linked from the artifact store.
+    with open(f"{snapshots_file}.partial", "w") as file:
         file.write(json.dumps(snapshots_json, indent=2))
+    os.replace(f"{snapshots_file}.partial", snapshots_file)
+    write_thumbnails_vtt(os.path.join(dir, "snapshots", "snapshots.vtt"), snapshots_json, end)
 
     return snapshots_json
@@ -0,0 +1,108 @@
+import logging
+import math
+import os
+from typing import List, Optional, TypedDict
+
+from PIL import Image
+
+from .trace import traced
+from .vtt import seconds_to_vtt_time, time_string_to_seconds
+
+logger = logging.getLogger(__name__)
+
+# Snapshots are scaled to tiles SPRITE_TILE_WIDTH wide (sharp enough for the
+# expanded player), SPRITE_COLUMNS to a row and SPRITE_ROWS rows to a sheet.
+SPRITE_TILE_WIDTH = 640
+SPRITE_COLUMNS = 5
+SPRITE_ROWS = 5
+SPRITE_QUALITY = 80
+SPRITE_PREFIX = "sprite-"
+
+
+class SpriteTile(TypedDict):
+    start: str
+    source: str
+    x: int
+    y: int
+    width: int
+    height: int
+    sheet_width: int
+    sheet_height: int
+
+
+def sprite_sheet_name(index: int) -> str:
+    return f"{SPRITE_PREFIX}{index:03d}.jpg"
+
+
+@traced("snapshots")
+def pack_sprites(
+    dir: str,
+    snapshots: List[dict],
+    tile_width: int = SPRITE_TILE_WIDTH,
+    columns: int = SPRITE_COLUMNS,
+    rows: int = SPRITE_ROWS,
+) -> List[SpriteTile]:
+    """
+    Pack snapshots into sprite sheets in 'dir/snapshots', removing the
+    individual snapshots.
+
+    :param snapshots: Time sorted snapshots, as listed in snapshots.json.
+    :return: Where each snapshot is in the sheets, in the same order.
+    """
+    if not snapshots:
+        return []
+
+    with Image.open(os.path.join(dir, snapshots[0]["source"])) as first:
+        tile_height = round(tile_width * first.height / first.width)
+
+    tiles = []
+    per_sheet = columns * rows
+    for sheet_index in range(math.ceil(len(snapshots) / per_sheet)):
+        sheet_snapshots = snapshots[sheet_index * per_sheet:(sheet_index + 1) * per_sheet]
+        sheet_width = min(columns, len(sheet_snapshots)) * tile_width
+        sheet_height = math.ceil(len(sheet_snapshots) / columns) * tile_height
+        sheet = Image.new("RGB", (sheet_width, sheet_height))
+        name = sprite_sheet_name(sheet_index)
+
+        for i, snapshot in enumerate(sheet_snapshots):
+            x, y = (i % columns) * tile_width, (i // columns) * tile_height
+            with Image.open(os.path.join(dir, snapshot["source"])) as image:
+                # Decode at (close to) tile size rather than in full.
+                image.draft("RGB", (tile_width, tile_height))
+                sheet.paste(image.convert("RGB").resize((tile_width, tile_height)), (x, y))
+            tiles.append(SpriteTile(
+                start=snapshot["start"],
+                source=f"snapshots/{name}",
+                x=x,
+                y=y,
+                width=tile_width,
+                height=tile_height,
+                sheet_width=sheet_width,
+                sheet_height=sheet_height,
+            ))
+
+        sheet.save(os.path.join(dir, "snapshots", name), quality=SPRITE_QUALITY)
+
+    for snapshot in snapshots:
+        os.remove(os.path.join(dir, snapshot["source"]))
+    logger.info(f"Packed {len(snapshots)} snapshots into {sheet_index + 1} sprite sheets")
+    return tiles
+
+
+def write_thumbnails_vtt(path: str, snapshots: List[dict], end: Optional[float] = None):
+    """
+    Write a WebVTT thumbnails track: each snapshot shows from its start until
+    the next one starts (the last one until `end`), as a file or, for
+    sprites, a "sheet.jpg#xywh=x,y,w,h" region.
+    """
+    lines = ["WEBVTT", ""]
+    starts = [time_string_to_seconds(s["start"]) for s in snapshots]
+    ends = starts[1:] + [max(end or 0, starts[-1] + 1)] if starts else []
+    for snapshot, start, stop in zip(snapshots, starts, ends):
+        image = os.path.basename(snapshot["source"])
+        if "x" in snapshot:
+            image += f"#xywh={snapshot['x']},{snapshot['y']},{snapshot['width']},{snapshot['height']}"
+        lines += [f"{seconds_to_vtt_time(start)} --> {seconds_to_vtt_time(stop)}", image, ""]
+    with open(f"{path}.partial", "w") as f:
+        f.write("\n".join(lines))
+    os.replace(f"{path}.partial", path)
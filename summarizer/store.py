@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from typing import Collection, Dict, Optional
+
+from .config import CACHE_DIR
+from .ffmpeg import media_info
+from .trace import traced
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = os.path.join(CACHE_DIR, "artifacts")
+
+# Bump when the fingerprint changes, so old store entries aren't reused.
+FINGERPRINT_VERSION = 1
+FINGERPRINT_SAMPLES = 16
+FINGERPRINT_SAMPLE_BYTES = 64 * 1024
+
+# Name of the file in an output directory recording which media it was made from.
+SOURCE_FILE = "source.json"
+# Suffix of the record kept next to a stored artifact of what it was made from.
+RECORD_SUFFIX = ".record.json"
+
+
+@traced("store")
+def media_fingerprint(
+    file_path: str,
+    samples: int = FINGERPRINT_SAMPLES,
+    sample_bytes: int = FINGERPRINT_SAMPLE_BYTES,
+) -> str:
+    """
+    A fast fingerprint of a media file's content.
+
+    Rather than hashing the whole (possibly multi-gigabyte) file, this hashes
+    its size, `samples` evenly spaced byte ranges (always including the start
+    and end), and the duration and stream details ffprobe reports.
+    """
+    size = os.path.getsize(file_path)
+    digest = hashlib.sha256(f"v{FINGERPRINT_VERSION}:{size}".encode())
+
+    with open(file_path, "rb") as f:
+        if size <= samples * sample_bytes:
+            digest.update(f.read())
+        else:
+            step = (size - sample_bytes) / (samples - 1)
+            for i in range(samples):
+                f.seek(int(i * step))
+                digest.update(f.read(sample_bytes))
+
+    digest.update(json.dumps(media_info(file_path), sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _link(source: str, dest: str):
+    """Hard link source to dest (copying when that isn't possible)."""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copy2(source, dest)
+
+
+def _link_tree(source: str, dest: str):
+    if os.path.isdir(source):
+        for name in os.listdir(source):
+            _link_tree(os.path.join(source, name), os.path.join(dest, name))
+    elif not os.path.exists(dest):
+        _link(source, dest)
+
+
+class ArtifactStore:
+    """
+    Artifacts (audio, transcripts, snapshots) shared between output
+    directories, keyed by the fingerprint of the media they were made from.
+
+    Output directories get hard links to the stored artifacts, so the same
+    recording is only encoded, transcribed and snapshotted once no matter
+    what it is called or where it is.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+
+    def entry_path(self, fingerprint: str) -> str:
+        return os.path.join(self.path, fingerprint[:2], fingerprint)
+
+    def link_into(
+        self, fingerprint: str, dir: str, artifacts: Dict[str, str], recorded: Collection[str] = ()
+    ) -> Dict[str, Optional[dict]]:
+        """
+        Link stored artifacts into an output directory.
+
+        :param artifacts: Maps names in the output directory to names in the store.
+        :param recorded: Artifacts that are only linked along with the record
+            of what they were made from (see `save_from`).
+        :return: The record of each artifact linked (None for the rest).
+        """
+        linked = {}
+        for name, stored_name in artifacts.items():
+            stored = os.path.join(self.entry_path(fingerprint), stored_name)
+            target = os.path.join(dir, name)
+            if not os.path.exists(stored) or os.path.exists(target):
+                continue
+            record = None
+            if name in recorded:
+                if not os.path.exists(stored + RECORD_SUFFIX):
+                    logger.info(f"Not reusing {stored}: there's no record of what it was made from")
+                    continue
+                with open(stored + RECORD_SUFFIX) as f:
+                    record = json.load(f)
+            logger.info(f"Reusing {name} from {stored}")
+            _link_tree(stored, target)
+            linked[name] = record
+        return linked
+
+    def save_from(self, fingerprint: str, dir: str, artifacts: Dict[str, str], records: Optional[Dict[str, dict]] = None):
+        """
+        Add an output directory's artifacts to the store (if it doesn't have them yet).
+
+        :param records: What artifacts were made from, by name in the output
+            directory, to store with them.
+        """
+        for name, stored_name in artifacts.items():
+            source = os.path.join(dir, name)
+            stored = os.path.join(self.entry_path(fingerprint), stored_name)
+            if not os.path.exists(source) or os.path.exists(stored):
+                continue
+
+            logger.info(f"Storing {name} in {stored}")
+            if records and name in records:
+                # Before the artifact: an artifact is only linked with its record.
+                os.makedirs(os.path.dirname(stored), exist_ok=True)
+                with open(f"{stored}{RECORD_SUFFIX}.partial", "w") as f:
+                    f.write(json.dumps(records[name], indent=2))
+                os.replace(f"{stored}{RECORD_SUFFIX}.partial", stored + RECORD_SUFFIX)
+            # Build it next to its final location first, so a half written
+            # artifact is never picked up.
+            partial = f"{stored}.partial-{os.getpid()}"
+            _link_tree(source, partial)
+            try:
+                os.replace(partial, stored)
+            except OSError:
+                # Another run stored it first.
+                shutil.rmtree(partial, ignore_errors=True)
+
+
+def read_source(dir: str) -> Optional[dict]:
+    """The media an output directory was made from, if recorded."""
+    path = os.path.join(dir, SOURCE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_source(dir: str, file_path: str, fingerprint: str):
+    os.makedirs(dir, exist_ok=True)
+    with open(os.path.join(dir, SOURCE_FILE), "w") as f:
+        f.write(json.dumps({"path": os.path.abspath(file_path), "fingerprint": fingerprint}, indent=2))
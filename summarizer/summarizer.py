@@ -1,4 +1,7 @@
 import asyncio
+import contextlib
+import html
+import json
 import logging
 import os
 import shutil
@@ -6,18 +9,71 @@ import subprocess
 import sys
 from functools import wraps
 from html.parser import HTMLParser
+from typing import TYPE_CHECKING, Callable, Dict, Optional
 
 import click
 
-from .ffmpeg import create_lower_quality_mp3, file_contains_video_or_audio
+from .artifacts import ArtifactManifest, StageInputs, file_digest
+from .compaction import MAX_TEMPO, MIN_TEMPO, SPEECH_AUDIO, SPEECH_MAP, TimeMap, create_compact_speech
+from .compress import compress_artifacts
+from .ffmpeg import create_lower_quality_mp3, file_contains_video_or_audio, media_duration
 from .ffmpeg import logger as ffmpeg_logger
-from .templates import make_time_chain, run_clif_chain, make_title_chain
 from .snapshots import (
+    COMPARE_SIMILARITY,
+    SIMILARITY_BACKENDS,
+    SNAPSHOT_ENGINES,
+    SINGLE_PASS_ENGINE,
+    SNAPSHOT_OUTPUTS,
+    FILES_OUTPUT,
+    SCENE_STRATEGY,
+    SCENE_THRESHOLD,
+    SNAPSHOT_STRATEGIES,
+    TRANSCRIPT_STRATEGY,
+    create_scene_snapshots,
     create_snapshots_at_time_increments,
     create_snapshots_file,
     logger as snapshots_logger,
 )
-from .llm import create_transcript, generate_summary, convert_transcript_to_json
+from .batch import FAILED, MANIFEST_FILE, BatchManifest, find_media_files, run_batch
+from .config import (
+    CHUNK_TOKENS,
+    DEFAULT_CACHE_PATH,
+    DEFAULT_MAX_BYTES,
+    DEFAULT_RPM,
+    DEFAULT_TPM,
+    FAKE_OPENAI_PORT,
+    LATENCY_MS,
+    LATENCY_SIGMA,
+    LLM_MODEL,
+    SUMMARY_PROMPT_VERSION,
+    TITLE_PROMPT_VERSION,
+    TRANSCRIPTION_MODEL,
+    TRANSCRIPTION_SPEED,
+)
+from .scheduler import StageScheduler
+from .trace import SamplingProfiler, start_tracing, stop_tracing
+from .transcript import Transcript
+from .vtt import read_captions, write_vtt
+from .store import DEFAULT_STORE_PATH, ArtifactStore, media_fingerprint, read_source, write_source
+from .llm import (
+    TRANSCRIPT_CHUNK_SECS,
+    TRANSCRIPT_CONCURRENCY,
+    create_transcript,
+    generate_summary,
+    convert_transcript_to_json,
+    get_llm,
+    needs_chunking,
+    save_summary,
+    set_openai_base_url,
+    stream_transcript,
+)
+
+# The templates (langchain), the LLM engine (openai) and the LLM cache are
+# imported when they are first needed, which keeps --help and runs over cached
+# artifacts quick.
+if TYPE_CHECKING:
+    from .cache import LLMCache
+    from .engine import LLMEngine
 
 
 logger = logging.getLogger(__name__)
@@ -42,36 +98,55 @@ def coro(f):
     return wrapper
 
 
-async def update_html(dir: str, output_path: str, title: str, title_data, chapters, snapshots, transcript):
-    """Generate an index.html and dir-name html file for the directory"""
+def script_json(value) -> str:
+    """JSON to embed in a <script>, with "<" escaped so no string in it can end the script."""
+    return json.dumps(value).replace("<", "\\u003c")
+
+
+def render_html(title: str, title_data, chapters, snapshots, transcript) -> str:
+    return HTML_TEMPLATE.format(
+        title=html.escape(str(title_data.get("title", title))),
+        description=html.escape(str(title_data["description"])),
+        chapters=script_json(chapters),
+        transcript=script_json(transcript),
+        snapshots=script_json(snapshots),
+    )
+
+
+def link_or_copy(source: str, dest: str):
+    """Replace dest with a hard link to source (or a copy, where links aren't supported)."""
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copyfile(source, dest)
+
+
+async def update_html(dir: str, output_path: str, title: str, title_data, chapters, snapshots, transcript, compress: bool = False):
+    """
+    Generate an index.html and dir-name html file for the directory
+
+    :param compress: Also write .gz (and .br) copies of the served HTML and JSON artifacts.
+    """
     index_path = os.path.join(dir, "index.html")
     dir_path = os.path.join(dir, f"{output_path}.html")
 
     logger.info("Generating index.html...")
+    page = render_html(title, title_data, chapters, snapshots, transcript.to_entries())
 
     logger.info(f"Index path: {index_path}")
-    with open(index_path, "w") as file:
-        file.write(
-            HTML_TEMPLATE.format(
-                title=title_data.get("title", title),
-                description=title_data["description"],
-                chapters=chapters,
-                transcript=transcript,
-                snapshots=snapshots,
-            )
-        )
+    # Written aside and moved into place: index.html may be linked to the page
+    # of another template, which mustn't change.
+    with open(f"{index_path}.partial", "w") as file:
+        file.write(page)
+    os.replace(f"{index_path}.partial", index_path)
 
     logger.info(f"Dir HTML path: {dir_path}")
-    with open(dir_path, "w") as file:
-        file.write(
-            HTML_TEMPLATE.format(
-                title=title_data.get("title", title),
-                description=title_data["description"],
-                chapters=chapters,
-                transcript=transcript,
-                snapshots=snapshots,
-            )
-        )
+    link_or_copy(index_path, dir_path)
+
+    if compress:
+        await asyncio.to_thread(compress_artifacts, dir)
 
 
 class SummaryHTMLParser(HTMLParser):
@@ -95,33 +170,68 @@ def extract_summary_start_times(dir: str):
     return parser.start_times
 
 
-async def update_transcript(dirname: str, quiet: bool, transcript: str):
+async def update_transcript(
+    dirname: str,
+    quiet: bool,
+    transcript: str,
+    chunk_secs: Optional[int] = None,
+    concurrency: int = TRANSCRIPT_CONCURRENCY,
+    time_map: Optional[TimeMap] = None,
+):
     print("Creating transcript...") if not quiet else None
-    transcript_json = []
+    transcript_json = Transcript.from_entries([])
     if transcript:
         logger.info(f"Using supplied transcript: {transcript}")
         os.makedirs(dirname, exist_ok=True)
-        if transcript != f"{dirname}/transcript.vtt":
-            shutil.copy(transcript, f"{dirname}/transcript.vtt")
+        if transcript.lower().endswith(".srt"):
+            write_vtt(read_captions(transcript), f"{dirname}/transcript.vtt")
+        elif transcript != f"{dirname}/transcript.vtt":
+            # Replaced, not written into: it may be linked from the artifact store.
+            shutil.copy(transcript, f"{dirname}/transcript.vtt.partial")
+            os.replace(f"{dirname}/transcript.vtt.partial", f"{dirname}/transcript.vtt")
         transcript_json = convert_transcript_to_json(f"{dirname}/transcript.vtt")
     elif not os.path.exists(f"{dir}/transcript.json"):
         print("Generating transcript...") if not quiet else None
-        transcript_json = await create_transcript(f"{dirname}/audio.mp3", dirname)
+        audio_path = f"{dirname}/{SPEECH_AUDIO}" if time_map else f"{dirname}/audio.mp3"
+        if chunk_secs is None:
+            chunk_secs = TRANSCRIPT_CHUNK_SECS if needs_chunking(audio_path) else 0
+        transcript_json = await create_transcript(audio_path, dirname, chunk_secs, concurrency, time_map)
     return transcript_json
 
 
-async def update_snapshots(dirname: str, file_path: str, has_video: bool, quiet: bool, snapshot_min_secs: int, transcript_json):
+async def update_snapshots(dirname: str, file_path: str, has_video: bool, quiet: bool, snapshot_min_secs: int, transcript_json, snapshot_engine: str = SINGLE_PASS_ENGINE, snapshot_similarity: str = COMPARE_SIMILARITY, snapshot_workers: Optional[int] = None, snapshot_output: str = FILES_OUTPUT, snapshot_strategy: str = TRANSCRIPT_STRATEGY, scene_threshold: float = SCENE_THRESHOLD):
+    """
+    :param transcript_json: The transcript, None with the 'scene' strategy
+        (which doesn't wait for it).
+    """
     if has_video:
         print("Generating snapshots...") if not quiet else None
-        await create_snapshots_at_time_increments(file_path, dirname, snapshot_min_secs, transcript_json)
-    return create_snapshots_file(dirname)
+        if snapshot_strategy == SCENE_STRATEGY:
+            await asyncio.to_thread(create_scene_snapshots, file_path, dirname, snapshot_min_secs, scene_threshold)
+        else:
+            await create_snapshots_at_time_increments(file_path, dirname, snapshot_min_secs, transcript_json, snapshot_engine, snapshot_similarity, snapshot_workers)
+
+    end = None
+    if transcript_json is not None and len(transcript_json):
+        end = float(transcript_json.ends[-1])
+    elif has_video:
+        end = await asyncio.to_thread(media_duration, file_path)
+    return await asyncio.to_thread(create_snapshots_file, dirname, snapshot_output, end)
 
 
-def update_summary(dirname: str, quiet: bool, transcript_type: str, transcript_json):
+def update_summary(dirname: str, quiet: bool, transcript_type: str, transcript_json, chunk_tokens: int = CHUNK_TOKENS, topic_workers: int = 0):
+    # The templates are imported once the chain runs: generate_summary doesn't
+    # run it when the summary is already there.
     if transcript_type == "time":
-        chain = make_time_chain(transcript_json)
+        def chain(model):
+            from .templates import make_time_chain
+
+            return make_time_chain(transcript_json, chunk_tokens=chunk_tokens, topic_workers=topic_workers)(model)
     elif transcript_type == "clif":
-        chain = run_clif_chain
+        def chain(model):
+            from .templates import run_clif_chain
+
+            return run_clif_chain(model)
     else:
         print(f"Template {transcript_type} not found, exiting...") if not quiet else None
         return sys.exit(1)
@@ -135,11 +245,146 @@ def update_summary(dirname: str, quiet: bool, transcript_type: str, transcript_j
     )
 
 
-def update_title(dirname: str, quiet: bool, chapters_json):
+async def update_streaming_summary(
+    dirname: str,
+    quiet: bool,
+    chunk_secs: Optional[int] = None,
+    concurrency: int = TRANSCRIPT_CONCURRENCY,
+    chunk_tokens: int = CHUNK_TOKENS,
+    topic_workers: int = 0,
+    time_map: Optional[TimeMap] = None,
+):
+    """
+    Generate the transcript and the 'time' summary together: chapters are
+    summarized as soon as their part of the transcript is ready.
+    """
+    from .templates import stream_time_chain
+
+    print("Generating transcript and summary...") if not quiet else None
+    audio_path = f"{dirname}/{SPEECH_AUDIO}" if time_map else f"{dirname}/audio.mp3"
+    cue_batches = stream_transcript(
+        audio_path, dirname, chunk_secs or TRANSCRIPT_CHUNK_SECS, concurrency, time_map=time_map
+    )
+    transcript_json, chapters_json = await stream_time_chain(
+        cue_batches, get_llm(), chunk_tokens=chunk_tokens, topic_workers=topic_workers
+    )
+    save_summary(chapters_json, os.path.join(dirname, "chapters-time.json"))
+    return Transcript.from_entries(transcript_json), chapters_json
+
+
+def update_title(dirname: str, quiet: bool, chapters_json, chunk_tokens: int = CHUNK_TOKENS):
     print("Generating title...") if not quiet else None
-    return generate_summary(
-        make_title_chain(chapters_json), os.path.join(dirname, "title.json"), quiet
+
+    def chain(model):
+        from .templates import make_title_chain
+
+        return make_title_chain(chapters_json, chunk_tokens=chunk_tokens)(model)
+
+    return generate_summary(chain, os.path.join(dirname, "title.json"), quiet)
+
+
+def stored_artifacts(transcript: str, has_video: bool, snapshot_min_secs: int, snapshot_output: str = FILES_OUTPUT, compact_speech: bool = False, speech_tempo: float = MIN_TEMPO, snapshot_strategy: str = TRANSCRIPT_STRATEGY, scene_threshold: float = SCENE_THRESHOLD, snapshot_similarity: str = COMPARE_SIMILARITY) -> Dict[str, str]:
+    """
+    Artifacts shared through the artifact store: output directory name ->
+    store name. Store names include whatever else the artifact is made from,
+    so runs with other options (or another supplied transcript) don't share it.
+    """
+    artifacts = {"audio.mp3": "audio.mp3"}
+    if not transcript:
+        # Only generated transcripts are shared, supplied ones may differ per run.
+        artifacts["transcript.vtt"] = "transcript.vtt"
+        artifacts["transcript.json"] = "transcript.json"
+        if compact_speech:
+            artifacts[SPEECH_AUDIO] = f"speech-{speech_tempo:g}x.mp3"
+            artifacts[SPEECH_MAP] = f"speech-{speech_tempo:g}x.json"
+    if has_video:
+        if snapshot_strategy == TRANSCRIPT_STRATEGY:
+            # Snapshots are taken at the transcript's cues.
+            suffix = "" if snapshot_similarity == COMPARE_SIMILARITY else f"-{snapshot_similarity}"
+            suffix += f"-transcript{file_digest(transcript)[:12]}" if transcript else ""
+        else:
+            suffix = f"-{snapshot_strategy}{scene_threshold:g}"
+        suffix += "" if snapshot_output == FILES_OUTPUT else f"-{snapshot_output}"
+        artifacts["snapshots"] = f"snapshots-{snapshot_min_secs}s{suffix}"
+    return artifacts
+
+
+def stage_inputs(dirname: str, template: str, transcript: Optional[str], has_video: bool, snapshot_min_secs: int, snapshot_similarity: str = COMPARE_SIMILARITY, snapshot_output: str = FILES_OUTPUT, snapshot_strategy: str = TRANSCRIPT_STRATEGY, scene_threshold: float = SCENE_THRESHOLD, chunk_tokens: int = CHUNK_TOKENS) -> Dict[str, StageInputs]:
+    """
+    What the artifacts of each stage are made from, upstream stages first
+    (see `ArtifactManifest`).
+
+    How the work is done (chunking, compacted speech, engines, workers)
+    isn't recorded, only what changes the result. The audio is only ever
+    made from the source, which the output directory is already tied to.
+    """
+    source = read_source(dirname)
+    stages = {
+        # A supplied transcript may be the transcript.vtt of the directory,
+        # which mustn't be removed.
+        "transcript": StageInputs(
+            outputs=["transcript.json"],
+            params={"supplied": file_digest(transcript)},
+            upstream=[],
+        ) if transcript else StageInputs(
+            outputs=["transcript.json", "transcript.vtt"],
+            params={"source": source and source["fingerprint"], "model": TRANSCRIPTION_MODEL},
+            upstream=[],
+        ),
+        "summary": StageInputs(
+            outputs=[f"chapters-{template}.json"],
+            params={
+                "template": template,
+                "chunk_tokens": chunk_tokens,
+                "model": LLM_MODEL,
+                "prompt": SUMMARY_PROMPT_VERSION,
+            },
+            upstream=["transcript"],
+        ),
+    }
+    if has_video:
+        scene = snapshot_strategy == SCENE_STRATEGY
+        stages["snapshots"] = StageInputs(
+            outputs=["snapshots/snapshots.json", "snapshots"],
+            params={
+                "min_secs": snapshot_min_secs,
+                "strategy": snapshot_strategy,
+                "output": snapshot_output,
+                **({"scene_threshold": scene_threshold} if scene else {"similarity": snapshot_similarity}),
+            },
+            upstream=[] if scene else ["transcript"],
+        )
+    stages["title"] = StageInputs(
+        outputs=["title.json"],
+        params={"chunk_tokens": chunk_tokens, "model": LLM_MODEL, "prompt": TITLE_PROMPT_VERSION},
+        upstream=["summary"],
     )
+    return stages
+
+
+# Stages bound by the CPU (ffmpeg), and those waiting on the OpenAI API.
+CPU_STAGES = ["audio", "speech", "snapshots"]
+NETWORK_STAGES = ["streaming", "transcript", "summary", "title"]
+
+
+def stage_limits(cpu_workers: int, network_workers: int) -> Dict[str, asyncio.Semaphore]:
+    """Semaphores shared by every file of a batch, limiting how many CPU and network bound stages run at once."""
+    cpu = asyncio.Semaphore(cpu_workers)
+    network = asyncio.Semaphore(network_workers)
+    return {
+        **{stage: cpu for stage in CPU_STAGES},
+        **{stage: network for stage in NETWORK_STAGES},
+    }
+
+
+def update_audio(file_path: str, dirname: str, quiet: bool):
+    print("Generating audio sample...") if not quiet else None
+    create_lower_quality_mp3(file_path, dirname)
+
+
+def update_speech(file_path: str, dirname: str, quiet: bool, tempo: float) -> TimeMap:
+    print("Compacting speech...") if not quiet else None
+    return create_compact_speech(file_path, dirname, tempo)
 
 
 async def update_all(
@@ -151,106 +396,693 @@ async def update_all(
     snapshot_min_secs: int,
     has_video: bool,
     quiet: bool,
+    *,
+    snapshot_engine: str = SINGLE_PASS_ENGINE,
+    snapshot_similarity: str = COMPARE_SIMILARITY,
+    snapshot_workers: Optional[int] = None,
+    snapshot_output: str = FILES_OUTPUT,
+    transcribe_chunk_secs: Optional[int] = None,
+    transcribe_concurrency: int = TRANSCRIPT_CONCURRENCY,
+    stream: bool = False,
+    limits: Optional[Dict[str, asyncio.Semaphore]] = None,
+    on_stage_done: Optional[Callable[[str], None]] = None,
+    chunk_tokens: int = CHUNK_TOKENS,
+    topic_workers: int = 0,
+    compress: bool = False,
+    compact_speech: bool = False,
+    speech_tempo: float = MIN_TEMPO,
+    snapshot_strategy: str = TRANSCRIPT_STRATEGY,
+    scene_threshold: float = SCENE_THRESHOLD,
 ):
-    transcript_json = await update_transcript(dirname, quiet, transcript)
+    r"""
+    Run every stage of the summary, each one as soon as its inputs are ready:
 
-    snapshots_json = await update_snapshots(dirname, file_path, has_video, quiet, snapshot_min_secs, transcript_json)
+    audio -> transcript -> summary -> title -> html
+                       \-> snapshots ---------/
 
-    chapters_json = update_summary(dirname, quiet, template, transcript_json)
+    A supplied transcript doesn't need the audio, so snapshots can be taken
+    while the audio is still being encoded. Snapshots at scene changes don't
+    need the transcript at all, and are taken while it is being made.
 
-    title_json = update_title(dirname, quiet, chapters_json)
+    :param limits: Semaphores bounding how many of each stage run at once (see `stage_limits`).
+    :param on_stage_done: Called with the name of each stage as it finishes.
+    :param compress: Write .gz (and .br) copies of the served HTML and JSON artifacts.
+    :param compact_speech: Transcribe audio with the long silences cut (and
+        sped up `speech_tempo` times) rather than the full audio.
+    """
+    # Artifacts made from other inputs than this run's are removed first, so
+    # the stages below make them again.
+    inputs = stage_inputs(
+        dirname,
+        template,
+        transcript,
+        has_video,
+        snapshot_min_secs,
+        snapshot_similarity=snapshot_similarity,
+        snapshot_output=snapshot_output,
+        snapshot_strategy=snapshot_strategy,
+        scene_threshold=scene_threshold,
+        chunk_tokens=chunk_tokens,
+    )
+    manifest = ArtifactManifest(dirname)
+    for stage, reason in manifest.invalidate(inputs).items():
+        print(f"Remaking {stage}: {reason}") if not quiet else None
+
+    def stage_done(name: str):
+        if name in inputs:
+            manifest.record(name, inputs)
+        if on_stage_done:
+            on_stage_done(name)
+
+    # Streaming only applies when both the transcript and the summary are still to be made.
+    stream = (
+        stream
+        and template == "time"
+        and not transcript
+        and not os.path.exists(f"{dirname}/transcript.json")
+        and not os.path.exists(f"{dirname}/chapters-{template}.json")
+    )
+
+    # So does compacting speech.
+    compact_speech = (
+        compact_speech
+        and not transcript
+        and not os.path.exists(f"{dirname}/transcript.json")
+    )
+    # Transcription starts as soon as the audio it needs is there, and gets
+    # the time map of compacted speech (the audio stage returns None).
+    transcribed_audio = "speech" if compact_speech else "audio"
+
+    stages = StageScheduler(limits, stage_done)
+    stages.add("audio", lambda: update_audio(file_path, dirname, quiet))
+    if compact_speech:
+        stages.add("speech", lambda: update_speech(file_path, dirname, quiet, speech_tempo))
+    if stream:
+        stages.add(
+            "streaming",
+            lambda time_map: update_streaming_summary(dirname, quiet, transcribe_chunk_secs, transcribe_concurrency, chunk_tokens, topic_workers, time_map),
+            transcribed_audio,
+        )
+        stages.add("transcript", lambda streamed: streamed[0], "streaming")
+        stages.add("summary", lambda streamed: streamed[1], "streaming")
+    else:
+        stages.add(
+            "transcript",
+            lambda time_map=None: update_transcript(dirname, quiet, transcript, transcribe_chunk_secs, transcribe_concurrency, time_map),
+            *([] if transcript else [transcribed_audio]),
+        )
+        stages.add(
+            "summary",
+            lambda transcript_json: update_summary(dirname, quiet, template, transcript_json, chunk_tokens, topic_workers),
+            "transcript",
+        )
+    stages.add(
+        "snapshots",
+        lambda transcript_json=None: update_snapshots(dirname, file_path, has_video, quiet, snapshot_min_secs, transcript_json, snapshot_engine, snapshot_similarity, snapshot_workers, snapshot_output, snapshot_strategy, scene_threshold),
+        *([] if snapshot_strategy == SCENE_STRATEGY else ["transcript"]),
+    )
+    stages.add("title", lambda chapters_json: update_title(dirname, quiet, chapters_json, chunk_tokens), "summary")
 
     last_dir = os.path.basename(os.path.dirname(dirname + "/fake.txt"))
-    await update_html(dirname, f"{last_dir}-{template}", title, title_json, chapters_json, snapshots_json, transcript_json)
+    stages.add(
+        "html",
+        lambda title_json, chapters_json, snapshots_json, transcript_json: update_html(dirname, f"{last_dir}-{template}", title, title_json, chapters_json, snapshots_json, transcript_json, compress),
+        "title",
+        "summary",
+        "snapshots",
+        "transcript",
+    )
+
+    await stages.run()
+    print(stages.report()) if not quiet else None
+
+
+def output_dirname_for(file_path: str, output: Optional[str]) -> str:
+    output = output if output else "."
+    output_dirname = "_".join(os.path.basename(file_path).split(".")[0:-1]).replace(
+        " ", "_"
+    )
+    return f"{output}/{output_dirname}"
+
+
+async def summarize_file(
+    file_path: str,
+    output: Optional[str] = None,
+    transcript: Optional[str] = None,
+    title: Optional[str] = None,
+    template: str = "time",
+    quiet: bool = False,
+    snapshots: bool = True,
+    snapshot_min_secs: int = 5,
+    snapshot_engine: str = SINGLE_PASS_ENGINE,
+    snapshot_similarity: str = COMPARE_SIMILARITY,
+    snapshot_workers: Optional[int] = None,
+    snapshot_output: str = FILES_OUTPUT,
+    transcribe_chunk_secs: Optional[int] = None,
+    transcribe_concurrency: int = TRANSCRIPT_CONCURRENCY,
+    stream: bool = False,
+    store: bool = True,
+    store_path: str = DEFAULT_STORE_PATH,
+    chunk_tokens: int = CHUNK_TOKENS,
+    topic_workers: int = 0,
+    compress: bool = False,
+    compact_speech: bool = False,
+    speech_tempo: float = MIN_TEMPO,
+    snapshot_strategy: str = TRANSCRIPT_STRATEGY,
+    scene_threshold: float = SCENE_THRESHOLD,
+    limits: Optional[Dict[str, asyncio.Semaphore]] = None,
+    on_stage_done: Optional[Callable[[str], None]] = None,
+) -> Optional[str]:
+    """
+    Summarize one video or audio file.
+
+    :return: The output directory, or None if the file has no audio.
+    """
+    dirname = output_dirname_for(file_path, output)
+
+    has_video, has_audio = await asyncio.to_thread(file_contains_video_or_audio, file_path)
+    if not has_audio:
+        print("File does not contain audio, exiting...") if not quiet else None
+        return None
+
+    logger.debug(f"Has video: {has_video}")
+    logger.debug(f"Has audio: {has_audio}")
+
+    fingerprint = await asyncio.to_thread(media_fingerprint, file_path)
+    logger.debug(f"Fingerprint: {fingerprint}")
+    source = read_source(dirname)
+    if source and source["fingerprint"] != fingerprint:
+        # A different recording with the same name (from another folder, say).
+        logger.info(f"{dirname} was made from {source['path']}")
+        dirname = f"{dirname}-{fingerprint[:8]}"
+    write_source(dirname, file_path, fingerprint)
+
+    logger.info(f"Output directory: {dirname}")
+
+    artifacts = stored_artifacts(
+        transcript,
+        has_video and snapshots,
+        snapshot_min_secs,
+        snapshot_output=snapshot_output,
+        compact_speech=compact_speech,
+        speech_tempo=speech_tempo,
+        snapshot_strategy=snapshot_strategy,
+        scene_threshold=scene_threshold,
+        snapshot_similarity=snapshot_similarity,
+    )
+    artifact_store = ArtifactStore(store_path) if store else None
+    inputs = stage_inputs(
+        dirname,
+        template,
+        transcript,
+        has_video and snapshots,
+        snapshot_min_secs,
+        snapshot_similarity=snapshot_similarity,
+        snapshot_output=snapshot_output,
+        snapshot_strategy=snapshot_strategy,
+        scene_threshold=scene_threshold,
+        chunk_tokens=chunk_tokens,
+    )
+    # The stage that makes each artifact, for those with a record of what they are made from.
+    recorded = {output: stage for stage, stage_input in inputs.items() for output in stage_input["outputs"]}
+    if artifact_store:
+        linked = await asyncio.to_thread(artifact_store.link_into, fingerprint, dirname, artifacts, recorded)
+        manifest = ArtifactManifest(dirname)
+        for record in linked.values():
+            if record:
+                manifest.adopt(record["stage"], record["record"])
+
+    await update_all(
+        file_path=file_path,
+        dirname=dirname,
+        template=template,
+        title=title,
+        transcript=transcript,
+        snapshot_min_secs=snapshot_min_secs,
+        has_video=has_video and snapshots,
+        quiet=quiet,
+        snapshot_engine=snapshot_engine,
+        snapshot_similarity=snapshot_similarity,
+        snapshot_workers=snapshot_workers,
+        snapshot_output=snapshot_output,
+        transcribe_chunk_secs=transcribe_chunk_secs,
+        transcribe_concurrency=transcribe_concurrency,
+        stream=stream,
+        limits=limits,
+        on_stage_done=on_stage_done,
+        chunk_tokens=chunk_tokens,
+        topic_workers=topic_workers,
+        compress=compress,
+        compact_speech=compact_speech,
+        speech_tempo=speech_tempo,
+        snapshot_strategy=snapshot_strategy,
+        scene_threshold=scene_threshold,
+    )
+
+    if artifact_store:
+        manifest = ArtifactManifest(dirname)
+        records = {
+            name: {"stage": recorded[name], "record": manifest.stages[recorded[name]]}
+            for name in artifacts
+            if name in recorded and recorded[name] in manifest.stages
+        }
+        await asyncio.to_thread(artifact_store.save_from, fingerprint, dirname, artifacts, records)
+
+    return dirname
+
+
+def setup_logging(level: str):
+    logging.basicConfig(level=level)
+    logger.setLevel(level)
+    ffmpeg_logger.setLevel(level)
+    snapshots_logger.setLevel(level)
+
+    logger.debug(f"Logging level: {level}")
+
+
+def setup_llm_cache(llm_cache: bool, llm_cache_path: str, llm_cache_max_mb: int) -> Optional["LLMCache"]:
+    if not llm_cache:
+        return None
+    from langchain.globals import set_llm_cache
+    from .cache import LLMCache
+
+    logger.info(f"LLM cache: {llm_cache_path}")
+    cache = LLMCache(llm_cache_path, llm_cache_max_mb * 1024 * 1024)
+    set_llm_cache(cache)
+    return cache
+
+
+def setup_openai(openai_base_url: Optional[str]):
+    if openai_base_url:
+        logger.info(f"OpenAI API: {openai_base_url}")
+        set_openai_base_url(openai_base_url)
+
+
+def setup_llm_engine(llm_rpm: int, llm_tpm: int) -> "LLMEngine":
+    from .engine import LLMEngine, set_llm_engine
+
+    engine = LLMEngine(llm_rpm, llm_tpm)
+    set_llm_engine(engine)
+    return engine
+
+
+def print_llm_stats(cache: Optional["LLMCache"], engine: "LLMEngine", quiet: bool):
+    if quiet:
+        return
+    print(engine.report())
+    if cache:
+        stats = cache.stats()
+        print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses")
+
+
+@contextlib.contextmanager
+def tracing(trace_path: Optional[str], profile_dir: Optional[str], quiet: bool):
+    """Trace (and profile) what runs inside, when asked to, and save the results at the end."""
+    if not trace_path and not profile_dir:
+        yield
+        return
+
+    tracer = start_tracing()
+    profiler = SamplingProfiler(tracer) if profile_dir else None
+    if profiler:
+        profiler.start()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.stop()
+            paths = profiler.save(profile_dir)
+            print(f"Profiles of {len(paths)} stages saved to {profile_dir}") if not quiet else None
+        stop_tracing()
+        if trace_path:
+            tracer.save_chrome_trace(trace_path)
+            print(f"Trace saved to {trace_path}") if not quiet else None
+        print(tracer.summary()) if not quiet else None
+
+
+def summary_options(f):
+    """Options shared by the summarize and batch commands."""
+    options = [
+        click.option("--output", "-o", default=None, help="Where to drop the output files"),
+        click.option(
+            "--snapshots/--no-snapshots", default=True, help="Create snapshots if possible"
+        ),
+        click.option("--template", default="time", type=click.Choice(["time", "clif"]), help="Specify a built-in LLM template to generate summary (time, clif) (default: time)"),
+        click.option("--quiet", "-q", default=False, help="Suppress any console output"),
+        click.option(
+            "--snapshot-min-secs",
+            default=5,
+            help="Minimum interval between video snapshots in seconds (default: 10)",
+        ),
+        click.option(
+            "--snapshot-strategy",
+            default=TRANSCRIPT_STRATEGY,
+            type=click.Choice(SNAPSHOT_STRATEGIES),
+            help="Take snapshots at transcript cues (dropping repeated ones), or at visual changes found in one pass over the video (transcript, scene) (default: transcript)",
+        ),
+        click.option(
+            "--snapshot-scene-threshold",
+            "scene_threshold",
+            default=SCENE_THRESHOLD,
+            type=click.FloatRange(0, 1),
+            help=f"How different (0-1) a frame must be from the one before it to count as a visual change, for the scene strategy (default: {SCENE_THRESHOLD})",
+        ),
+        click.option(
+            "--snapshot-engine",
+            default=SINGLE_PASS_ENGINE,
+            type=click.Choice(SNAPSHOT_ENGINES),
+            help="How snapshots are extracted: decode the video once (single-pass), run ffmpeg per snapshot (per-timestamp), or decode segments of the video in parallel (parallel) (default: single-pass)",
+        ),
+        click.option(
+            "--snapshot-workers",
+            type=int,
+            default=None,
+            help="Number of worker processes for the parallel snapshot engine (default: number of CPUs)",
+        ),
+        click.option(
+            "--snapshot-similarity",
+            default=COMPARE_SIMILARITY,
+            type=click.Choice(SIMILARITY_BACKENDS),
+            help="How repeated snapshots are detected: ImageMagick compare or in-process SSIM (compare, ssim) (default: compare)",
+        ),
+        click.option(
+            "--snapshot-output",
+            default=FILES_OUTPUT,
+            type=click.Choice(SNAPSHOT_OUTPUTS),
+            help="Keep a JPEG per snapshot, or pack them into a few sprite sheets (files, sprites) (default: files)",
+        ),
+        click.option(
+            "--transcribe-chunk-secs",
+            type=int,
+            default=None,
+            help="Transcribe the audio in chunks of this many seconds, 0 to never chunk (default: 600 second chunks for audio over the 25MB API limit)",
+        ),
+        click.option(
+            "--compact-speech/--no-compact-speech",
+            default=False,
+            help="Transcribe mono 16kHz audio with silences cut, for smaller uploads and quicker transcription; timestamps still refer to the source (default: off)",
+        ),
+        click.option(
+            "--speech-tempo",
+            default=MIN_TEMPO,
+            type=click.FloatRange(MIN_TEMPO, MAX_TEMPO),
+            help=f"With --compact-speech, speed the speech up this many times ({MIN_TEMPO:g}-{MAX_TEMPO:g}) (default: {MIN_TEMPO:g})",
+        ),
+        click.option(
+            "--transcribe-concurrency",
+            default=TRANSCRIPT_CONCURRENCY,
+            help=f"Number of chunks to transcribe at once (default: {TRANSCRIPT_CONCURRENCY})",
+        ),
+        click.option(
+            "--stream/--no-stream",
+            default=False,
+            help="Summarize chapters while the transcript is still being generated (time template only)",
+        ),
+        click.option(
+            "--chunk-tokens",
+            default=CHUNK_TOKENS,
+            help=f"Tokens of transcript to send in each chapter summary request, and of chapters in each title request; longer summaries are titled in a tree of requests (default: {CHUNK_TOKENS})",
+        ),
+        click.option(
+            "--topic-workers",
+            default=0,
+            help="Number of threads the topic model trains with, 0 for one per CPU (default: 0)",
+        ),
+        click.option(
+            "--llm-cache/--no-llm-cache",
+            default=True,
+            help="Reuse LLM responses for prompts that have been sent before (default: on)",
+        ),
+        click.option(
+            "--llm-cache-path",
+            default=DEFAULT_CACHE_PATH,
+            help=f"Where to keep the LLM response cache (default: {DEFAULT_CACHE_PATH})",
+        ),
+        click.option(
+            "--llm-cache-max-mb",
+            default=DEFAULT_MAX_BYTES // (1024 * 1024),
+            help="Evict the least recently used LLM responses past this size (default: 256)",
+        ),
+        click.option(
+            "--llm-rpm",
+            default=DEFAULT_RPM,
+            help=f"OpenAI API requests per minute to stay within, 0 for no limit (default: {DEFAULT_RPM})",
+        ),
+        click.option(
+            "--llm-tpm",
+            default=DEFAULT_TPM,
+            help=f"OpenAI API tokens per minute to stay within, 0 for no limit (default: {DEFAULT_TPM})",
+        ),
+        click.option(
+            "--openai-base-url",
+            envvar="OPENAI_BASE_URL",
+            default=None,
+            help="Send transcription and LLM requests to this OpenAI compatible server instead, e.g. one started with `tldl fake-openai` (default: OpenAI's API)",
+        ),
+        click.option(
+            "--store/--no-store",
+            default=True,
+            help="Share audio, transcripts and snapshots between runs on the same media (default: on)",
+        ),
+        click.option(
+            "--store-path",
+            default=DEFAULT_STORE_PATH,
+            help=f"Where to keep shared artifacts (default: {DEFAULT_STORE_PATH})",
+        ),
+        click.option(
+            "--compress/--no-compress",
+            default=False,
+            help="Write .gz (and, with brotli installed, .br) copies of the HTML and JSON outputs, for static file servers (default: off)",
+        ),
+        click.option(
+            "--trace",
+            "trace_path",
+            default=None,
+            help="Record how long each stage, ffmpeg/ffprobe run, transcription and LLM request took, save it to this file as a Chrome trace (chrome://tracing, ui.perfetto.dev) and print a summary",
+        ),
+        click.option(
+            "--profile",
+            "profile_dir",
+            default=None,
+            help="Sample the stacks of each stage and save them to this directory as <stage>.folded (flamegraph.pl, speedscope)",
+        ),
+        click.option(
+            "--level",
+            "-l",
+            default="WARNING",
+            help="Set the logging level (e.g., DEBUG, INFO, WARNING, ERROR, CRITICAL)",
+        ),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
 
 
-@click.command()
+class DefaultCommandGroup(click.Group):
+    """
+    A group that runs `default_command` when the first argument isn't one of
+    its commands, so `tldl FILE` still summarizes FILE.
+    """
+
+    def __init__(self, *args, default_command: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
+
+    def parse_args(self, ctx, args):
+        if args and args[0] not in self.commands and args[0] not in ctx.help_option_names:
+            args = [self.default_command, *args]
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=DefaultCommandGroup, default_command="summarize")
+def cli():
+    """
+    tldl (too long didn't listen): generate HTML summaries of audio and video transcripts.
+
+    Without a command, summarizes SOURCE_FILE: `tldl SOURCE_FILE` is `tldl summarize SOURCE_FILE`.
+    """
+
+
+@cli.command()
 @click.argument("file_path")
 @click.option(
     "--transcript",
     type=click.Path(exists=True),
-    help="Path to supplied transcript (default: auto-generated)",
+    help="Path to supplied VTT or SRT transcript (default: auto-generated)",
 )
-@click.option("--output", "-o", default=None, help="Where to drop the output files")
 @click.option(
     "--open/--no-open",
     default=False,
     help="Open the index.html file in a browser",
 )
-@click.option(
-    "--snapshots/--no-snapshots", default=True, help="Create snapshots if possible"
-)
 @click.option(
     "--title", help="Specify a title for the summary (default: auto-generated)"
 )
-@click.option("--template", default="time", type=click.Choice(["time", "clif"]), help="Specify a built-in LLM template to generate summary (time, clif) (default: time)")
-@click.option("--quiet", "-q", default=False, help="Suppress any console output")
-@click.option(
-    "--snapshot-min-secs",
-    default=5,
-    help="Minimum interval between video snapshots in seconds (default: 10)",
-)
-@click.option(
-    "--level",
-    "-l",
-    default="WARNING",
-    help="Set the logging level (e.g., DEBUG, INFO, WARNING, ERROR, CRITICAL)",
-)
+@summary_options
 @coro
 async def summarize(
-    transcript,
     file_path,
-    output,
+    transcript,
     open,
     title,
-    template,
-    quiet,
     level,
-    snapshot_min_secs,
-    snapshots,
+    llm_cache,
+    llm_cache_path,
+    llm_cache_max_mb,
+    llm_rpm,
+    llm_tpm,
+    openai_base_url,
+    trace_path,
+    profile_dir,
+    **options,
 ):
     """Summarize a video or audio file"""
-    logging.basicConfig(level=level)
-    logger.setLevel(level)
-    ffmpeg_logger.setLevel(level)
-    snapshots_logger.setLevel(level)
+    setup_logging(level)
+    setup_openai(openai_base_url)
+    cache = setup_llm_cache(llm_cache, llm_cache_path, llm_cache_max_mb)
+    engine = setup_llm_engine(llm_rpm, llm_tpm)
 
-    logger.debug(f"Logging level: {level}")
+    with tracing(trace_path, profile_dir, options["quiet"]):
+        dirname = await summarize_file(file_path, transcript=transcript, title=title, **options)
+    if not dirname:
+        return sys.exit(1)
 
-    output = output if output else "."
-    output_dirname = "_".join(os.path.basename(file_path).split(".")[0:-1]).replace(
-        " ", "_"
-    )
-    dirname = f"{output}/{output_dirname}"
+    print_llm_stats(cache, engine, options["quiet"])
 
-    logger.info(f"Output directory: {dirname}")
+    if open:
+        logger.info("Opening index.html in browser...")
+        subprocess.Popen(["open", f"{dirname}/index.html"])
 
-    has_video, has_audio = file_contains_video_or_audio(file_path)
-    if not has_audio:
-        print("File does not contain audio, exiting...") if not quiet else None
+
+@cli.command()
+@click.argument("paths", nargs=-1, required=True)
+@click.option(
+    "--cpu-workers",
+    default=os.cpu_count() or 1,
+    help="Number of CPU bound stages (audio encoding, snapshots) to run at once (default: number of CPUs)",
+)
+@click.option(
+    "--network-workers",
+    default=8,
+    help="Number of network bound stages (transcription, summaries, titles) to run at once (default: 8)",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    default=None,
+    help="Number of files to work on at once (default: CPU workers + network workers)",
+)
+@click.option(
+    "--manifest",
+    default=None,
+    help=f"Where to record the progress of the batch (default: {MANIFEST_FILE} in the output directory)",
+)
+@summary_options
+@coro
+async def batch(
+    paths,
+    cpu_workers,
+    network_workers,
+    jobs,
+    manifest,
+    level,
+    llm_cache,
+    llm_cache_path,
+    llm_cache_max_mb,
+    llm_rpm,
+    llm_tpm,
+    openai_base_url,
+    trace_path,
+    profile_dir,
+    **options,
+):
+    """
+    Summarize many video or audio files (files, directories or globs).
+
+    Progress is recorded in a manifest, so running the same batch again
+    resumes where it stopped.
+    """
+    setup_logging(level)
+    setup_openai(openai_base_url)
+    cache = setup_llm_cache(llm_cache, llm_cache_path, llm_cache_max_mb)
+    engine = setup_llm_engine(llm_rpm, llm_tpm)
+    quiet = options["quiet"]
+
+    file_paths = find_media_files(paths)
+    print(f"Found {len(file_paths)} media files") if not quiet else None
+
+    batch_manifest = BatchManifest(manifest or os.path.join(options["output"] or ".", MANIFEST_FILE))
+    limits = stage_limits(cpu_workers, network_workers)
+
+    async def process(file_path: str, on_stage_done: Callable[[str], None]) -> Optional[str]:
+        # Per file progress would be interleaved, only the batch progress is shown.
+        return await summarize_file(
+            file_path, **{**options, "quiet": True}, limits=limits, on_stage_done=on_stage_done
+        )
+
+    with tracing(trace_path, profile_dir, quiet):
+        counts = await run_batch(
+            file_paths, process, batch_manifest, jobs or cpu_workers + network_workers, quiet
+        )
+    print(", ".join(f"{count} {status}" for status, count in sorted(counts.items()))) if not quiet else None
+    print_llm_stats(cache, engine, quiet)
+
+    if counts.get(FAILED):
         return sys.exit(1)
 
-    logger.debug(f"Has video: {has_video}")
-    logger.debug(f"Has audio: {has_audio}")
 
-    print("Generating audio sample...") if not quiet else None
-    create_lower_quality_mp3(file_path, dirname)
+@cli.command("fake-openai")
+@click.option("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+@click.option("--port", default=FAKE_OPENAI_PORT, help=f"Port to listen on (default: {FAKE_OPENAI_PORT})")
+@click.option(
+    "--latency-ms",
+    default=LATENCY_MS,
+    help=f"Median time to answer a request, in milliseconds (default: {LATENCY_MS})",
+)
+@click.option(
+    "--latency-sigma",
+    default=LATENCY_SIGMA,
+    help=f"Spread of the latencies: sigma of their log-normal distribution, 0 to always take the median (default: {LATENCY_SIGMA})",
+)
+@click.option(
+    "--transcription-speed",
+    default=TRANSCRIPTION_SPEED,
+    help=f"Transcribing also takes the length of the audio over this, 0 for just the latency (default: {TRANSCRIPTION_SPEED})",
+)
+@click.option("--rpm", default=0, help="Requests per minute to allow before answering 429, 0 for no limit (default: 0)")
+@click.option("--tpm", default=0, help="Tokens per minute to allow before answering 429, 0 for no limit (default: 0)")
+@click.option(
+    "--error-rate",
+    default=0.0,
+    type=click.FloatRange(0, 1),
+    help="Share of requests (0-1) to fail with a 500 (default: 0)",
+)
+@click.option("--seed", type=int, default=None, help="Seed latencies and errors, for repeatable runs")
+@click.option("--level", "-l", default="WARNING", help="Set the logging level (DEBUG logs every request)")
+def fake_openai(host, port, latency_ms, latency_sigma, transcription_speed, rpm, tpm, error_rate, seed, level):
+    """
+    Serve a stand-in for the OpenAI API, to load test against offline.
 
-    await update_all(
-        file_path,
-        dirname,
-        template,
-        title,
-        transcript,
-        snapshot_min_secs,
-        has_video and snapshots,
-        quiet,
-    )
+    Chat completions get canned chapters and titles, and transcriptions a cue
+    every few seconds of the audio. Point summarize or batch at it with
+    --openai-base-url.
+    """
+    from .fake_openai import FakeOpenAI, FakeOpenAIServer, format_stats
 
-    if open:
-        logger.info("Opening index.html in browser...")
-        subprocess.Popen(["open", f"{dirname}/index.html"])
+    logging.basicConfig(level=level)
+    logging.getLogger("summarizer.fake_openai").setLevel(level)
+    fake = FakeOpenAI(latency_ms, latency_sigma, transcription_speed, rpm, tpm, error_rate, seed)
+    server = FakeOpenAIServer((host, port), fake)
+    print(f"Fake OpenAI API at {server.base_url} (--openai-base-url {server.base_url}), Ctrl-C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(format_stats(fake.stats))
 
 
 if __name__ == "__main__":
-    summarize()
+    cli()
@@ -1,12 +1,16 @@
-import concurrent.futures
+import asyncio
 import logging
 
-from typing import List
+from typing import AsyncIterator, List, Optional, Tuple, Union
 from langchain.prompts import PromptTemplate
 from langchain_core.pydantic_v1 import BaseModel,Field
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.runnables import RunnablePassthrough
+from .chunking import estimate_tokens, pack_ranges
+from .config import CHUNK_TOKENS
+from .engine import LLMEngine, get_llm_engine
 from .topics import split_by_dominant_topics, identify_topics
+from .transcript import Transcript, hms_strings
 
 
 logger = logging.getLogger(__name__)
@@ -95,38 +99,91 @@ time_prompt = PromptTemplate.from_template(
     partial_variables={"format_instructions": time_parser.get_format_instructions()},
 )
 
-def run_with_executor(chain, chunks, use_thread_pool=True):
-    if not use_thread_pool:
-        return [chain(d) for d in chunks]
+def make_source_text(items):
+    return "\n".join(
+        [f"id({i})|start({s['start']}) : {s['text']}" for i, s in items]
+    )
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        return executor.map(chain, chunks)
 
+def source_lines(transcript_json: Union[Transcript, List[dict]], start: int, end: int) -> List[str]:
+    """
+    The source text line of each of the cues [start, end). A Transcript's
+    lines are made from its columns, formatting the start times in one go.
+    """
+    cues = transcript_json[start:end]
+    if isinstance(cues, Transcript):
+        starts, texts = hms_strings(cues.starts), cues.texts()
+    else:
+        starts, texts = [cue["start"] for cue in cues], [cue["text"] for cue in cues]
+    return [f"id({i})|start({s}) : {text}" for i, s, text in zip(range(start, end), starts, texts)]
+
+
+def pack_source_texts(transcript_json: Union[Transcript, List[dict]], ranges: List[List[int]], chunk_tokens: int = CHUNK_TOKENS) -> List[str]:
+    """
+    Source text for each summary request: [start, end) cue ranges repacked
+    so every request comes close to `chunk_tokens` tokens.
+    """
+    if not ranges:
+        return []
+
+    # Ranges are consecutive, so work relative to the first one.
+    first = ranges[0][0]
+    lines = source_lines(transcript_json, first, ranges[-1][1])
+    cue_tokens = [estimate_tokens(line) for line in lines]
+    packed = pack_ranges([[start - first, end - first] for start, end in ranges], cue_tokens, chunk_tokens)
+    return ["\n".join(lines[start:end]) for start, end in packed]
+
+
+def segment_transcript(transcript_json: Union[Transcript, List[dict]], topic_workers: int = 0) -> List[List[int]]:
+    """
+    Split a transcript into ranges of cues that share their dominant topics.
+
+    :return: Inclusive [start, end] cue positions, covering every cue.
+    """
+    if not len(transcript_json):
+        return []
+    turns = identify_topics(transcript_json, workers=topic_workers)
+    # The topic model leaves out cues with no words left after preprocessing
+    # ("I", "a"), so its ranges are mapped back to cue positions.
+    ids = transcript_json.ids.tolist() if isinstance(transcript_json, Transcript) else [c["id"] for c in transcript_json]
+    position = {id: i for i, id in enumerate(ids)}
+    ranges = split_by_dominant_topics([t['topic'] for t in turns['transcripts']], 0.2)
+    ends = [position[turns['transcripts'][end]['id']] for _, end in ranges[:-1]]
+    # Left out cues go with the range before them, and the last range takes the rest.
+    ends.append(len(ids) - 1)
+    return [[ends[i - 1] + 1 if i else 0, end] for i, end in enumerate(ends)]
+
+
+def time_chain(model):
+    return (
+        {"source_text": RunnablePassthrough()}
+        | time_prompt
+        | model
+        | time_parser
+    )
 
-def make_time_chain(transcript_json: List[dict]):
-    # return make_newline_splitting_chain()
-    def _chain(model):
-        def make_source_text(items):
-            return "\n".join(
-                [f"id({i})|start({s['start']}) : {s['text']}" for i, s in items]
-            )
 
-        turns = identify_topics(transcript_json)
-        coalesced_turn_ids = split_by_dominant_topics([t['topic'] for t in turns['transcripts']], 0.2)
+async def summarize_time_chunk(model, chunk: str, engine: Optional[LLMEngine] = None):
+    return await (engine or get_llm_engine()).run(time_chain(model), chunk)
+
 
-        range_entries = [make_source_text(enumerate(transcript_json[r[0]:r[1]], r[0])) for r in coalesced_turn_ids]
+def make_time_chain(
+    transcript_json: List[dict],
+    engine: Optional[LLMEngine] = None,
+    chunk_tokens: int = CHUNK_TOKENS,
+    topic_workers: int = 0,
+):
+    # return make_newline_splitting_chain()
+    async def _chain(model):
+        coalesced_turn_ids = await asyncio.to_thread(segment_transcript, transcript_json, topic_workers)
+
+        # Topic ranges include their last cue.
+        ranges = [[r[0], r[1] + 1] for r in coalesced_turn_ids]
+        range_entries = pack_source_texts(transcript_json, ranges, chunk_tokens)
         logger.debug("range_entries: %s", range_entries)
 
         all_results = []
-        def process_time(chunk: str):
-            return (
-                {"source_text": RunnablePassthrough()}
-                | time_prompt
-                | model
-                | time_parser
-            ).invoke(chunk)
-
-        results = run_with_executor(process_time, range_entries)
+        results = await (engine or get_llm_engine()).map(time_chain(model), range_entries)
 
         # join together list of lists into one list
         for result in results:
@@ -137,6 +194,77 @@ def make_time_chain(transcript_json: List[dict]):
     return _chain
 
 
+# Number of characters of transcript to gather before segmenting it when
+# summarizing a transcript as it streams in.
+STREAM_WINDOW_CHARS = 12000
+
+
+async def stream_time_chain(
+    cue_batches: AsyncIterator[List[dict]],
+    model,
+    window_chars: int = STREAM_WINDOW_CHARS,
+    engine: Optional[LLMEngine] = None,
+    chunk_tokens: int = CHUNK_TOKENS,
+    topic_workers: int = 0,
+) -> Tuple[List[dict], List[dict]]:
+    """
+    Summarize a transcript while it is still being generated.
+
+    Cues are gathered until there are `window_chars` characters of text that
+    haven't been summarized yet. That window is segmented by topic, and every
+    segment but the last is summarized straight away; the last segment may
+    continue in cues that haven't arrived yet, so it starts the next window.
+
+    :param cue_batches: Batches of transcript cues, in order.
+    :param engine: Engine the chapters are summarized with (default: the global engine).
+    :param chunk_tokens: Segments of a window are packed into requests of about this many tokens.
+    :param topic_workers: Number of threads the topic model trains with (0: one per CPU).
+    :return: The complete transcript and its chapters.
+    """
+    transcript_json = []
+    summaries = []
+
+    def summarize_ranges(ranges: List[List[int]]):
+        # Ranges here are [start, end) cue indexes.
+        for source_text in pack_source_texts(transcript_json, ranges, chunk_tokens):
+            summaries.append(asyncio.create_task(summarize_time_chunk(model, source_text, engine)))
+
+    async def segment(start: int, end: int) -> List[List[int]]:
+        ranges = await asyncio.to_thread(segment_transcript, transcript_json[start:end], topic_workers)
+        return [[start + r[0], start + r[1] + 1] for r in ranges]
+
+    window_start = 0
+    async for cues in cue_batches:
+        transcript_json.extend(cues)
+        while True:
+            # Smallest window with enough text in it
+            window_end, text_length = window_start, 0
+            while window_end < len(transcript_json) and text_length < window_chars:
+                text_length += len(transcript_json[window_end]["text"])
+                window_end += 1
+            if text_length < window_chars:
+                break
+
+            ranges = await segment(window_start, window_end)
+            if len(ranges) > 1:
+                summarize_ranges(ranges[:-1])
+                window_start = ranges[-1][0]
+            else:
+                summarize_ranges([[window_start, window_end]])
+                window_start = window_end
+
+    if window_start < len(transcript_json):
+        ranges = await segment(window_start, len(transcript_json))
+        ranges[-1][1] = len(transcript_json)
+        summarize_ranges(ranges)
+
+    all_results = []
+    for result in await asyncio.gather(*summaries):
+        all_results.extend(result['articles'])
+
+    return transcript_json, all_results
+
+
 clif_prompt = PromptTemplate(
     template=CLIF_TEMPLATE,
     input_variables=["source_text"],
@@ -180,12 +308,43 @@ title_prompt = PromptTemplate(
 )
 
 
-def make_title_chain(chapters_json: List[dict]):
-    def _chain(model):
-        chapters = "Sections:\n" + "\n".join(
-            [f"{s['title']} : {s['summary']}" for s in chapters_json]
-        )
+def group_sections(sections: List[str], chunk_tokens: int = CHUNK_TOKENS) -> List[List[str]]:
+    """
+    Split sections into about evenly sized groups of consecutive sections,
+    each close to `chunk_tokens` tokens, and at least two to a group -- so
+    every level of a title tree is at most half as long as the one below.
+    """
+    if len(sections) <= 1:
+        return [sections]
+    tokens = [estimate_tokens(section) for section in sections]
+    groups = pack_ranges([[0, len(sections)]], tokens, chunk_tokens)
+    if len(groups) == len(sections):
+        groups = [[i, min(i + 2, len(sections))] for i in range(0, len(sections), 2)]
+    return [sections[start:end] for start, end in groups]
+
+
+def make_title_chain(chapters_json: List[dict], engine: Optional[LLMEngine] = None, chunk_tokens: int = CHUNK_TOKENS):
+    """
+    Title and describe a summary from its chapters.
+
+    Chapters that don't fit in one request of `chunk_tokens` tokens are
+    reduced as a tree: groups of consecutive chapters are titled at the same
+    time, then groups of those titles, and so on until the titles fit in one
+    request, which gives the title of the whole.
+    """
+    async def _chain(model):
         chain = title_prompt | model | title_parser
-        return chain.invoke({"source_text": chapters})
+        sections = [f"{s['title']} : {s['summary']}" for s in chapters_json]
+        groups = group_sections(sections, chunk_tokens)
+        level = 0
+        while len(groups) > 1:
+            level += 1
+            logger.info(f"Titling {len(sections)} sections in {len(groups)} groups (level {level})")
+            titles = await (engine or get_llm_engine()).map(
+                chain, [{"source_text": "Sections:\n" + "\n".join(group)} for group in groups]
+            )
+            sections = [f"{t['title']} : {t['description']}" for t in titles]
+            groups = group_sections(sections, chunk_tokens)
+        return await (engine or get_llm_engine()).run(chain, {"source_text": "Sections:\n" + "\n".join(sections)})
 
     return _chain
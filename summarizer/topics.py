@@ -1,39 +1,43 @@
-from typing import Dict, List
-from collections import Counter
-from gensim import corpora, models
-from gensim.utils import simple_preprocess
-from nltk.corpus import stopwords
 from collections import defaultdict
-import nltk
+import hashlib
+import json
 import logging
-from typing import Dict, List, TypedDict
-import tomotopy as tp
-from gensim.utils import simple_preprocess
-from nltk.corpus import stopwords
+import os
+from typing import Dict, List, Optional, TypedDict, Union
+import numpy as np
+from .config import CACHE_DIR
+from .stopwords import ENGLISH_STOPWORDS
+from .trace import traced
+from .transcript import Transcript, as_transcript
 from .vtt import time_string_to_seconds
-import nltk
 
+# gensim and tomotopy are imported where they are used: gensim pulls in scipy,
+# and neither is needed when the topics are cached.
 
 logger = logging.getLogger(__name__)
 
-nltk.download("stopwords")
-
 
 def assign_time_slices(data, num_slices):
-    start_time = time_string_to_seconds(data[0]["start"])
-    end_time = time_string_to_seconds(data[-1]["end"])
-    total_duration = end_time - start_time
-    slice_duration = total_duration / num_slices
+    starts = np.array([time_string_to_seconds(datum["start"]) for datum in data], dtype=np.float64)
+    return assign_time_slices_array(starts, time_string_to_seconds(data[-1]["end"]), num_slices).tolist()
+
+
+def assign_time_slices_array(starts: np.ndarray, end: float, num_slices: int) -> np.ndarray:
+    """
+    Split a transcript into `num_slices` equally long stretches of time.
 
-    time_slices = []
-    for datum in data:
-        doc_time = time_string_to_seconds(datum["start"])
-        time_slice = int((doc_time - start_time) / slice_duration)
-        time_slices.append(
-            min(time_slice, num_slices - 1)
-        )  # Ensure the index is within bounds
+    :param starts: Start time of each cue, in seconds.
+    :param end: End time of the last cue, in seconds.
+    :return: The time slice of each cue.
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    slice_duration = (end - starts[0]) / num_slices
+    if slice_duration == 0:
+        raise ZeroDivisionError("transcript has no duration")
 
-    return time_slices
+    # Truncate toward zero, like int()
+    time_slices = ((starts - starts[0]) / slice_duration).astype(np.int64)
+    return np.minimum(time_slices, num_slices - 1)  # Ensure the index is within bounds
 
 
 class Topic(TypedDict):
@@ -50,13 +54,119 @@ class Topics(TypedDict):
     transcripts: List[Transcript]
 
 
-def identify_topics(data: List[Dict], max_topics: int = 5) -> Topics:
+TOPIC_CACHE_DIR = os.path.join(CACHE_DIR, "topics")
+# Bump when the model or its settings change, so cached topics aren't reused.
+TOPIC_CACHE_VERSION = 2
+
+# Training runs in steps of TRAIN_STEP iterations, and stops once the log
+# likelihood per word hasn't improved by CONVERGENCE_TOLERANCE (relative) for
+# CONVERGENCE_PATIENCE steps in a row.
+TRAIN_STEP = 10
+MIN_ITERATIONS = 100
+MAX_ITERATIONS = 1000
+CONVERGENCE_TOLERANCE = 0.001
+CONVERGENCE_PATIENCE = 3
+
+
+def train_until_converged(
+    model,
+    max_iterations: int = MAX_ITERATIONS,
+    tolerance: float = CONVERGENCE_TOLERANCE,
+    workers: int = 0,
+) -> int:
+    """
+    Train a tomotopy model until its log likelihood stops improving.
+
+    :param tolerance: Relative improvement in log likelihood per word that
+        counts as progress. 0 trains for all of `max_iterations`.
+    :param workers: Number of threads to sample with (0: one per CPU).
+    :return: The number of iterations trained.
+    """
+    model.train(0, workers=workers)
+    best = model.ll_per_word
+    stale = 0
+    iterations = 0
+    while iterations < max_iterations:
+        model.train(TRAIN_STEP, workers=workers)
+        iterations += TRAIN_STEP
+
+        ll = model.ll_per_word
+        if ll > best + tolerance * abs(best):
+            best, stale = ll, 0
+        else:
+            stale += 1
+        if tolerance and iterations >= MIN_ITERATIONS and stale >= CONVERGENCE_PATIENCE:
+            break
+
+    logger.debug(f"Trained topics for {iterations} iterations (log likelihood per word {model.ll_per_word:.4f})")
+    return iterations
+
+
+def topics_cache_key(transcript: Transcript, max_topics: int) -> str:
+    digest = hashlib.sha256(f"v{TOPIC_CACHE_VERSION}:{max_topics}".encode())
+    digest.update(transcript.ids.tobytes())
+    # Whole seconds, as saved in transcript.json, so a transcript that was
+    # just transcribed and the same one read back from disk match.
+    digest.update(np.floor(transcript.starts).astype(np.int64).tobytes())
+    digest.update(np.floor(transcript.ends).astype(np.int64).tobytes())
+    digest.update(json.dumps(transcript.texts()).encode())
+    return digest.hexdigest()
+
+
+def load_cached_topics(path: str) -> Optional[Topics]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        cached = json.load(f)
+    # JSON object keys are always strings
+    return {
+        "topics": {int(topic): words for topic, words in cached["topics"].items()},
+        "transcripts": cached["transcripts"],
+    }
+
+
+def save_cached_topics(path: str, topics: Topics):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f"{path}.partial-{os.getpid()}"
+    with open(partial, "w") as f:
+        f.write(json.dumps(topics))
+    os.replace(partial, path)
+
+
+@traced("topics")
+def identify_topics(
+    data: Union[Transcript, List[Dict]],
+    max_topics: int = 5,
+    workers: int = 0,
+    max_iterations: int = MAX_ITERATIONS,
+    tolerance: float = CONVERGENCE_TOLERANCE,
+    cache_dir: Optional[str] = TOPIC_CACHE_DIR,
+) -> Topics:
+    """
+    Find the dominant topic of each cue with a dynamic topic model.
+
+    :param workers: Number of threads to train with (0: one per CPU).
+    :param cache_dir: Where topics are kept by transcript, so the same
+        transcript is only trained on once (None to always train).
+    """
+    transcript = as_transcript(data)
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, f"{topics_cache_key(transcript, max_topics)}.json")
+        cached = load_cached_topics(cache_path)
+        if cached:
+            logger.info(f"Reusing topics from {cache_path}")
+            return cached
+
+    import tomotopy as tp
+    from gensim.utils import simple_preprocess
+
     # Preprocess the text data
     print("Finding topics...")
-    stop_words = set(stopwords.words("english"))
+    stop_words = ENGLISH_STOPWORDS
 
     num_slices = 5
-    time_slices = assign_time_slices(data, num_slices)
+    time_slices = assign_time_slices_array(transcript.starts, transcript.ends[-1], num_slices)
 
     # Create a DTModel
     dtm = tp.DTModel(
@@ -65,45 +175,49 @@ def identify_topics(data: List[Dict], max_topics: int = 5) -> Topics:
 
     # Add documents to the model
     doc_ids = []
-    for i, datum in enumerate(data):
+    for i, cue_text in enumerate(transcript.texts()):
         text = [
-            word for word in simple_preprocess(datum["text"]) if word not in stop_words
+            word for word in simple_preprocess(cue_text) if word not in stop_words
         ]
-        idx = dtm.add_doc(text, time_slices[i])
+        idx = dtm.add_doc(text, int(time_slices[i]))
         if idx is None:
-            logger.debug("skipping document {0}".format(datum))
+            logger.debug("skipping document {0}".format(transcript[i]))
             continue
             # raise ValueError('Failed to add document to the model')
         doc_ids.append(
             {
-                "id": datum["id"],
+                "id": int(transcript.ids[i]),
                 "doc_id": idx,
             }
         )
 
-    dtm.train(0)
-    for i in range(100):
-        dtm.train(10)
+    train_until_converged(dtm, max_iterations, tolerance, workers)
 
     topics = {}
     for did in doc_ids:
         doc = dtm.docs[did["doc_id"]]
         topic_dist = doc.get_topic_dist()
         if topic_dist.any():
-            dominant_topic = topic_dist.argmax()
+            dominant_topic = int(topic_dist.argmax())
         else:
             dominant_topic = -1
         did["topic"] = dominant_topic
         topics[dominant_topic] = {"words": " ".join([w for w, _ in doc.get_words()])}
 
-    return {
+    result: Topics = {
         "topics": topics,
         "transcripts": doc_ids,
     }
+    if cache_path:
+        save_cached_topics(cache_path, result)
+    return result
 
 
 def identify_topics_gensim(data: List[Dict], max_topics: int = 5) -> Topics:
-    stop_words = set(stopwords.words("english"))
+    from gensim import corpora, models
+    from gensim.utils import simple_preprocess
+
+    stop_words = ENGLISH_STOPWORDS
     texts = [
         [word for word in simple_preprocess(segment["text"]) if word not in stop_words]
         for segment in data
@@ -152,40 +266,50 @@ def identify_topics_gensim(data: List[Dict], max_topics: int = 5) -> Topics:
 
 
 def split_by_dominant_topics(topics: List[int], threshold: float) -> List[List[int]]:
-    # Count the occurrences of each topic
-    counts = Counter(topics)
-    total = len(topics)
-    # Identify dominant topics
-    dominant_topics = {topic for topic, count in counts.items() if count / total >= threshold}
+    return split_by_dominant_topics_array(np.asarray(topics, dtype=np.int64), threshold)
+
+
+def split_by_dominant_topics_array(topics: np.ndarray, threshold: float) -> List[List[int]]:
+    """
+    Split a transcript into ranges by its dominant topics.
 
-    if len(dominant_topics) <= 1:
-        if len(topics) > 0:
-            return [[0, len(topics) - 1]]
+    A topic is dominant when at least `threshold` of the cues are about it. A
+    range ends at the cue where more than its share (1 / the number of
+    dominant topics) of a dominant topic's cues have been seen.
+
+    :param topics: The topic of each cue.
+    :return: Inclusive [start, end] cue ranges.
+    """
+    total = len(topics)
+    if total == 0:
         return []
 
-    # Initialize the result array with the index ranges for groups of the dominant topics
-    result = []
+    # Identify dominant topics
+    values, counts = np.unique(topics, return_counts=True)
+    dominant = np.flatnonzero(counts / total >= threshold)
+    if len(dominant) <= 1:
+        return [[0, total - 1]]
 
-    # Track which dominant_topics have been addressed thus far
-    finished_topics = set()
+    dominant_threshold = 1 / len(dominant)
 
-    counts_so_far = Counter({c: 0 for c in dominant_topics})
-    dominant_threshold = 1 / len(dominant_topics)
+    # Positions of each topic's cues, grouped by topic
+    positions = np.argsort(topics, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(counts)])
 
-    for i, topic in enumerate(topics):
-        counts_so_far[topic] += 1
+    range_ends = []
+    for index in dominant:
+        count = counts[index]
+        # First cue where the share of this topic seen so far passes its threshold
+        seen = np.arange(1, count + 1) / count
+        range_ends.append(int(positions[offsets[index] + np.argmax(seen > dominant_threshold)]))
 
-        # Check if any topic has become a majority
-        for dt in dominant_topics - finished_topics:
-            if counts_so_far[dt] / counts[dt] > dominant_threshold:
-                finished_topics = finished_topics | {dt}
-                dt_range = [0,i]
-                if len(result) > 0:
-                    dt_range[0] = result[-1][1] + 1
-                result.append(dt_range)
+    result = []
+    for end in sorted(range_ends):
+        start = result[-1][1] + 1 if result else 0
+        result.append([start, end])
 
     # Finalize the last range
-    if len(result) > 0 and result[-1][1] != len(topics) - 1:
-        result[-1][1] = len(topics) - 1
+    if result[-1][1] != total - 1:
+        result[-1][1] = total - 1
 
     return result
@@ -0,0 +1,275 @@
+"""
+Spans (what ran, when, for how long and where) for --trace, and a sampling
+profiler for --profile that attributes the stacks it samples to stages.
+
+Nothing is recorded unless tracing is started: `span` then only costs a
+function call.
+"""
+import asyncio
+import contextlib
+import functools
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypedDict
+
+logger = logging.getLogger(__name__)
+
+# Spans of this category are the pipeline stages samples are attributed to.
+STAGE_CATEGORY = "stage"
+
+# How often the profiler samples stacks, in seconds.
+PROFILE_INTERVAL_SECS = 0.005
+
+_stage: ContextVar[Optional[str]] = ContextVar("stage", default=None)
+
+
+class SpanRecord(TypedDict):
+    name: str
+    category: str
+    # Seconds since tracing started.
+    start: float
+    duration: float
+    # The asyncio task or thread it ran on.
+    lane: str
+    stage: Optional[str]
+    args: Dict[str, Any]
+
+
+def _lane() -> Tuple[str, Optional[asyncio.Task]]:
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return (task.get_name() if task else threading.current_thread().name), task
+
+
+class Tracer:
+    """Collects spans, from any thread or task."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[SpanRecord] = []
+        self.lock = threading.Lock()
+        # For the profiler: the spans open on each thread (with the task that
+        # opened them), the event loop running on a thread, and the stage
+        # worker threads are working for.
+        self.open: Dict[int, List[Tuple[SpanRecord, Optional[asyncio.Task]]]] = {}
+        self.loops: Dict[int, asyncio.AbstractEventLoop] = {}
+        self.thread_stages: Dict[int, str] = {}
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, args: Dict[str, Any]) -> Iterator[SpanRecord]:
+        lane, task = _lane()
+        stage = name if category == STAGE_CATEGORY else _stage.get()
+        record = SpanRecord(
+            name=name,
+            category=category,
+            start=time.perf_counter() - self.started,
+            duration=0.0,
+            lane=lane,
+            stage=stage,
+            args=args,
+        )
+        thread_id = threading.get_ident()
+        if task:
+            self.loops[thread_id] = task.get_loop()
+        opened = (record, task)
+        stack = self.open.setdefault(thread_id, [])
+        stack.append(opened)
+        token = _stage.set(stage)
+        try:
+            yield record
+        finally:
+            _stage.reset(token)
+            record["duration"] = time.perf_counter() - self.started - record["start"]
+            # Spans of different tasks on the event loop's thread needn't close in order.
+            stack.remove(opened)
+            with self.lock:
+                self.spans.append(record)
+
+    def owner(self, thread_id: int) -> Optional[str]:
+        """The stage (or else the span) a thread is working for right now."""
+        stack = list(self.open.get(thread_id, ()))
+        if thread_id in self.loops:
+            task = asyncio.current_task(self.loops[thread_id])
+            stack = [opened for opened in stack if opened[1] is task]
+        if stack:
+            record = stack[-1][0]
+            return record["stage"] or record["name"]
+        return self.thread_stages.get(thread_id)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """The spans in the Chrome trace event format (chrome://tracing, Perfetto)."""
+        pid = os.getpid()
+        lanes: Dict[str, int] = {}
+        events = []
+        for record in sorted(self.spans, key=lambda r: r["start"]):
+            tid = lanes.setdefault(record["lane"], len(lanes) + 1)
+            events.append({
+                "name": record["name"],
+                "cat": record["category"],
+                "ph": "X",
+                "ts": round(record["start"] * 1e6),
+                "dur": round(record["duration"] * 1e6),
+                "pid": pid,
+                "tid": tid,
+                "args": {**record["args"], **({"stage": record["stage"]} if record["stage"] else {})},
+            })
+        for lane, tid in lanes.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": lane}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def summary(self) -> str:
+        """A table of the time spent in (and tokens used by) each kind of span."""
+        totals: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+        tokens: Counter = Counter()
+        for record in self.spans:
+            key = (record["category"], record["name"])
+            totals[key].append(record["duration"])
+            tokens[key] += record["args"].get("prompt_tokens", 0) + record["args"].get("completion_tokens", 0)
+
+        lines = [f"{'span':<32} {'calls':>6} {'total':>9} {'mean':>9} {'max':>9} {'tokens':>8}"]
+        for key, durations in sorted(totals.items(), key=lambda t: -sum(t[1])):
+            name = f"{key[0]}:{key[1]}" if key[0] else key[1]
+            lines.append(
+                f"{name[:32]:<32} {len(durations):>6} {sum(durations):>8.2f}s "
+                f"{sum(durations) / len(durations):>8.3f}s {max(durations):>8.2f}s {tokens[key] or '':>8}"
+            )
+        return "\n".join(lines)
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread every `interval` seconds, and counts
+    each sample against the stage the thread is working for (see
+    `Tracer.owner`). Threads that aren't working for a stage aren't counted.
+    """
+
+    def __init__(self, tracer: Tracer, interval: float = PROFILE_INTERVAL_SECS):
+        self.tracer = tracer
+        self.interval = interval
+        self.samples: Dict[str, Counter] = defaultdict(Counter)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.thread.ident:
+                continue
+            owner = self.tracer.owner(thread_id)
+            if owner:
+                self.samples[owner][_fold(frame)] += 1
+
+    def save(self, dir: str) -> List[str]:
+        """
+        Write the samples of each stage to 'dir/<stage>.folded', one
+        'outer;...;inner count' line per stack (flamegraph.pl, speedscope).
+        """
+        os.makedirs(dir, exist_ok=True)
+        paths = []
+        for owner, stacks in sorted(self.samples.items()):
+            path = os.path.join(dir, f"{owner.replace(os.sep, '_')}.folded")
+            with open(path, "w") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            paths.append(path)
+        return paths
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+_tracer: Optional[Tracer] = None
+
+
+def start_tracing() -> Tracer:
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop_tracing() -> Optional[Tracer]:
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def span(name: str, category: str = "", **args: Any) -> "contextlib.AbstractContextManager[SpanRecord]":
+    """
+    Record how long the body takes, when tracing. Extra details (token
+    counts, say) can be added to the span's "args" as it runs.
+    """
+    if _tracer is None:
+        return contextlib.nullcontext(SpanRecord(
+            name=name, category=category, start=0.0, duration=0.0, lane="", stage=None, args=args
+        ))
+    return _tracer.span(name, category, args)
+
+
+def traced(category: str, name: Optional[str] = None):
+    """Decorate a function (or coroutine function) to record a span for each call."""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__name__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, category):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def in_thread(func: Callable) -> Callable:
+    """
+    Wrap a function about to be run in a worker thread (asyncio.to_thread),
+    so that the profiler counts the thread's samples against the current stage.
+    """
+    tracer = _tracer
+    stage = _stage.get()
+    if tracer is None or stage is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        thread_id = threading.get_ident()
+        tracer.thread_stages[thread_id] = stage
+        try:
+            return func(*args, **kwargs)
+        finally:
+            tracer.thread_stages.pop(thread_id, None)
+    return wrapper
@@ -0,0 +1,212 @@
+import io
+import json
+import os
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Union
+
+import numpy as np
+
+from .vtt import seconds_to_hms, time_string_to_seconds
+
+CUE_KEYS = ("id", "start", "end", "text")
+
+
+class Cue(Mapping):
+    """
+    Read-only dict view of one cue of a `Transcript`, with the same keys as
+    the entries of transcript.json. Values are made when they are read.
+    """
+
+    __slots__ = ("_transcript", "_index")
+
+    def __init__(self, transcript: "Transcript", index: int):
+        self._transcript = transcript
+        self._index = index
+
+    def __getitem__(self, key: str):
+        if key == "id":
+            return int(self._transcript.ids[self._index])
+        if key == "start":
+            return seconds_to_hms(self._transcript.starts[self._index])
+        if key == "end":
+            return seconds_to_hms(self._transcript.ends[self._index])
+        if key == "text":
+            return self._transcript.text(self._index)
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(CUE_KEYS)
+
+    def __len__(self) -> int:
+        return len(CUE_KEYS)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class Transcript:
+    """
+    A transcript stored column by column: ids and start and end times (in
+    seconds, milliseconds included) as NumPy arrays, and the text of all cues
+    in one string with the offset of each cue's text.
+
+    Indexing gives a `Cue`, slicing gives a Transcript sharing the same
+    columns, and `to_entries` gives the list of dicts saved as transcript.json.
+    """
+
+    __slots__ = ("ids", "starts", "ends", "_text", "_offsets")
+
+    def __init__(self, ids, starts, ends, text: str, offsets):
+        """
+        :param text: The text of every cue, concatenated.
+        :param offsets: Where the text of each cue starts in `text`, plus the end of the last one.
+        """
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self._text = text
+        self._offsets = np.asarray(offsets, dtype=np.int64)
+
+    @classmethod
+    def from_texts(cls, ids, starts, ends, texts: Iterable[str]) -> "Transcript":
+        texts = list(texts)
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in texts], out=offsets[1:])
+        return cls(ids, starts, ends, "".join(texts), offsets)
+
+    @classmethod
+    def from_captions(cls, captions, first_id: int = 0) -> "Transcript":
+        """
+        A transcript of WebVTT captions, or the captions read by
+        `vtt.read_captions`: they are consumed one at a time.
+        """
+        starts, ends, offsets = array("d"), array("d"), array("q", [0])
+        text = io.StringIO()
+        for caption in captions:
+            starts.append(caption.start_in_seconds)
+            ends.append(caption.end_in_seconds)
+            offsets.append(offsets[-1] + text.write(caption.text.strip()))
+        return cls(np.arange(first_id, first_id + len(starts)), starts, ends, text.getvalue(), offsets)
+
+    @classmethod
+    def from_entries(cls, entries: List[Dict]) -> "Transcript":
+        """A transcript of transcript.json style entries."""
+        return cls.from_texts(
+            [e["id"] for e in entries],
+            [time_string_to_seconds(e["start"]) for e in entries],
+            [time_string_to_seconds(e["end"]) for e in entries],
+            [e["text"] for e in entries],
+        )
+
+    @classmethod
+    def load_json(cls, path: str) -> "Transcript":
+        with open(path) as f:
+            return cls.from_entries(json.load(f))
+
+    def save_json(self, path: str):
+        write_json_entries(self.iter_entries(), path)
+
+    def to_entries(self) -> List[Dict]:
+        return list(self.iter_entries())
+
+    def iter_entries(self) -> Iterator[Dict]:
+        """The transcript.json entry of each cue, made from the columns without `Cue` views."""
+        offsets = self._offsets.tolist()
+        for id, start, end, text_start, text_end in zip(
+            self.ids.tolist(), hms_strings(self.starts), hms_strings(self.ends), offsets, offsets[1:]
+        ):
+            yield {
+                "id": id,
+                "start": start,
+                "end": end,
+                "text": self._text[text_start:text_end],
+            }
+
+    def text(self, index: int) -> str:
+        return self._text[self._offsets[index]:self._offsets[index + 1]]
+
+    def texts(self) -> List[str]:
+        offsets = self._offsets.tolist()
+        return [self._text[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[Cue]:
+        return (Cue(self, i) for i in range(len(self)))
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Cue, "Transcript"]:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("Transcript slices can't have a step")
+            stop = max(start, stop)
+            return Transcript(
+                self.ids[start:stop],
+                self.starts[start:stop],
+                self.ends[start:stop],
+                self._text,
+                self._offsets[start:stop + 1],
+            )
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Transcript index out of range")
+        return Cue(self, index)
+
+    def __repr__(self) -> str:
+        return f"Transcript({len(self)} cues)"
+
+
+# "HH:" of each hour of the day and "MM:SS" of each second of an hour.
+_HOURS = [f"{hours:02}:" for hours in range(24)]
+_MINUTES_SECONDS = [f"{minutes:02}:{secs:02}" for minutes in range(60) for secs in range(60)]
+
+
+def hms_strings(seconds) -> List[str]:
+    """Each of an array of seconds as "HH:MM:SS", like `vtt.seconds_to_hms` but a column at a time."""
+    whole = np.floor(np.asarray(seconds, dtype=np.float64)).astype(np.int64)
+    return [
+        _HOURS[hours] + _MINUTES_SECONDS[rest]
+        for hours, rest in zip((whole // 3600 % 24).tolist(), (whole % 3600).tolist())
+    ]
+
+
+def as_transcript(transcript: Union[Transcript, List[Dict]]) -> Transcript:
+    """A Transcript of either a Transcript or transcript.json style entries."""
+    if isinstance(transcript, Transcript):
+        return transcript
+    return Transcript.from_entries(transcript)
+
+
+def write_json_entries(entries: Iterable[Dict], path: str):
+    """
+    Writes entries to a JSON file one at a time, formatted like
+    `json.dumps(entries, indent=2)`.
+
+    The file is written next to `path` and moved into place once complete, so
+    an interrupted write never leaves a truncated transcript.json behind.
+    """
+    partial_path = f"{path}.partial"
+    with open(partial_path, "w") as f:
+        separator = "[\n"
+        for entry in entries:
+            f.write(separator)
+            f.write(_dump_entry(entry))
+            separator = ",\n"
+        f.write("[]" if separator == "[\n" else "\n]")
+    os.replace(partial_path, path)
+
+
+def _dump_entry(entry: Dict) -> str:
+    """An entry as `json.dumps(entry, indent=2)` would write it inside a list."""
+    flat = entry and all(
+        isinstance(k, str) and not isinstance(v, (dict, list, tuple)) for k, v in entry.items()
+    )
+    if not flat:
+        return "  " + json.dumps(entry, indent=2).replace("\n", "\n  ")
+    # json.dumps only uses the (much faster) C encoder without indentation, so
+    # lay out the keys of flat entries here.
+    items = ",\n".join(f"    {json.dumps(k)}: {json.dumps(v)}" for k, v in entry.items())
+    return f"  {{\n{items}\n  }}"
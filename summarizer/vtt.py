@@ -1,5 +1,17 @@
+import io
+import json
 import os
 import re
+import time
+from typing import IO, Iterable, Iterator, List, NamedTuple, Tuple, Union
+
+
+TIME_STRING_PATTERNS = [
+    re.compile(r"^(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2}).(?P<ms>\d{3})$"),
+    re.compile(r"^(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2})"),
+    re.compile(r"^(?P<minute>\d{2}):(?P<second>\d{2}).(?P<ms>\d{3})$"),
+    re.compile(r"^(?P<hour>\d{2}):(?P<minute>\d{2})$"),
+]
 
 
 def time_string_to_seconds(time_string):
@@ -9,17 +21,10 @@ def time_string_to_seconds(time_string):
     :param time_string: String representing the time.
     :return: Time in seconds as a float.
     """
-    patterns = [
-        re.compile(r"^(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2}).(?P<ms>\d{3})$"),
-        re.compile(r"^(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2})"),
-        re.compile(r"^(?P<minute>\d{2}):(?P<second>\d{2}).(?P<ms>\d{3})$"),
-        re.compile(r"^(?P<hour>\d{2}):(?P<minute>\d{2})$"),
-    ]
-
     hours = 0
     minutes = 0
     seconds = 0
-    for pattern in patterns:
+    for pattern in TIME_STRING_PATTERNS:
         match = pattern.match(time_string)
         if match:
             hours = match.groupdict().get("hour", 0)
@@ -30,30 +35,136 @@ def time_string_to_seconds(time_string):
     return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
 
 
-def extract_transcript_start_times(dir: str):
+# A "start": "hh:mm:ss" line of transcript.json, as it is written indented.
+START_TIME_LINE = re.compile(r'^\s*"start": "([^"]*)",?$')
+
+
+def extract_transcript_start_times(dir: str) -> List[str]:
     """
-    Extracts start times from a VTT file.
+    Extracts the start time of every cue of 'dir/transcript.json', without
+    parsing the whole file.
 
-    :param vtt_path: Path to the VTT file.
-    :return: List of start times in seconds.
+    :param dir: Directory of the transcript.
+    :return: List of "hh:mm:ss" start times.
     """
-    vtt_path = os.path.join(dir, "transcript.json")
+    json_path = os.path.join(dir, "transcript.json")
 
     start_times = []
-    patterns = [
-        re.compile(r"^(\d{2}:\d{2}:\d{2}.\d{3}) --> \d{2}:\d{2}:\d{2}.\d{3}$"),
-        re.compile(r"^(\d{2}:\d{2}.\d{3}) --> \d{2}:\d{2}.\d{3}$"),
-    ]
-    with open(vtt_path, "r") as file:
+    with open(json_path, "r") as file:
         for line in file:
-            for pattern in patterns:
-                match = pattern.search(line)
-                if match:
-                    time_str = match.group(1)
-                    # Normalize to HH:MM:SS format
-                    normalized_time = time_string_to_seconds(time_str)
-                    hours, remainder = divmod(normalized_time, 3600)
-                    minutes, seconds = divmod(remainder, 60)
-                    start_times.append(f"{int(hours):02}:{int(minutes):02}:{int(seconds):02}")
-                    break
-    return start_times
+            match = START_TIME_LINE.match(line)
+            if match:
+                start_times.append(match.group(1))
+    if start_times:
+        return start_times
+
+    # Not written one key per line (or empty): parse it.
+    with open(json_path, "r") as file:
+        return [entry["start"] for entry in json.load(file)]
+
+
+class Caption(NamedTuple):
+    """A cue of a VTT or SRT file, with the attributes of a `webvtt` caption."""
+
+    start_in_seconds: float
+    end_in_seconds: float
+    text: str
+
+
+# "hh:mm:ss.ttt --> hh:mm:ss.ttt" (hours optional), with a comma before the
+# milliseconds in SRT, and cue settings after it in VTT.
+TIMING_PATTERN = re.compile(
+    r"^\s*((?:\d+:)?\d{2}:\d{2}[.,]\d{3})\s+-->\s+((?:\d+:)?\d{2}:\d{2}[.,]\d{3})"
+)
+
+
+def timestamp_to_seconds(timestamp: str) -> float:
+    """Converts a "hh:mm:ss.ttt", "mm:ss.ttt" or "hh:mm:ss,ttt" cue timestamp to seconds."""
+    parts = timestamp.replace(",", ".").split(":")
+    hours = int(parts[0]) if len(parts) == 3 else 0
+    return hours * 3600 + int(parts[-2]) * 60 + float(parts[-1])
+
+
+def read_captions(source: Union[str, IO[str]]) -> Iterator[Caption]:
+    """
+    Reads the cues of a VTT or SRT file one at a time, holding no more than
+    one cue in memory.
+
+    Headers, NOTE, STYLE and REGION blocks, cue identifiers and SRT indexes
+    are skipped: a cue starts at its timing line and ends at a blank line.
+
+    :param source: Path to the file, or an open text file.
+    """
+    if isinstance(source, str):
+        with open(source, "r", encoding="utf-8-sig") as file:
+            yield from read_captions(file)
+        return
+
+    start = end = None
+    lines = []
+    for line in source:
+        line = line.rstrip("\r\n")
+        if start is None:
+            match = TIMING_PATTERN.match(line)
+            if match:
+                start, end = timestamp_to_seconds(match.group(1)), timestamp_to_seconds(match.group(2))
+                lines = []
+        elif line.strip():
+            lines.append(line)
+        else:
+            yield Caption(start, end, "\n".join(lines))
+            start = None
+    if start is not None:
+        yield Caption(start, end, "\n".join(lines))
+
+
+def write_vtt(captions: Iterable[Caption], path: str):
+    """
+    Writes captions to a VTT file as they are read. The file is replaced
+    rather than written into, as it may be a hard link to a stored artifact.
+    """
+    partial_path = f"{path}.partial"
+    with open(partial_path, "w") as file:
+        file.write("WEBVTT\n")
+        for caption in captions:
+            file.write(
+                f"\n{seconds_to_vtt_time(caption.start_in_seconds)} --> "
+                f"{seconds_to_vtt_time(caption.end_in_seconds)}\n{caption.text.strip()}\n"
+            )
+    os.replace(partial_path, path)
+
+
+def seconds_to_hms(seconds: float) -> str:
+    return time.strftime("%H:%M:%S", time.gmtime(seconds))
+
+
+def seconds_to_vtt_time(seconds: float) -> str:
+    """Format seconds as a "hh:mm:ss.ddd" VTT timestamp."""
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3600 * 1000)
+    minutes, milliseconds = divmod(milliseconds, 60 * 1000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02}:{minutes:02}:{seconds:02}.{milliseconds:03}"
+
+
+def stitch_vtt(pieces: List[Tuple[str, float, float, float]]) -> str:
+    """
+    Join the VTT transcripts of overlapping pieces of the same media into one.
+
+    :param pieces: (vtt text, offset, owned start, owned end) of each piece.
+        Cue times are shifted by the offset (where the piece starts in the
+        media), and only cues starting between the owned start and end are
+        kept, so speech in the overlap between two pieces appears once.
+    :return: The combined VTT text.
+    """
+    lines = ["WEBVTT", ""]
+    for text, offset, owned_start, owned_end in pieces:
+        for caption in read_captions(io.StringIO(text)):
+            start = caption.start_in_seconds + offset
+            if not owned_start <= start < owned_end:
+                continue
+            end = caption.end_in_seconds + offset
+            lines.append(f"{seconds_to_vtt_time(start)} --> {seconds_to_vtt_time(end)}")
+            lines.append(caption.text.strip())
+            lines.append("")
+    return "\n".join(lines)
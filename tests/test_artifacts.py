@@ -0,0 +1,116 @@
+import json
+import os
+
+import pytest
+from summarizer import summarizer
+from summarizer.artifacts import ARTIFACTS_FILE, ArtifactManifest, StageInputs
+
+
+def inputs(chunk_tokens: int = 6000):
+    return {
+        "transcript": StageInputs(outputs=["transcript.json", "transcript.vtt"], params={"model": "whisper-1"}, upstream=[]),
+        "summary": StageInputs(outputs=["chapters.json"], params={"chunk_tokens": chunk_tokens}, upstream=["transcript"]),
+        "title": StageInputs(outputs=["title.json"], params={}, upstream=["summary"]),
+    }
+
+
+def make(dir, stages, *names):
+    manifest = ArtifactManifest(str(dir))
+    for name in names:
+        for output in stages[name]["outputs"]:
+            (dir / output).write_text(f"{name} {output}")
+        manifest.record(name, stages)
+
+
+def test_unchanged_artifacts_are_kept(tmp_path):
+    stages = inputs()
+    make(tmp_path, stages, "transcript", "summary", "title")
+    assert ArtifactManifest(str(tmp_path)).invalidate(stages) == {}
+    assert sorted(os.listdir(tmp_path)) == [ARTIFACTS_FILE, "chapters.json", "title.json", "transcript.json", "transcript.vtt"]
+
+
+def test_changed_params_remove_downstream_artifacts(tmp_path):
+    make(tmp_path, inputs(), "transcript", "summary", "title")
+    reasons = ArtifactManifest(str(tmp_path)).invalidate(inputs(chunk_tokens=3000))
+    assert reasons == {"summary": "chunk_tokens changed", "title": "summary changed"}
+    assert sorted(os.listdir(tmp_path)) == [ARTIFACTS_FILE, "transcript.json", "transcript.vtt"]
+
+
+def test_edited_artifacts_are_kept_but_downstream_remade(tmp_path):
+    stages = inputs()
+    make(tmp_path, stages, "transcript", "summary", "title")
+    (tmp_path / "chapters.json").write_text("edited by hand")
+    assert ArtifactManifest(str(tmp_path)).invalidate(stages) == {"title": "summary changed"}
+    assert (tmp_path / "chapters.json").read_text() == "edited by hand"
+
+
+def test_missing_upstream_removes_downstream(tmp_path):
+    stages = inputs()
+    make(tmp_path, stages, "transcript", "summary")
+    os.remove(tmp_path / "transcript.json")
+    assert ArtifactManifest(str(tmp_path)).invalidate(stages) == {"summary": "transcript changed"}
+    assert not (tmp_path / "chapters.json").exists()
+
+
+def test_unrecorded_artifacts_are_adopted(tmp_path):
+    for name in ["transcript.json", "chapters.json", "title.json"]:
+        (tmp_path / name).write_text(name)
+    assert ArtifactManifest(str(tmp_path)).invalidate(inputs()) == {}
+
+
+def test_adopted_records_are_checked(tmp_path):
+    first, second = tmp_path / "first", tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+    make(first, inputs(), "transcript", "summary")
+    for name in ["transcript.json", "transcript.vtt", "chapters.json"]:
+        os.link(first / name, second / name)
+
+    manifest = ArtifactManifest(str(second))
+    for stage, record in ArtifactManifest(str(first)).stages.items():
+        manifest.adopt(stage, record)
+    assert ArtifactManifest(str(second)).invalidate(inputs(chunk_tokens=3000)) == {"summary": "chunk_tokens changed"}
+    assert (first / "chapters.json").exists()
+
+
+@pytest.mark.asyncio
+async def test_update_all_only_remakes_stale_stages(tmp_path, monkeypatch):
+    dirname = tmp_path / "talk"
+    dirname.mkdir()
+    (dirname / "audio.mp3").write_bytes(b"")
+    (dirname / "transcript.json").write_text(json.dumps([
+        {"id": 0, "start": "00:00:00", "end": "00:00:05", "text": "Hello."},
+    ]))
+    chapters = [{"title": "Hello", "summary": "Hello.", "insights": [{"sourceIds": [0], "markdown": "Hello."}]}]
+    (dirname / "chapters-time.json").write_text(json.dumps(chapters))
+    (dirname / "title.json").write_text(json.dumps({"title": "Hello", "description": "Hello."}))
+
+    made = []
+
+    # Like the real stages, these skip artifacts that are already there.
+    async def summary(dir, *args):
+        if (dirname / "chapters-time.json").exists():
+            return chapters
+        made.append("summary")
+        (dirname / "chapters-time.json").write_text(json.dumps(chapters))
+        return chapters
+
+    async def title(dir, *args):
+        if (dirname / "title.json").exists():
+            return json.loads((dirname / "title.json").read_text())
+        made.append("title")
+        (dirname / "title.json").write_text(json.dumps({"title": "Remade", "description": "Hello."}))
+        return {"title": "Remade", "description": "Hello."}
+
+    monkeypatch.setattr(summarizer, "update_summary", summary)
+    monkeypatch.setattr(summarizer, "update_title", title)
+
+    async def run(chunk_tokens: int):
+        await summarizer.update_all("talk.mp3", str(dirname), "time", None, None, 5, False, True, chunk_tokens=chunk_tokens)
+
+    await run(6000)
+    assert made == []
+    await run(3000)
+    assert made == ["summary", "title"]
+    await run(3000)
+    assert made == ["summary", "title"]
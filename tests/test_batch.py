@@ -0,0 +1,58 @@
+import json
+
+import pytest
+from summarizer.batch import (
+    DONE,
+    FAILED,
+    SKIPPED,
+    BatchManifest,
+    find_media_files,
+    run_batch,
+)
+
+
+def test_find_media_files(tmp_path):
+    (tmp_path / "talks" / "2024").mkdir(parents=True)
+    (tmp_path / "talks" / "a.mp4").write_bytes(b"")
+    (tmp_path / "talks" / "2024" / "b.MP3").write_bytes(b"")
+    (tmp_path / "talks" / "notes.txt").write_bytes(b"")
+    (tmp_path / "c.wav").write_bytes(b"")
+
+    found = find_media_files([str(tmp_path / "talks"), str(tmp_path / "*.wav"), str(tmp_path / "missing.mp4")])
+
+    assert found == sorted([
+        str(tmp_path / "talks" / "a.mp4"),
+        str(tmp_path / "talks" / "2024" / "b.MP3"),
+        str(tmp_path / "c.wav"),
+    ])
+
+
+@pytest.mark.asyncio
+async def test_run_batch_resumes(tmp_path):
+    manifest_path = str(tmp_path / "tldl-batch.json")
+    calls = []
+
+    async def process(file_path, on_stage_done):
+        calls.append(file_path)
+        on_stage_done("audio")
+        if file_path == "broken.mp4":
+            raise RuntimeError("boom")
+        on_stage_done("html")
+        return None if file_path == "silent.mp4" else f"out/{file_path}"
+
+    files = ["a.mp4", "broken.mp4", "silent.mp4"]
+    counts = await run_batch(files, process, BatchManifest(manifest_path), jobs=2, quiet=True)
+
+    assert counts == {DONE: 1, FAILED: 1, SKIPPED: 1}
+    with open(manifest_path) as f:
+        saved = json.load(f)["files"]
+    assert saved["a.mp4"]["stages"] == {"audio": DONE, "html": DONE}
+    assert saved["a.mp4"]["output"] == "out/a.mp4"
+    assert saved["broken.mp4"]["error"] == "RuntimeError: boom"
+
+    # Running the batch again only retries the file that failed.
+    calls.clear()
+    counts = await run_batch(files, process, BatchManifest(manifest_path), jobs=2, quiet=True)
+
+    assert calls == ["broken.mp4"]
+    assert counts == {DONE: 1, FAILED: 1, SKIPPED: 1}
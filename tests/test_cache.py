@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+from langchain_community.llms.fake import FakeListLLM
+from summarizer.cache import LLMCache
+from summarizer.engine import LLMEngine
+from summarizer.templates import make_title_chain
+
+
+chapters = [{"title": "Intro", "summary": "Hello world."}]
+title = {"title": "Hello", "description": "A greeting."}
+
+
+def make_title(chapters, model):
+    return asyncio.run(make_title_chain(chapters)(model))
+
+
+def test_cache_reuses_responses(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.sqlite"))
+    model = FakeListLLM(responses=[json.dumps(title)], cache=cache)
+
+    assert make_title(chapters, model) == title
+    assert cache.stats()["misses"] == 1
+
+    # A new cache on the same file, the model isn't called again.
+    cache = LLMCache(str(tmp_path / "llm.sqlite"))
+    model = FakeListLLM(responses=[json.dumps(title)], cache=cache)
+    assert make_title(chapters, model) == title
+    assert cache.stats()["hits"] == 1
+    assert model.i == 0
+
+    # A different prompt misses.
+    model = FakeListLLM(responses=[json.dumps(title)], cache=cache)
+    make_title(chapters * 2, model)
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_eviction(tmp_path):
+    # Room for two responses
+    cache = LLMCache(str(tmp_path / "llm.sqlite"), max_bytes=400)
+    model = FakeListLLM(responses=[json.dumps(title)], cache=cache)
+
+    make_title(chapters, model)
+    make_title(chapters * 2, model)
+    make_title(chapters, model)  # Now the most recently used
+    make_title(chapters * 3, model)
+    assert cache.stats()["entries"] == 2
+
+    make_title(chapters, model)
+    assert cache.hits == 2
+    make_title(chapters * 2, model)
+    assert cache.misses == 4
+
+
+def test_cache_expiry(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.sqlite"), max_age_secs=-1)
+    model = FakeListLLM(responses=[json.dumps(title)] * 2, cache=cache)
+
+    make_title(chapters, model)
+    make_title(chapters, model)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_malformed_answers_are_not_kept(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.sqlite"))
+    model = FakeListLLM(responses=["Sorry, I can't do that.", json.dumps(title), "Unused."], cache=cache)
+
+    # The malformed answer is dropped, and asked for again.
+    engine = LLMEngine(0, 0)
+    assert asyncio.run(make_title_chain(chapters, engine)(model)) == title
+    assert model.i == 2
+    assert engine.metrics[0]["attempts"] == 2
+    assert cache.stats()["entries"] == 1
+
+    # The good one is kept.
+    assert asyncio.run(make_title_chain(chapters, engine)(model)) == title
+    assert model.i == 2
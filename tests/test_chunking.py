@@ -0,0 +1,35 @@
+import pytest
+from summarizer.chunking import estimate_tokens, pack_ranges
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("", 0),
+        ("Hello world.", 3),
+        ("id(12)|start(00:01:05) : transcription", 17),
+        ("1234567", 3),
+    ],
+)
+def test_estimate_tokens(text, expected):
+    assert estimate_tokens(text) == expected
+
+
+@pytest.mark.parametrize(
+    "ranges, cue_tokens, budget, expected",
+    [
+        # Small neighbours are merged
+        ([[0, 2], [2, 3], [3, 5]], [10] * 5, 30, [[0, 3], [3, 5]]),
+        # Large ranges are split into roughly equal pieces
+        ([[0, 10]], [10] * 10, 40, [[0, 3], [3, 7], [7, 10]]),
+        # A cue over the budget gets a range of its own
+        ([[0, 3]], [10, 100, 10], 50, [[0, 1], [1, 2], [2, 3]]),
+        ([], [], 50, []),
+    ],
+)
+def test_pack_ranges(ranges, cue_tokens, budget, expected):
+    packed = pack_ranges(ranges, cue_tokens, budget)
+
+    assert packed == expected
+    # Every cue is still covered, in order
+    assert [i for start, end in packed for i in range(start, end)] == list(range(len(cue_tokens)))
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+from summarizer import compaction, llm
+from summarizer.compaction import TimeMap, plan_kept_segments, remap_captions
+from summarizer.transcript import Transcript
+from summarizer.vtt import Caption
+
+
+def test_plan_kept_segments():
+    # The silence at 10s is too short to cut once padded, and cuts are rounded to 10ms.
+    silences = [(0.0, 2.0), (10.0, 10.4), (20.004, 30.0), (58.0, 60.0)]
+    assert plan_kept_segments(60.0, silences, 0.25) == [
+        (1.75, 20.25),
+        (29.75, 58.25),
+    ]
+
+
+def test_plan_kept_segments_without_silences():
+    assert plan_kept_segments(60.0, [], 0.25) == [(0.0, 60.0)]
+
+
+def test_time_map():
+    time_map = TimeMap([(2.0, 12.0), (20.0, 30.0)], tempo=2.0)
+    assert time_map.compact_duration == 10.0
+    assert time_map.to_source(0.0) == 2.0
+    assert time_map.to_source(4.0) == 10.0
+    # The cut between the segments is skipped.
+    assert time_map.to_source(5.0) == 20.0
+    assert time_map.to_source(6.0) == 22.0
+    # Past the end of the compacted audio (MP3 padding, say).
+    assert time_map.to_source(11.0) == 30.0
+
+
+def test_remap_captions():
+    time_map = TimeMap([(0.0, 5.0), (65.0, 70.0)])
+    captions = [Caption(1.0, 2.0, "Before the break."), Caption(6.0, 7.5, "After it.")]
+    assert list(remap_captions(captions, time_map)) == [
+        Caption(1.0, 2.0, "Before the break."),
+        Caption(66.0, 67.5, "After it."),
+    ]
+
+
+def test_create_compact_speech_reuses_audio(tmp_path, monkeypatch):
+    encoded = []
+    monkeypatch.setattr(compaction, "media_duration", lambda _: 60.0)
+    monkeypatch.setattr(compaction, "detect_silences", lambda _, min_duration: [(20.0, 40.0)])
+    monkeypatch.setattr(
+        compaction,
+        "create_speech_audio",
+        lambda _, segments, tempo, path: encoded.append(tempo) or open(path, "wb").write(b"audio"),
+    )
+
+    time_map = compaction.create_compact_speech("talk.mp4", str(tmp_path), tempo=1.5)
+    assert time_map.segments == [(0.0, 20.25), (39.75, 60.0)]
+    assert json.loads((tmp_path / "speech.json").read_text())["tempo"] == 1.5
+
+    compaction.create_compact_speech("talk.mp4", str(tmp_path), tempo=1.5)
+    assert encoded == [1.5]
+    # A different tempo needs new audio.
+    compaction.create_compact_speech("talk.mp4", str(tmp_path), tempo=2.0)
+    assert encoded == [1.5, 2.0]
+
+
+@pytest.mark.asyncio
+async def test_create_transcript_of_compacted_speech(tmp_path, monkeypatch):
+    vtt = (
+        "WEBVTT\n\n"
+        "00:00:01.000 --> 00:00:02.000\nBefore the break.\n\n"
+        "00:00:06.000 --> 00:00:07.500\nAfter it.\n"
+    )
+
+    async def transcribe_audio(client, media_path):
+        return vtt
+
+    monkeypatch.setattr(llm, "transcribe_audio", transcribe_audio)
+    monkeypatch.setattr(llm, "get_openai_client", lambda: None)
+
+    time_map = TimeMap([(0.0, 5.0), (65.0, 70.0)])
+    transcript = await llm.create_transcript("speech.mp3", str(tmp_path), time_map=time_map)
+
+    assert isinstance(transcript, Transcript)
+    assert [(cue["start"], cue["end"]) for cue in transcript] == [
+        ("00:00:01", "00:00:02"),
+        ("00:01:06", "00:01:07"),
+    ]
+    assert "00:01:06.000 --> 00:01:07.500" in (tmp_path / "transcript.vtt").read_text()
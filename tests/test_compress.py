@@ -0,0 +1,67 @@
+import gzip
+import os
+
+import pytest
+from summarizer.artifacts import ArtifactManifest, StageInputs
+from summarizer.compress import compress_artifacts, compress_file
+
+
+def test_compress_file(tmp_path):
+    path = tmp_path / "transcript.json"
+    path.write_text('[{"text": "Hello."}]' * 100)
+
+    written = compress_file(str(path))
+
+    assert str(path) + ".gz" in written
+    assert gzip.decompress((tmp_path / "transcript.json.gz").read_bytes()) == path.read_bytes()
+    # Fresh copies are kept
+    assert compress_file(str(path)) == []
+
+    path.write_text("[]")
+    os.utime(path, (os.path.getmtime(path) + 10,) * 2)
+    assert str(path) + ".gz" in compress_file(str(path))
+    assert gzip.decompress((tmp_path / "transcript.json.gz").read_bytes()) == b"[]"
+
+
+def test_brotli(tmp_path):
+    brotli = pytest.importorskip("brotli")
+    path = tmp_path / "index.html"
+    path.write_text("<html></html>")
+
+    compress_file(str(path))
+
+    assert brotli.decompress((tmp_path / "index.html.br").read_bytes()) == path.read_bytes()
+
+
+def test_compress_artifacts(tmp_path):
+    (tmp_path / "snapshots").mkdir()
+    for name in [
+        "index.html", "title.json", "snapshots/snapshots.json", "audio.mp3", "snapshots/00_00_01.jpg",
+        "artifacts.json", "source.json", "tldl-batch.json",
+    ]:
+        (tmp_path / name).write_text("data")
+    # Left by an earlier run: a removed artifact's copy, and a bookkeeping file's.
+    (tmp_path / "chapters-time.json.gz").write_text("stale")
+    (tmp_path / "source.json.gz").write_text("stale")
+
+    written = compress_artifacts(str(tmp_path))
+
+    assert sorted(os.path.relpath(p, tmp_path) for p in written if p.endswith(".gz")) == [
+        "index.html.gz",
+        os.path.join("snapshots", "snapshots.json.gz"),
+        "title.json.gz",
+    ]
+    assert not (tmp_path / "chapters-time.json.gz").exists()
+    assert not (tmp_path / "source.json.gz").exists()
+
+
+def test_removed_artifacts_take_their_copies(tmp_path):
+    stages = {"title": StageInputs(outputs=["title.json"], params={"version": 1}, upstream=[])}
+    (tmp_path / "title.json").write_text("{}")
+    ArtifactManifest(str(tmp_path)).record("title", stages)
+    compress_artifacts(str(tmp_path))
+
+    stages["title"]["params"]["version"] = 2
+    ArtifactManifest(str(tmp_path)).invalidate(stages)
+
+    assert not (tmp_path / "title.json.gz").exists()
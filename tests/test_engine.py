@@ -0,0 +1,103 @@
+import json
+import time
+
+import httpx
+import openai
+import pytest
+from langchain_community.llms.fake import FakeListLLM
+from langchain_core.runnables import RunnableLambda
+from summarizer.engine import LLMEngine, TokenBucket
+from summarizer.templates import make_title_chain
+
+
+def api_error(error_class, status_code, headers=None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return error_class("failed", response=response, body=None)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(600)  # 10 a second
+    await bucket.acquire(600)
+
+    start = time.monotonic()
+    await bucket.acquire(2)
+    assert time.monotonic() - start == pytest.approx(0.2, abs=0.1)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_unlimited():
+    bucket = TokenBucket(0)
+    for _ in range(1000):
+        await bucket.acquire(1000)
+
+
+@pytest.mark.asyncio
+async def test_retries_rate_limits_and_server_errors():
+    errors = [
+        api_error(openai.RateLimitError, 429, {"retry-after": "0.01"}),
+        api_error(openai.InternalServerError, 503),
+    ]
+
+    def call(input):
+        if errors:
+            raise errors.pop(0)
+        return input.upper()
+
+    engine = LLMEngine(0, 0, backoff_secs=0.01)
+    assert await engine.run(RunnableLambda(call), "ok") == "OK"
+    assert engine.metrics[0]["attempts"] == 3
+    assert engine.stats()["retries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_gives_up_on_other_errors():
+    def call(input):
+        raise api_error(openai.BadRequestError, 400)
+
+    engine = LLMEngine(0, 0, backoff_secs=0.01)
+    with pytest.raises(openai.BadRequestError):
+        await engine.run(RunnableLambda(call), "ok")
+
+
+@pytest.mark.asyncio
+async def test_title_chain_runs_on_the_engine():
+    title = {"title": "Hello", "description": "A greeting."}
+    model = FakeListLLM(responses=[json.dumps(title)])
+    engine = LLMEngine(60, 100000)
+
+    chain = make_title_chain([{"title": "Intro", "summary": "Hello world."}], engine)
+
+    assert await chain(model) == title
+    assert engine.stats()["requests"] == 1
+    assert "LLM requests: 1" in engine.report()
+
+
+@pytest.mark.asyncio
+async def test_cached_responses_are_not_rate_limited():
+    # FakeListLLM reports no token usage, like a response from the LLM cache.
+    title = {"title": "Hello", "description": "A greeting."}
+    model = FakeListLLM(responses=[json.dumps(title)])
+    engine = LLMEngine(60, 60000)
+    chapters = [{"title": "Intro", "summary": "word " * 6000}]
+
+    start = time.monotonic()
+    for _ in range(12):
+        assert await make_title_chain(chapters, engine, chunk_tokens=100000)(model) == title
+    assert time.monotonic() - start < 5
+
+
+@pytest.mark.asyncio
+async def test_failed_attempts_give_back_their_tokens():
+    errors = [api_error(openai.InternalServerError, 503)] * 3
+
+    def call(input):
+        if errors:
+            raise errors.pop(0)
+        return input
+
+    engine = LLMEngine(0, 60000, backoff_secs=0.01)
+    await engine.run(RunnableLambda(call), "ok")
+    # Only the estimate of the successful attempt, which reported no usage, was taken and given back.
+    assert engine.tokens.available == pytest.approx(60000, rel=0.01)
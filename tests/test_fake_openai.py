@@ -0,0 +1,101 @@
+import io
+import json
+import threading
+import urllib.request
+
+import openai
+import pytest
+from summarizer import llm
+from summarizer.engine import LLMEngine
+from summarizer.fake_openai import FakeOpenAI, FakeOpenAIServer, canned_completion, mp3_duration
+from summarizer.templates import make_title_chain, summarize_time_chunk
+from summarizer.vtt import read_captions
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def serve(**options) -> FakeOpenAIServer:
+        server = FakeOpenAIServer(("127.0.0.1", 0), FakeOpenAI(latency_ms=1, seed=1, **options))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    llm.set_openai_base_url(None)
+
+
+def mp3_frame(header: bytes, frames: int = 0) -> bytes:
+    """A 417 byte MPEG-1 layer III frame, with a Xing header when `frames` is given."""
+    body = bytearray(413)
+    if frames:
+        body[32:44] = b"Xing" + (1).to_bytes(4, "big") + frames.to_bytes(4, "big")
+    return header + bytes(body)
+
+
+def test_mp3_duration():
+    # 128kbit/s, 44.1kHz
+    header = b"\xff\xfb\x90\x00"
+    assert mp3_duration(mp3_frame(header) * 1000) == pytest.approx(1000 * 417 * 8 / 128000)
+    assert mp3_duration(b"ID3\x04\x00\x00\x00\x00\x00\x02xx" + mp3_frame(header, frames=441)) == pytest.approx(441 * 1152 / 44100)
+    assert mp3_duration(b"RIFF" + bytes(100)) is None
+
+
+def test_canned_completion():
+    source = "\n".join(f"id({i})|start(00:00:0{i}) : Cue {i}." for i in range(3, 8))
+    articles = json.loads(canned_completion(source))["articles"]
+    assert [[p["sourceIds"] for p in a["insights"]] for a in articles] == [[[3, 4], [5, 6, 7]]]
+    assert json.loads(canned_completion("Create a title for the transcript above"))["title"]
+
+
+@pytest.mark.asyncio
+async def test_summaries_and_titles(serve):
+    server = serve()
+    llm.set_openai_base_url(server.base_url)
+    engine = LLMEngine(rpm=0, tpm=0)
+
+    source = "\n".join(f"id({i})|start(00:00:0{i}) : Cue {i}." for i in range(4))
+    summary = await summarize_time_chunk(llm.get_llm(), source, engine)
+    assert [p["sourceIds"] for p in summary["articles"][0]["insights"]] == [[0, 1], [2, 3]]
+
+    title = await make_title_chain(summary["articles"], engine)(llm.get_llm())
+    assert set(title) == {"title", "description"}
+    assert engine.metrics[0]["prompt_tokens"] > 0
+    assert server.fake.stats["completions"] == 2
+
+
+@pytest.mark.asyncio
+async def test_transcription(serve):
+    server = serve()
+    llm.set_openai_base_url(server.base_url)
+    # 10s at 128kbit/s
+    audio = io.BytesIO(mp3_frame(b"\xff\xfb\x90\x00") * 384)
+    audio.name = "audio.mp3"
+
+    vtt = await llm.get_openai_client().audio.transcriptions.create(file=audio, model="whisper-1", response_format="vtt")
+    captions = list(read_captions(io.StringIO(vtt)))
+    assert [c.start_in_seconds for c in captions] == [0, 4, 8]
+    assert captions[-1].end_in_seconds == pytest.approx(10, abs=0.01)
+
+
+@pytest.mark.asyncio
+async def test_rate_limits_and_errors(serve):
+    client = openai.AsyncOpenAI(base_url=serve(rpm=2).base_url, api_key="unused", max_retries=0)
+    messages = [{"role": "user", "content": "id(0)|start(00:00:00) : Hi."}]
+    for _ in range(2):
+        await client.chat.completions.create(model="gpt-3.5-turbo-16k", messages=messages)
+    with pytest.raises(openai.RateLimitError) as error:
+        await client.chat.completions.create(model="gpt-3.5-turbo-16k", messages=messages)
+    assert 59 < float(error.value.response.headers["retry-after"]) <= 60
+
+    failing = serve(error_rate=1)
+    client = openai.AsyncOpenAI(base_url=failing.base_url, api_key="unused", max_retries=0)
+    with pytest.raises(openai.InternalServerError):
+        await client.chat.completions.create(model="gpt-3.5-turbo-16k", messages=messages)
+
+    with urllib.request.urlopen(f"{failing.base_url}/stats") as response:
+        assert json.load(response)["errors"] == 1
@@ -0,0 +1,31 @@
+import logging
+import os
+import subprocess
+
+from summarizer import ffmpeg
+
+
+def test_snapshot_frames_are_matched_by_time(tmp_path, monkeypatch, caplog):
+    # No frame for 00:00:40, in the middle of the batch.
+    def run(command, **kwargs):
+        output = command[-1]
+        stderr = []
+        for i, pts_time in enumerate([0, 38, 90]):
+            with open(output % (i + 1), "w") as f:
+                f.write(str(pts_time))
+            stderr.append(f"[Parsed_showinfo_2 @ 0x1] n:{i} pts:{pts_time} pts_time:{pts_time} duration:1")
+        return subprocess.CompletedProcess(command, 0, stderr="\n".join(stderr))
+
+    monkeypatch.setattr(ffmpeg.subprocess, "run", run)
+    seconds = [2, 40, 42, 92]
+    paths = [str(tmp_path / f"{s}.jpg") for s in seconds]
+
+    with caplog.at_level(logging.WARNING):
+        ffmpeg.take_snapshots("video.mp4", seconds, paths)
+
+    assert {name: (tmp_path / name).read_text() for name in os.listdir(tmp_path)} == {
+        "2.jpg": "0",
+        "40.jpg": "38",
+        "92.jpg": "90",
+    }
+    assert "at 00:00:42" in caplog.text
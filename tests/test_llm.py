@@ -1,6 +1,12 @@
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
 import pytest
+from openai import AsyncOpenAI
 from unittest.mock import patch, AsyncMock
-import llm
+from summarizer import llm
+from summarizer.transcript import Transcript
 
 
 VTT = ""
@@ -11,20 +17,22 @@ with open("tests/fixtures/sample.vtt", "r") as file:
 @pytest.mark.asyncio
 async def test_create_transcript(monkeypatch):
     monkeypatch.setattr("os.path.exists", lambda _: False)
-    monkeypatch.setattr("llm.os.makedirs", lambda _, exist_ok: None)
-    monkeypatch.setattr(
-        "llm.openai_client.audio.transcriptions.create",
-        AsyncMock(return_value=VTT),
-    )
+    monkeypatch.setattr("summarizer.llm.os.makedirs", lambda _, exist_ok: None)
+    client = AsyncOpenAI(api_key="test")
+    monkeypatch.setattr(client.audio.transcriptions, "create", AsyncMock(return_value=VTT))
+    monkeypatch.setattr("summarizer.llm.get_openai_client", lambda: client)
     SAMPLE_TRANSCRIPT = [
         {"start": "00:00:01", "end": "00:00:02", "text": "Hi everybody."}
     ]
-    monkeypatch.setattr("llm.convert_transcript_to_json", lambda _: SAMPLE_TRANSCRIPT)
+    monkeypatch.setattr("summarizer.llm.convert_transcript_to_json", lambda _: SAMPLE_TRANSCRIPT)
+    replaced = []
+    monkeypatch.setattr("summarizer.llm.os.replace", lambda *paths: replaced.append(paths))
     with patch("builtins.open") as mock_open:
         await llm.create_transcript("media_path", "dir")
         assert mock_open.call_count == 2
         mock_open.assert_any_call("media_path", "rb")
-        mock_open.assert_any_call("dir/transcript.vtt", "w")
+        mock_open.assert_any_call("dir/transcript.vtt.partial", "w")
+        assert replaced == [("dir/transcript.vtt.partial", "dir/transcript.vtt")]
         mock_file = mock_open.return_value.__enter__.return_value
         mock_file.write.assert_any_call(VTT)
 
@@ -32,8 +40,78 @@ async def test_create_transcript(monkeypatch):
 @pytest.mark.asyncio
 async def test_convert_transcript_to_json():
     json_output = llm.convert_transcript_to_json("tests/fixtures/sample.vtt")
-    assert isinstance(json_output, list)
+    assert isinstance(json_output, Transcript)
     assert len(json_output) == 5
     assert json_output[0]["start"] == "00:00:01"
     assert json_output[0]["end"] == "00:00:02"
     assert json_output[0]["text"] == "Hi everybody."
+
+
+def test_plan_transcript_chunks():
+    silences = [(250.0, 252.0), (540.0, 560.0), (900.0, 901.0)]
+    chunks = llm.plan_transcript_chunks(1500, silences, 600, 5)
+    assert [(c["owned_start"], c["owned_end"]) for c in chunks] == [
+        (0.0, 550.0),
+        (550.0, 900.5),
+        (900.5, float("inf")),
+    ]
+    assert (chunks[0]["start"], chunks[0]["end"]) == (0.0, 555.0)
+    assert (chunks[1]["start"], chunks[1]["end"]) == (545.0, 905.5)
+    assert (chunks[2]["start"], chunks[2]["end"]) == (895.5, 1500)
+
+
+class FakeTranscriptionHandler(BaseHTTPRequestHandler):
+    """Answers every transcription request with a cue at 1s and one at 9s."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        chunk = int(re.search(rb'filename="chunk_(\d+)\.mp3"', body).group(1))
+        vtt = (
+            "WEBVTT\n\n"
+            f"00:00:01.000 --> 00:00:02.000\nChunk {chunk} first.\n\n"
+            f"00:00:09.000 --> 00:00:10.000\nChunk {chunk} second.\n"
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.end_headers()
+        self.wfile.write(vtt.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_create_chunked_transcript(monkeypatch):
+    server = HTTPServer(("127.0.0.1", 0), FakeTranscriptionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = AsyncOpenAI(api_key="test", base_url=f"http://127.0.0.1:{server.server_port}/v1")
+
+    monkeypatch.setattr("summarizer.llm.media_duration", lambda _: 28)
+    monkeypatch.setattr("summarizer.llm.detect_silences", lambda _: [])
+    monkeypatch.setattr(
+        "summarizer.llm.extract_audio_segment",
+        lambda _, __, ___, path: open(path, "wb").write(b"audio"),
+    )
+
+    try:
+        vtt = await llm.create_chunked_transcript("audio.mp3", 10, 2, 2, client)
+    finally:
+        server.shutdown()
+
+    # Chunks start at 0s, 8s and 18s. Chunk 1's first cue (at 9s) is the
+    # overlap with chunk 0, and chunk 2's first cue the overlap with chunk 1.
+    assert vtt.splitlines() == [
+        "WEBVTT",
+        "",
+        "00:00:01.000 --> 00:00:02.000",
+        "Chunk 0 first.",
+        "",
+        "00:00:09.000 --> 00:00:10.000",
+        "Chunk 0 second.",
+        "",
+        "00:00:17.000 --> 00:00:18.000",
+        "Chunk 1 second.",
+        "",
+        "00:00:27.000 --> 00:00:28.000",
+        "Chunk 2 second.",
+    ]
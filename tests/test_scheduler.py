@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+import pytest
+from summarizer.scheduler import StageScheduler
+
+
+@pytest.mark.asyncio
+async def test_stages_run_concurrently():
+    # Both stages must be running at the same time to get past the barrier.
+    barrier = threading.Barrier(2, timeout=5)
+
+    def sync_stage():
+        barrier.wait()
+        return "sync"
+
+    async def async_stage():
+        await asyncio.to_thread(barrier.wait)
+        return "async"
+
+    stages = StageScheduler()
+    stages.add("sync", sync_stage)
+    stages.add("async", async_stage)
+    stages.add("joined", lambda a, b: f"{a}+{b}", "sync", "async")
+
+    results = await stages.run()
+
+    assert results["joined"] == "sync+async"
+    assert set(stages.timings) == {"sync", "async", "joined"}
+    assert "joined" in stages.report()
+
+
+@pytest.mark.asyncio
+async def test_failed_stage():
+    def fail():
+        raise RuntimeError("boom")
+
+    stages = StageScheduler()
+    stages.add("fail", fail)
+    stages.add("after", lambda _: "never", "fail")
+
+    with pytest.raises(RuntimeError):
+        await stages.run()
+    assert "after" not in stages.timings
+
+
+def test_unknown_dependency():
+    with pytest.raises(ValueError):
+        StageScheduler().add("html", lambda _: None, "title")
+
+
+@pytest.mark.asyncio
+async def test_limits_and_on_done():
+    running = 0
+    most_running = 0
+
+    async def stage():
+        nonlocal running, most_running
+        running += 1
+        most_running = max(most_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    limit = asyncio.Semaphore(1)
+    done = []
+    stages = StageScheduler({"a": limit, "b": limit}, done.append)
+    stages.add("a", stage)
+    stages.add("b", stage)
+    stages.add("c", lambda *_: None, "a", "b")
+
+    await stages.run()
+
+    assert most_running == 1
+    assert done[-1] == "c"
+    assert set(done) == {"a", "b", "c"}
@@ -0,0 +1,28 @@
+import numpy as np
+from PIL import Image
+from summarizer.similarity import SnapshotComparer, dssim, ssim
+
+
+def save_image(path, pixels):
+    Image.fromarray(pixels.astype(np.uint8), "L").save(path)
+    return str(path)
+
+
+def test_ssim():
+    image = np.random.RandomState(0).rand(144, 256) * 255
+    assert ssim(image, image) == 1.0
+    assert dssim(image, image) == 0.0
+    assert ssim(image, 255 - image) < 0
+
+
+def test_snapshot_comparer(tmp_path):
+    noise = np.random.RandomState(0).rand(360, 640) * 255
+    first = save_image(tmp_path / "first.jpg", noise)
+    same = save_image(tmp_path / "same.jpg", noise)
+    other = save_image(tmp_path / "other.jpg", 255 - noise)
+
+    comparer = SnapshotComparer()
+    assert comparer(first, same, 90)
+    assert not comparer(first, other, 90)
+    # The previous snapshot is kept decoded between comparisons.
+    assert first in comparer._cache
@@ -0,0 +1,131 @@
+import os
+
+import pytest
+from PIL import Image
+from summarizer import snapshots
+from summarizer.snapshots import candidate_start_times, create_snapshots_at_time_increments, snapshot_start_times
+from summarizer.sprites import SPRITE_TILE_WIDTH
+from summarizer.transcript import Transcript
+
+
+def test_candidate_start_times():
+    assert candidate_start_times([1, 5, 5, 7, 60], 5) == [5, 7, 60]
+
+
+def test_snapshot_start_times():
+    transcript = Transcript.from_texts(range(3), [0.5, 5.999, 3725.0], [5.999, 8.0, 3726.0], ["a", "b", "c"])
+    start_times = snapshot_start_times(transcript)
+    assert start_times == [0, 5, 3725]
+    assert snapshots.snapshot_path_for("dir", start_times[-1]) == os.path.join("dir", "snapshots", "01_02_05.jpg")
+
+
+def fake_frame(path):
+    with open(path, "w") as f:
+        f.write(os.path.basename(path))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("engine", ["single-pass", "per-timestamp"])
+async def test_create_snapshots_at_time_increments(tmp_path, monkeypatch, engine):
+    monkeypatch.setattr(
+        snapshots, "take_snapshot", lambda _, __, path: fake_frame(path)
+    )
+    monkeypatch.setattr(
+        snapshots, "take_snapshots", lambda _, __, paths: [fake_frame(p) for p in paths]
+    )
+    # 00:00:12 looks just like 00:00:06
+    monkeypatch.setattr(
+        snapshots,
+        "similar_snapshots",
+        lambda _, path, __: path.endswith("00_00_12.jpg"),
+    )
+    starts = [1, 6, 8, 12, 14, 20]
+    transcript = Transcript.from_texts(range(len(starts)), starts, starts[1:] + [25], ["..."] * len(starts))
+
+    await create_snapshots_at_time_increments("video.mp4", str(tmp_path), 5, transcript, engine)
+
+    assert sorted(os.listdir(tmp_path / "snapshots")) == [
+        "00_00_06.jpg",
+        "00_00_14.jpg",
+        "00_00_20.jpg",
+    ]
+
+
+def test_create_scene_snapshots(tmp_path, monkeypatch):
+    def take_scene_snapshots(_, threshold, min_interval, output_dir):
+        frames = []
+        for i, seconds in enumerate([5.0, 17.04, 3725.5]):
+            frames.append((seconds, os.path.join(output_dir, f"{i:06}.jpg")))
+            fake_frame(frames[-1][1])
+        return frames
+
+    monkeypatch.setattr(snapshots, "take_scene_snapshots", take_scene_snapshots)
+
+    snapshots.create_scene_snapshots("video.mp4", str(tmp_path), 5)
+
+    assert sorted(os.listdir(tmp_path / "snapshots")) == [
+        "00_00_05.jpg",
+        "00_00_17.jpg",
+        "01_02_05.jpg",
+    ]
+    assert [s["start"] for s in snapshots.create_snapshots_file(str(tmp_path))] == [
+        "00:00:05",
+        "00:00:17",
+        "01:02:05",
+    ]
+
+
+def test_reconcile_segments(tmp_path):
+    os.makedirs(tmp_path / "snapshots")
+    start_times = list(range(5, 60, 3))
+    for t in start_times:
+        fake_frame(snapshots.snapshot_path_for(str(tmp_path), t))
+
+    # Frames look alike in runs of three
+    def is_similar(path1, path2, _):
+        return int(path1[-6:-4]) // 9 == int(path2[-6:-4]) // 9
+
+    sequential = snapshots.select_snapshots(start_times, str(tmp_path), 5, is_similar)
+
+    segments = snapshots.split_into_segments(start_times, 4)
+    assert len(segments) == 4
+    segments_kept = [
+        snapshots.select_snapshots(
+            segment, str(tmp_path), 5, is_similar, (0, None) if i == 0 else (float("-inf"), None)
+        )
+        for i, segment in enumerate(segments)
+    ]
+    # Segments selected on their own disagree with the sequential selection at the boundaries
+    assert sum(segments_kept, []) != sequential
+
+    assert snapshots.reconcile_segments(segments, segments_kept, str(tmp_path), 5, is_similar) == sequential
+
+
+def test_create_snapshots_file_sorted(tmp_path):
+    os.makedirs(tmp_path / "snapshots")
+    for name in ["00_01_05.jpg", "00_00_10.jpg", "01_00_00.jpg", "00_00_05.jpg"]:
+        Image.new("RGB", (32, 18)).save(tmp_path / "snapshots" / name)
+
+    listed = snapshots.create_snapshots_file(str(tmp_path))
+
+    assert [s["start"] for s in listed] == ["00:00:05", "00:00:10", "00:01:05", "01:00:00"]
+    assert (tmp_path / "snapshots" / "snapshots.vtt").read_text().splitlines()[2:4] == [
+        "00:00:05.000 --> 00:00:10.000",
+        "00_00_05.jpg",
+    ]
+
+
+def test_create_snapshots_file_sprites(tmp_path):
+    os.makedirs(tmp_path / "snapshots")
+    for name in ["00_00_10.jpg", "00_00_05.jpg"]:
+        Image.new("RGB", (32, 18)).save(tmp_path / "snapshots" / name)
+
+    listed = snapshots.create_snapshots_file(str(tmp_path), snapshots.SPRITES_OUTPUT, end=20)
+
+    assert [(s["start"], s["source"], s["x"]) for s in listed] == [
+        ("00:00:05", "snapshots/sprite-000.jpg", 0),
+        ("00:00:10", "snapshots/sprite-000.jpg", SPRITE_TILE_WIDTH),
+    ]
+    assert sorted(os.listdir(tmp_path / "snapshots")) == ["snapshots.json", "snapshots.vtt", "sprite-000.jpg"]
+    # Running again keeps the packed snapshots
+    assert snapshots.create_snapshots_file(str(tmp_path), snapshots.SPRITES_OUTPUT, end=20) == listed
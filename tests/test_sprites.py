@@ -0,0 +1,54 @@
+import os
+
+from PIL import Image
+from summarizer.sprites import pack_sprites, write_thumbnails_vtt
+from webvtt import WebVTT
+
+COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
+
+
+def make_snapshots(dir, count):
+    os.makedirs(dir / "snapshots", exist_ok=True)
+    snapshots = []
+    for i in range(count):
+        start = f"00:00:{i * 5:02d}"
+        source = f"snapshots/{start.replace(':', '_')}.jpg"
+        Image.new("RGB", (128, 72), COLORS[i % len(COLORS)]).save(dir / source)
+        snapshots.append({"start": start, "source": source})
+    return snapshots
+
+
+def test_pack_sprites(tmp_path):
+    snapshots = make_snapshots(tmp_path, 7)
+
+    tiles = pack_sprites(str(tmp_path), snapshots, tile_width=64, columns=2, rows=2)
+
+    assert sorted(os.listdir(tmp_path / "snapshots")) == ["sprite-000.jpg", "sprite-001.jpg"]
+    assert [t["start"] for t in tiles] == [s["start"] for s in snapshots]
+    assert [(t["source"], t["x"], t["y"]) for t in tiles[3:]] == [
+        ("snapshots/sprite-000.jpg", 64, 36),
+        ("snapshots/sprite-001.jpg", 0, 0),
+        ("snapshots/sprite-001.jpg", 64, 0),
+        ("snapshots/sprite-001.jpg", 0, 36),
+    ]
+    # The last sheet only has the rows it needs
+    assert (tiles[-1]["sheet_width"], tiles[-1]["sheet_height"]) == (128, 72)
+
+    with Image.open(tmp_path / "snapshots" / "sprite-001.jpg") as sheet:
+        for i, tile in enumerate(tiles[4:], 4):
+            pixel = sheet.getpixel((tile["x"] + 32, tile["y"] + 18))
+            assert max(abs(a - b) for a, b in zip(pixel, COLORS[i % len(COLORS)])) < 16
+
+
+def test_write_thumbnails_vtt(tmp_path):
+    tiles = [
+        {"start": "00:00:00", "source": "snapshots/sprite-000.jpg", "x": 0, "y": 0, "width": 64, "height": 36},
+        {"start": "00:00:05", "source": "snapshots/sprite-000.jpg", "x": 64, "y": 0, "width": 64, "height": 36},
+    ]
+    write_thumbnails_vtt(str(tmp_path / "snapshots.vtt"), tiles, end=12.5)
+
+    captions = WebVTT.read(str(tmp_path / "snapshots.vtt")).captions
+    assert [(c.start, c.end, c.text) for c in captions] == [
+        ("00:00:00.000", "00:00:05.000", "sprite-000.jpg#xywh=0,0,64,36"),
+        ("00:00:05.000", "00:00:12.500", "sprite-000.jpg#xywh=64,0,64,36"),
+    ]
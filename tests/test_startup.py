@@ -0,0 +1,75 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+# Import time budgets, generous enough for a slow CI machine: the heavy
+# modules these runs must not import take several seconds on their own.
+HELP_BUDGET_SECS = 1.5
+CACHED_RUN_BUDGET_SECS = 3.0
+
+# Needed only to make new transcripts, summaries or topics.
+HEAVY_MODULES = ["langchain_openai", "openai", "gensim", "tomotopy", "nltk", "summarizer.templates"]
+
+CACHED_RUN = """
+import asyncio, sys
+from summarizer import summarizer
+
+dirname, cache_path = sys.argv[1:]
+cache = summarizer.setup_llm_cache(True, cache_path, 1)
+engine = summarizer.setup_llm_engine(0, 0)
+asyncio.run(summarizer.update_all("talk.mp3", dirname, "time", None, None, 5, False, True))
+summarizer.print_llm_stats(cache, engine, True)
+"""
+
+
+def import_times(*args):
+    """Run python with -X importtime: the result, and the cumulative import time of each module in seconds."""
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args], capture_output=True, text=True, env=env
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        if match:
+            times[match.group(3)] = (int(match.group(1)) / 1e6, len(match.group(2)))
+    return result, times
+
+
+def total_secs(times):
+    """Time spent importing, counting only modules imported at the top level (not by another module)."""
+    return sum(secs for secs, depth in times.values() if depth == 0)
+
+
+def test_help_startup():
+    result, times = import_times("-m", "summarizer.summarizer", "--help")
+
+    assert result.returncode == 0, result.stderr
+    assert "summarize" in result.stdout
+    assert [m for m in HEAVY_MODULES + ["langchain_core"] if m in times] == []
+    assert [m for m in ["summarizer.fake_openai", "http.server"] if m in times] == []
+    assert total_secs(times) < HELP_BUDGET_SECS
+
+
+def test_cached_run_startup(tmp_path):
+    dirname = tmp_path / "talk"
+    dirname.mkdir()
+    (dirname / "audio.mp3").write_bytes(b"")
+    (dirname / "transcript.json").write_text(json.dumps([
+        {"id": 0, "start": "00:00:00", "end": "00:00:05", "text": "Hello."},
+    ]))
+    (dirname / "chapters-time.json").write_text(json.dumps([
+        {"title": "Hello", "summary": "Hello.", "insights": [{"sourceIds": [0], "markdown": "Hello."}]},
+    ]))
+    (dirname / "title.json").write_text(json.dumps({"title": "Hello", "description": "Hello."}))
+
+    result, times = import_times("-c", CACHED_RUN, str(dirname), str(tmp_path / "llm.sqlite"))
+
+    assert result.returncode == 0, result.stderr
+    assert (dirname / "index.html").exists()
+    assert [m for m in HEAVY_MODULES if m in times] == []
+    assert total_secs(times) < CACHED_RUN_BUDGET_SECS
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+from summarizer import store
+from summarizer.snapshots import create_snapshots_file
+from summarizer.store import ArtifactStore, media_fingerprint
+
+
+@pytest.fixture(autouse=True)
+def fake_media_info(monkeypatch):
+    monkeypatch.setattr(store, "media_info", lambda _: {"format": {"duration": "60.0"}})
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+    return str(path)
+
+
+def test_media_fingerprint(tmp_path):
+    content = os.urandom(2 * 1024 * 1024)
+    original = write(tmp_path / "a" / "talk.mp4", content)
+    renamed = write(tmp_path / "b" / "renamed.mp4", content)
+    changed = write(tmp_path / "c" / "talk.mp4", content[:-1] + b"!")
+
+    assert media_fingerprint(original) == media_fingerprint(renamed)
+    assert media_fingerprint(original) != media_fingerprint(changed)
+
+
+def test_artifact_store(tmp_path):
+    artifacts = {"audio.mp3": "audio.mp3", "snapshots": "snapshots-5s"}
+    artifact_store = ArtifactStore(str(tmp_path / "store"))
+
+    first = tmp_path / "first"
+    write(first / "audio.mp3", b"audio")
+    write(first / "snapshots" / "00_00_05.jpg", b"jpg")
+    artifact_store.save_from("abcdef", str(first), artifacts)
+
+    second = tmp_path / "second"
+    assert artifact_store.link_into("abcdef", str(second), artifacts) == {"audio.mp3": None, "snapshots": None}
+    assert (second / "audio.mp3").read_bytes() == b"audio"
+    assert (second / "snapshots" / "00_00_05.jpg").read_bytes() == b"jpg"
+    # Hard links, not copies
+    assert os.stat(second / "audio.mp3").st_ino == os.stat(first / "audio.mp3").st_ino
+
+    # Nothing stored for other media
+    assert artifact_store.link_into("123456", str(tmp_path / "third"), artifacts) == {}
+
+
+def test_recorded_artifacts_are_linked_with_their_record(tmp_path):
+    artifacts = {"transcript.json": "transcript.json", "snapshots": "snapshots-5s"}
+    artifact_store = ArtifactStore(str(tmp_path / "store"))
+    first = tmp_path / "first"
+    write(first / "transcript.json", b"[]")
+    write(first / "snapshots" / "00_00_05.jpg", b"jpg")
+    record = {"stage": "transcript", "record": {"params": {"model": "whisper-1"}}}
+    artifact_store.save_from("abcdef", str(first), artifacts, {"transcript.json": record})
+
+    # Snapshots have no record of what they were made from, so aren't reused.
+    second = tmp_path / "second"
+    recorded = ["transcript.json", "snapshots"]
+    assert artifact_store.link_into("abcdef", str(second), artifacts, recorded) == {"transcript.json": record}
+    assert not (second / "snapshots").exists()
+
+
+def test_rewriting_linked_artifacts_leaves_the_store_alone(tmp_path):
+    artifacts = {"snapshots": "snapshots-5s"}
+    artifact_store = ArtifactStore(str(tmp_path / "store"))
+    first = tmp_path / "first"
+    write(first / "snapshots" / "00_00_05.jpg", b"jpg")
+    create_snapshots_file(str(first), end=10)
+    artifact_store.save_from("abcdef", str(first), artifacts)
+
+    second = tmp_path / "second"
+    artifact_store.link_into("abcdef", str(second), artifacts)
+    create_snapshots_file(str(second), end=60)
+
+    stored = tmp_path / "store" / "ab" / "abcdef" / "snapshots-5s"
+    assert "00:00:10.000" in (stored / "snapshots.vtt").read_text()
+    assert "00:01:00.000" in (second / "snapshots" / "snapshots.vtt").read_text()
@@ -0,0 +1,81 @@
+import gzip
+import json
+import os
+import re
+
+import pytest
+from click.testing import CliRunner
+from summarizer import summarizer
+from summarizer.summarizer import cli, stored_artifacts, update_html
+from summarizer.transcript import Transcript
+
+
+@pytest.mark.asyncio
+async def test_update_html(tmp_path):
+    transcript = Transcript.from_entries([
+        {"id": 0, "start": "00:00:01", "end": "00:00:02", "text": "It's </script><b>bold</b>, isn't it?"},
+    ])
+    chapters = [{"title": "Intro", "summary": "None", "insights": [{"sourceIds": [0], "markdown": "True"}]}]
+    title_data = {"title": "Tom & <Jerry>", "description": "A talk."}
+
+    await update_html(str(tmp_path), "talk-time", None, title_data, chapters, [], transcript, compress=True)
+
+    page = (tmp_path / "index.html").read_text()
+    # Embedded as JSON, and the text can't end the script early
+    assert json.loads(re.search(r"const CHAPTERS = (.*);", page).group(1)) == chapters
+    assert json.loads(re.search(r"const TRANSCRIPT = (.*);", page).group(1)) == transcript.to_entries()
+    assert "</script><b>" not in page
+    assert "<title>Tom &amp; &lt;Jerry&gt; Transcript Summary</title>" in page
+    # Rendered once: the second page is the same file
+    assert os.path.samefile(tmp_path / "index.html", tmp_path / "talk-time.html")
+    assert gzip.decompress((tmp_path / "index.html.gz").read_bytes()).decode() == page
+
+
+@pytest.mark.asyncio
+async def test_update_html_keeps_other_pages(tmp_path):
+    transcript = Transcript.from_entries([])
+    title_data = {"title": "Talk", "description": "A talk."}
+
+    await update_html(str(tmp_path), "talk-time", None, title_data, [{"title": "Time"}], [], transcript)
+    await update_html(str(tmp_path), "talk-clif", None, title_data, [{"title": "Clif"}], [], transcript)
+
+    assert '"Time"' in (tmp_path / "talk-time.html").read_text()
+    assert '"Clif"' in (tmp_path / "talk-clif.html").read_text()
+    assert '"Clif"' in (tmp_path / "index.html").read_text()
+
+
+def test_stored_snapshots_depend_on_what_they_were_taken_at(tmp_path):
+    supplied = tmp_path / "talk.srt"
+    supplied.write_text("1\n00:00:01,000 --> 00:00:02,000\nHello.\n")
+
+    generated = stored_artifacts(None, True, 5)["snapshots"]
+    assert generated == "snapshots-5s"
+    assert stored_artifacts(None, True, 5, snapshot_similarity="ssim")["snapshots"] == "snapshots-5s-ssim"
+    with_transcript = stored_artifacts(str(supplied), True, 5)["snapshots"]
+    assert with_transcript.startswith("snapshots-5s-transcript")
+
+    supplied.write_text("1\n00:00:03,000 --> 00:00:04,000\nHello.\n")
+    assert stored_artifacts(str(supplied), True, 5)["snapshots"] not in (generated, with_transcript)
+    # Scene changes don't depend on the transcript.
+    assert stored_artifacts(str(supplied), True, 5, snapshot_strategy="scene")["snapshots"] == "snapshots-5s-scene0.1"
+
+
+@pytest.mark.parametrize("args", [["talk.mp3", "-q", "1"], ["summarize", "talk.mp3", "-q", "1"], ["-q", "1", "talk.mp3"]])
+def test_summarize_is_the_default_command(tmp_path, monkeypatch, args):
+    summarized = []
+
+    async def summarize_file(file_path, **options):
+        summarized.append(file_path)
+
+    monkeypatch.setattr(summarizer, "summarize_file", summarize_file)
+    result = CliRunner().invoke(cli, [*args, "--no-llm-cache", "--no-store"])
+
+    # Nothing was made, so it exits with an error.
+    assert result.exit_code == 1, result.output
+    assert summarized == ["talk.mp3"]
+
+
+def test_cli_help():
+    result = CliRunner().invoke(cli, ["--help"])
+    assert result.exit_code == 0
+    assert "batch" in result.output
@@ -1,7 +1,12 @@
 import json
+import re
 import pytest
 from langchain_community.llms.fake import FakeListLLM
-from summarizer.templates import make_time_chain
+from summarizer import templates
+from summarizer.engine import LLMEngine
+from summarizer.templates import group_sections, make_time_chain, make_title_chain, source_lines
+from summarizer.topics import identify_topics
+from summarizer.transcript import Transcript
 
 
 transcript_json = [
@@ -33,20 +38,147 @@ simple_transcript = [
 ]
 
 
+def test_source_lines():
+    transcript = Transcript.from_texts(range(3), [1.25, 5.5, 10.999], [5.5, 10.999, 12], [c["text"] for c in transcript_json])
+    assert source_lines(transcript, 1, 3) == source_lines(transcript_json, 1, 3) == [
+        "id(1)|start(00:00:05) : This is a test.",
+        "id(2)|start(00:00:10) : Another sentence.",
+    ]
+
+
 @pytest.fixture
 def mock_model():
     return FakeListLLM(
-        responses=[
-            json.dumps({"topics": simple_turns}),
-            json.dumps({"articles": simple_transcript}),
-            json.dumps({"articles": simple_transcript}),
-        ]
+        responses=[json.dumps({"articles": simple_transcript})] * 3
     )
 
 
-def test_make_time_chain(mock_model):
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "chunk_tokens, requests",
+    [
+        (6000, 1),  # Both topics fit in one request
+        (40, 2),  # One request per topic
+    ],
+)
+async def test_make_time_chain(monkeypatch, mock_model, chunk_tokens, requests):
+    monkeypatch.setattr(templates, "segment_transcript", lambda cues, workers: [[0, 0], [1, 2]])
+
     # Create the time chain
-    time_chain = make_time_chain(transcript_json)
+    time_chain = make_time_chain(transcript_json, chunk_tokens=chunk_tokens)
 
     # Assert that the result matches the expected output
-    assert time_chain(mock_model) == simple_transcript + simple_transcript
+    assert await time_chain(mock_model) == simple_transcript * requests
+    assert mock_model.i == requests
+
+
+@pytest.mark.asyncio
+async def test_stream_time_chain(monkeypatch):
+    # Split every window in two
+    monkeypatch.setattr(
+        templates,
+        "segment_transcript",
+        lambda cues, workers: [[0, len(cues) // 2 - 1], [len(cues) // 2, len(cues) - 1]],
+    )
+    summarized = []
+
+    async def summarize_time_chunk(model, chunk, engine=None):
+        summarized.append(chunk)
+        return {"articles": simple_transcript}
+
+    monkeypatch.setattr(templates, "summarize_time_chunk", summarize_time_chunk)
+
+    async def cue_batches():
+        for batch in range(3):
+            yield [
+                {"id": i, "start": "00:00:01", "text": "0123456789"}
+                for i in range(batch * 4, batch * 4 + 4)
+            ]
+
+    transcript, chapters = await templates.stream_time_chain(cue_batches(), None, window_chars=40)
+
+    assert [t["id"] for t in transcript] == list(range(12))
+    # One request per packed group of segments
+    assert chapters == simple_transcript * len(summarized)
+    # Every cue is summarized exactly once
+    ids = [int(i) for chunk in summarized for i in re.findall(r"id\((\d+)\)", chunk)]
+    assert ids == list(range(12))
+
+
+def test_segment_transcript_maps_topics_to_cues(monkeypatch):
+    # The topic model leaves out cues 1, 2 and 7, with no words to model.
+    def identify_topics(cues, workers):
+        kept = [c["id"] for c in cues if c["id"] not in (101, 102, 107)]
+        return {"topics": {}, "transcripts": [{"id": id, "topic": 0 if id < 105 else 1} for id in kept]}
+
+    monkeypatch.setattr(templates, "identify_topics", identify_topics)
+    cues = [{"id": 100 + i, "start": "00:00:01", "text": "..."} for i in range(8)]
+
+    # Documents [0, 1] and [2, 4]: up to cue 103, then the rest, left out cue 107 included.
+    assert templates.segment_transcript(cues) == [[0, 3], [4, 7]]
+
+
+@pytest.mark.asyncio
+async def test_stream_time_chain_with_wordless_cues(monkeypatch):
+    # Cues the topic model can't use: only stopwords, or one letter.
+    monkeypatch.setattr(
+        templates, "identify_topics", lambda cues, workers: identify_topics(cues, workers=1, cache_dir=None)
+    )
+    summarized = []
+
+    async def summarize_time_chunk(model, chunk, engine=None):
+        summarized.append(chunk)
+        return {"articles": simple_transcript}
+
+    monkeypatch.setattr(templates, "summarize_time_chunk", summarize_time_chunk)
+
+    words = ["planets orbit distant stars", "I", "compilers parse source code", "a", "and so it is",
+             "galaxies collide slowly", "optimizers rewrite loops", "X"]
+
+    async def cue_batches():
+        for batch in range(6):
+            yield [
+                {"id": i, "start": f"00:{i // 60:02}:{i % 60:02}", "end": f"00:{(i + 1) // 60:02}:{(i + 1) % 60:02}", "text": words[i % len(words)]}
+                for i in range(batch * 20, batch * 20 + 20)
+            ]
+
+    await templates.stream_time_chain(cue_batches(), None, window_chars=300, chunk_tokens=100)
+
+    # Every cue is summarized exactly once
+    ids = [int(i) for chunk in summarized for i in re.findall(r"id\((\d+)\)", chunk)]
+    assert ids == list(range(120))
+
+
+long_chapters = [
+    {"title": f"Chapter {i}", "summary": "A summary of a chapter that goes on for a while. " * 3}
+    for i in range(16)
+]
+
+
+def test_group_sections():
+    sections = [f"{c['title']} : {c['summary']}" for c in long_chapters]
+    assert [len(g) for g in group_sections(sections, 200)] == [4, 4, 4, 4]
+    # Sections over the budget still go two to a group, so the tree gets shorter.
+    assert [len(g) for g in group_sections(sections[:5], 10)] == [2, 2, 1]
+    assert group_sections(sections[:1], 10) == [sections[:1]]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "chunk_tokens, requests",
+    [
+        (6000, 1),  # All chapters fit in one request
+        (200, 5),  # Four groups of four chapters, then their titles
+        (10, 15),  # Pairs of chapters, then pairs of titles, down to one
+    ],
+)
+async def test_make_title_chain(chunk_tokens, requests):
+    model = FakeListLLM(responses=[
+        json.dumps({"title": f"Title {i}", "description": "What it was about."}) for i in range(requests + 1)
+    ])
+    engine = LLMEngine(rpm=0, tpm=0)
+
+    title = await make_title_chain(long_chapters, engine, chunk_tokens)(model)
+
+    assert title == {"title": f"Title {requests - 1}", "description": "What it was about."}
+    assert len(engine.metrics) == requests
@@ -1,5 +1,20 @@
+import random
+from collections import Counter
+
+import numpy as np
 import pytest
-from summarizer.topics import split_by_dominant_topics
+import tomotopy as tp
+from summarizer.transcript import Transcript
+from summarizer.topics import (
+    assign_time_slices,
+    assign_time_slices_array,
+    identify_topics,
+    save_cached_topics,
+    split_by_dominant_topics,
+    split_by_dominant_topics_array,
+    topics_cache_key,
+    train_until_converged,
+)
 
 
 @pytest.mark.parametrize(
@@ -16,3 +31,97 @@ from summarizer.topics import split_by_dominant_topics
 def test_split_by_dominant_topics(topics, threshold, expected):
     result = split_by_dominant_topics(topics, threshold)
     assert result == expected
+
+
+def make_model(docs: int):
+    model = tp.LDAModel(k=2, seed=1)
+    words = ["apple", "banana", "cherry", "engine", "wheel", "brake"]
+    for i in range(docs):
+        model.add_doc(words[:3] * 3 if i % 2 else words[3:] * 3)
+    return model
+
+
+def test_train_until_converged():
+    # Two obvious topics converge long before the maximum
+    assert train_until_converged(make_model(100), max_iterations=1000, workers=1) < 1000
+    # Without a tolerance training runs to the maximum
+    assert train_until_converged(make_model(100), max_iterations=50, tolerance=0, workers=1) == 50
+
+
+def test_identify_topics_cache(tmp_path):
+    data = [{"id": 0, "start": "00:00:00", "end": "00:00:05", "text": "Hello world."}]
+    topics = {"topics": {0: {"words": "hello world"}}, "transcripts": [{"id": 0, "doc_id": 0, "topic": 0}]}
+    transcript = Transcript.from_entries(data)
+    save_cached_topics(str(tmp_path / f"{topics_cache_key(transcript, 5)}.json"), topics)
+
+    # Read from the cache, no training (or stopwords) needed
+    assert identify_topics(data, cache_dir=str(tmp_path)) == topics
+    assert identify_topics(transcript, cache_dir=str(tmp_path)) == topics
+    assert topics_cache_key(transcript, 5) != topics_cache_key(transcript, 4)
+
+
+def reference_split_by_dominant_topics(topics, threshold):
+    """The original loop implementation of split_by_dominant_topics."""
+    counts = Counter(topics)
+    total = len(topics)
+    dominant_topics = {topic for topic, count in counts.items() if count / total >= threshold}
+
+    if len(dominant_topics) <= 1:
+        if len(topics) > 0:
+            return [[0, len(topics) - 1]]
+        return []
+
+    result = []
+    finished_topics = set()
+    counts_so_far = Counter({c: 0 for c in dominant_topics})
+    dominant_threshold = 1 / len(dominant_topics)
+
+    for i, topic in enumerate(topics):
+        counts_so_far[topic] += 1
+        for dt in dominant_topics - finished_topics:
+            if counts_so_far[dt] / counts[dt] > dominant_threshold:
+                finished_topics = finished_topics | {dt}
+                dt_range = [0, i]
+                if len(result) > 0:
+                    dt_range[0] = result[-1][1] + 1
+                result.append(dt_range)
+
+    if len(result) > 0 and result[-1][1] != len(topics) - 1:
+        result[-1][1] = len(topics) - 1
+
+    return result
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_split_by_dominant_topics_matches_loop(seed):
+    rng = random.Random(seed)
+    topics = [rng.randrange(-1, rng.randint(1, 8)) for _ in range(rng.randint(1, 300))]
+    # Drifting topics, like a real transcript
+    if seed % 2:
+        topics.sort()
+    threshold = rng.choice([0.1, 0.2, 0.25, 0.33, 0.5])
+
+    assert split_by_dominant_topics(topics, threshold) == reference_split_by_dominant_topics(topics, threshold)
+
+
+def test_assign_time_slices():
+    data = [
+        {"start": "00:00:00", "end": "00:00:10"},
+        {"start": "00:00:10", "end": "00:00:20"},
+        {"start": "00:00:29", "end": "00:00:30"},
+        {"start": "00:00:30", "end": "00:00:40"},
+    ]
+    assert assign_time_slices(data, 4) == [0, 1, 2, 3]
+    assert assign_time_slices_array(np.array([0.0, 10.0, 29.0, 30.0]), 40.0, 4).tolist() == [0, 1, 2, 3]
+
+
+def test_large_transcripts():
+    rng = np.random.default_rng(1)
+    topics = np.repeat(np.arange(5), 20000)
+    rng.shuffle(topics[:50000])
+
+    ranges = split_by_dominant_topics_array(topics, 0.2)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(topics) - 1
+
+    slices = assign_time_slices_array(np.arange(len(topics)) * 3.0, len(topics) * 3.0, 5)
+    assert np.bincount(slices).tolist() == [20000] * 5
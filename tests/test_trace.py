@@ -0,0 +1,103 @@
+import asyncio
+import json
+import time
+
+import pytest
+from summarizer import trace
+from summarizer.scheduler import StageScheduler
+from summarizer.trace import SamplingProfiler, span, start_tracing, stop_tracing, traced
+
+
+@pytest.fixture
+def tracer():
+    tracer = start_tracing()
+    yield tracer
+    stop_tracing()
+
+
+def test_span_without_tracing():
+    with span("encode", "ffmpeg") as record:
+        record["args"]["frames"] = 3
+    assert trace._tracer is None
+
+
+def test_spans(tracer):
+    @traced("ffmpeg")
+    def encode():
+        time.sleep(0.01)
+
+    @traced("openai", "transcription")
+    async def transcribe():
+        with span("request", "llm") as record:
+            record["args"].update(prompt_tokens=100, completion_tokens=20)
+
+    encode()
+    encode()
+    asyncio.run(transcribe())
+
+    assert [(r["category"], r["name"]) for r in tracer.spans] == [
+        ("ffmpeg", "encode"),
+        ("ffmpeg", "encode"),
+        ("llm", "request"),
+        ("openai", "transcription"),
+    ]
+    assert tracer.spans[0]["duration"] >= 0.01
+
+    summary = tracer.summary().splitlines()
+    assert summary[1].split()[:2] == ["ffmpeg:encode", "2"]
+    assert [line.split()[-1] for line in summary if line.startswith("llm:request")] == ["120"]
+
+
+def test_chrome_trace(tracer, tmp_path):
+    async def stage():
+        with span("transcription", "openai"):
+            await asyncio.sleep(0)
+
+    async def run():
+        stages = StageScheduler()
+        stages.add("transcript", lambda: stage())
+        await stages.run()
+
+    asyncio.run(run())
+    tracer.save_chrome_trace(str(tmp_path / "trace.json"))
+
+    with open(tmp_path / "trace.json") as f:
+        events = json.load(f)["traceEvents"]
+    spans = {e["name"]: e for e in events if e["ph"] == "X"}
+    assert spans["transcript"]["cat"] == "stage"
+    assert spans["transcription"]["args"] == {"stage": "transcript"}
+    assert spans["transcription"]["ts"] >= spans["transcript"]["ts"]
+    lanes = {e["tid"]: e["args"]["name"] for e in events if e["ph"] == "M"}
+    assert lanes[spans["transcript"]["tid"]] == "transcript"
+
+
+def busy(secs: float):
+    end = time.perf_counter() + secs
+    while time.perf_counter() < end:
+        pass
+
+
+def test_profiler_attributes_samples_to_stages(tracer, tmp_path):
+    profiler = SamplingProfiler(tracer, interval=0.001)
+
+    async def busy_on_loop():
+        busy(0.1)
+
+    async def run():
+        stages = StageScheduler()
+        # One stage busy in a worker thread, one on the event loop.
+        stages.add("audio", lambda: busy(0.1))
+        stages.add("summary", lambda _: busy_on_loop(), "audio")
+        await stages.run()
+
+    profiler.start()
+    try:
+        asyncio.run(run())
+    finally:
+        profiler.stop()
+
+    assert set(profiler.samples) == {"audio", "summary"}
+    paths = profiler.save(str(tmp_path))
+    assert sorted(p.rsplit("/", 1)[-1] for p in paths) == ["audio.folded", "summary.folded"]
+    with open(tmp_path / "audio.folded") as f:
+        assert any("busy (test_trace.py" in line for line in f)
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+from webvtt import WebVTT
+from summarizer.llm import captions_to_entries
+from summarizer.transcript import Cue, Transcript, as_transcript, hms_strings, write_json_entries
+from summarizer.vtt import read_captions, seconds_to_hms
+
+
+@pytest.fixture
+def captions():
+    return WebVTT.read("tests/fixtures/sample.vtt").captions
+
+
+def test_matches_entries(captions):
+    transcript = Transcript.from_captions(captions)
+
+    assert transcript.to_entries() == captions_to_entries(captions)
+    # Milliseconds are kept
+    assert transcript.starts[0] == 1.5
+    assert transcript.text(1) == "This is a quick overview on how\nwe're going to do Color Wheel Part One."
+
+
+def test_cue_views(captions):
+    transcript = Transcript.from_captions(captions, first_id=10)
+    cue = transcript[-1]
+
+    assert isinstance(cue, Cue)
+    assert cue["id"] == 14
+    assert dict(cue) == captions_to_entries(captions, 10)[-1]
+    assert cue.get("topic") is None
+    with pytest.raises(IndexError):
+        transcript[5]
+
+
+def test_slices_share_columns(captions):
+    transcript = Transcript.from_captions(captions)
+    part = transcript[1:3]
+
+    assert len(part) == 2
+    assert part.to_entries() == captions_to_entries(captions)[1:3]
+    assert part.starts.base is transcript.starts
+    assert len(transcript[4:2]) == 0
+    with pytest.raises(ValueError):
+        transcript[::2]
+
+
+def test_json_round_trip(tmp_path, captions):
+    transcript = Transcript.from_captions(captions)
+    transcript.save_json(str(tmp_path / "transcript.json"))
+
+    with open(tmp_path / "transcript.json") as f:
+        assert json.load(f) == captions_to_entries(captions)
+    loaded = Transcript.load_json(str(tmp_path / "transcript.json"))
+    assert loaded.to_entries() == transcript.to_entries()
+    assert as_transcript(loaded) is loaded
+    assert as_transcript(transcript.to_entries()).to_entries() == transcript.to_entries()
+
+
+def test_from_read_captions(captions):
+    assert Transcript.from_captions(read_captions("tests/fixtures/sample.vtt")).to_entries() == captions_to_entries(captions)
+
+
+@pytest.mark.parametrize("entries", [[], [{"id": 0, "text": "a\n\"é\" b", "start": 1.5, "done": None}], [{"id": 0}, {"id": 1, "topic": [1, 2]}]])
+def test_write_json_entries(tmp_path, entries):
+    path = str(tmp_path / "transcript.json")
+    write_json_entries(iter(entries), path)
+
+    with open(path) as f:
+        assert f.read() == json.dumps(entries, indent=2)
+    assert not (tmp_path / "transcript.json.partial").exists()
+
+
+def test_hms_strings():
+    seconds = [0, 59.999, 3600, 86399.5, 90061.2]
+    assert hms_strings(seconds) == [seconds_to_hms(s) for s in seconds]
@@ -1,6 +1,18 @@
+import io
+import json
+import tracemalloc
+
 import pytest
-from summarizer.vtt import time_string_to_seconds, extract_transcript_start_times
-from unittest.mock import mock_open, patch
+from webvtt import WebVTT
+from summarizer.vtt import (
+    Caption,
+    time_string_to_seconds,
+    extract_transcript_start_times,
+    read_captions,
+    seconds_to_vtt_time,
+    stitch_vtt,
+    write_vtt,
+)
 
 
 @pytest.mark.parametrize("time_string, expected_seconds", [
@@ -13,16 +25,98 @@ def test_time_string_to_seconds(time_string, expected_seconds):
     assert time_string_to_seconds(time_string) == expected_seconds
 
 
-def test_extract_transcript_start_times():
-    mock_vtt_content = """WEBVTT
+@pytest.mark.parametrize("indent", [2, None])
+def test_extract_transcript_start_times(tmp_path, indent):
+    entries = [
+        {"id": 0, "start": "00:00:00", "end": "00:00:05", "text": 'Lorem "start": "00:09:99",'},
+        {"id": 1, "start": "00:00:05", "end": "00:00:10", "text": "consectetur adipiscing elit,"},
+    ]
+    (tmp_path / "transcript.json").write_text(json.dumps(entries, indent=indent))
+
+    assert extract_transcript_start_times(str(tmp_path)) == ["00:00:00", "00:00:05"]
+
+
+def test_read_captions_matches_webvtt():
+    captions = WebVTT.read("tests/fixtures/sample.vtt").captions
+
+    assert list(read_captions("tests/fixtures/sample.vtt")) == [
+        Caption(c.start_in_seconds, c.end_in_seconds, c.text) for c in captions
+    ]
+
+
+def test_read_captions_skips_blocks_and_settings():
+    vtt = """\ufeffWEBVTT - A title
+
+NOTE a comment
+spanning lines
+
+STYLE
+::cue { color: red }
+
+intro
+00:00:01.000 --> 00:00:02.500 align:start position:10%
+First line
+second line
+
+01:00:00.250 --> 01:00:01.000
+Last."""
+
+    assert list(read_captions(io.StringIO(vtt.lstrip("\ufeff")))) == [
+        Caption(1, 2.5, "First line\nsecond line"),
+        Caption(3600.25, 3601, "Last."),
+    ]
+
+
+def test_read_captions_srt(tmp_path):
+    srt = tmp_path / "transcript.srt"
+    srt.write_text("1\r\n00:00:01,500 --> 00:00:02,200\r\nHi everybody.\r\n\r\n2\r\n00:00:02,200 --> 00:00:07,166\r\nBye.\r\n")
+
+    assert list(read_captions(str(srt))) == [
+        Caption(1.5, 2.2, "Hi everybody."),
+        Caption(2.2, 7.166, "Bye."),
+    ]
+    write_vtt(read_captions(str(srt)), str(tmp_path / "transcript.vtt"))
+    assert [c.text for c in WebVTT.read(str(tmp_path / "transcript.vtt")).captions] == ["Hi everybody.", "Bye."]
+
+
+def test_read_captions_constant_memory():
+    def lines(cues):
+        yield "WEBVTT\n"
+        for i in range(cues):
+            yield "\n"
+            yield f"{seconds_to_vtt_time(i)} --> {seconds_to_vtt_time(i + 1)}\n"
+            yield f"Caption number {i} with a few more words in it.\n"
+
+    def peak(cues):
+        tracemalloc.start()
+        count = sum(1 for _ in read_captions(lines(cues)))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert count == cues
+        return peak
+
+    assert peak(20000) < peak(200) * 2
+
+
+def test_stitch_vtt():
+    piece = """WEBVTT
 
-00:00:00.000 --> 00:00:05.000
-Lorem ipsum dolor sit amet,
+00:00:01.500 --> 00:00:02.000
+First.
 
-00:00:05.000 --> 00:00:10.000
-consectetur adipiscing elit,
+00:00:04.000 --> 00:00:06.250
+Second.
 """
-    with patch("builtins.open", mock_open(read_data=mock_vtt_content)):
-        with patch("os.path.join", return_value="transcript.json"):
-            start_times = extract_transcript_start_times(".")
-            assert start_times == ["00:00:00", "00:00:05"]
+    stitched = stitch_vtt([(piece, 0, 0, 3), (piece, 2.5, 3, float("inf"))])
+    assert stitched.splitlines() == [
+        "WEBVTT",
+        "",
+        "00:00:01.500 --> 00:00:02.000",
+        "First.",
+        "",
+        "00:00:04.000 --> 00:00:04.500",
+        "First.",
+        "",
+        "00:00:06.500 --> 00:00:08.750",
+        "Second.",
+    ]